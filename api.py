@@ -0,0 +1,346 @@
+import asyncio
+import json
+import math
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime as dt, time
+from io import BytesIO
+from urllib.parse import parse_qs, quote
+
+from metricas import METRICAS, Medicao
+from motor import contexto_processos, load_taxas, simulate
+from planilha import XLSX_MIME, monta_planilha
+
+# API HTTP/JSON de precificação, sem o Streamlit. É um app ASGI puro (servir
+# com `uvicorn api:app`); recebe os mesmos campos do formulário, usa as taxas
+# do taxas.txt e devolve o fluxo em JSON ou o .xlsx. As simulações rodam num
+# pool de processos; acima de `max_fila` requisições em andamento a API
+# responde 503 com Retry-After em vez de enfileirar sem limite.
+#
+#   GET  /saude            -> {"status": "ok", "em_andamento": n, "max_fila": m}
+#   GET  /empreendimentos  -> ["Residencial ...", ...]
+#   POST /simulacao        -> resumo + eventos em JSON
+#   POST /simulacao?formato=xlsx -> planilha
+#   GET  /metricas         -> métricas por etapa no formato texto do Prometheus
+
+TAXAS_PATH = os.environ.get('TAXAS_PATH', 'taxas.txt')
+MAX_CORPO = 1024 * 1024
+CAMPOS_NUMERICOS = ['valor_imovel', 'capacidade_pre', 'fgts', 'fin_banco',
+                    'capacidade_pos_antes', 'val_parcela_banco']
+CAMPOS_DATA = ['data_base', 'data_inicio_pre', 'data_entrega']
+OBRIGATORIOS = ['empreendimento', 'valor_imovel', 'dia_pagamento'] + CAMPOS_DATA
+_INVALIDOS_ARQUIVO = re.compile(r'[<>:"/\\|?*\x00-\x1f\x7f]')
+
+
+class ErroRequisicao(Exception):
+    def __init__(self, status, mensagem):
+        super().__init__(mensagem)
+        self.status = status
+
+
+# --- Entrada: JSON -> cenário do motor ---
+def _numero(dados, campo, padrao=0.0):
+    valor = dados.get(campo, padrao)
+    # o json aceita NaN e Infinity; aqui só números finitos
+    if isinstance(valor, bool) or not isinstance(valor, (int, float)) or not math.isfinite(valor):
+        raise ValueError(f"'{campo}' deve ser numérico")
+    if valor < 0:
+        raise ValueError(f"'{campo}' não pode ser negativo")
+    return float(valor)
+
+
+def _data(dados, campo):
+    valor = dados.get(campo)
+    try:
+        return dt.combine(date.fromisoformat(valor), time())
+    except (TypeError, ValueError):
+        raise ValueError(f"'{campo}' deve ser uma data AAAA-MM-DD") from None
+
+
+def _pagamentos(dados, campo, chave_data, chave_valor, tipo=None):
+    itens = dados.get(campo, [])
+    if not isinstance(itens, list):
+        raise ValueError(f"'{campo}' deve ser uma lista")
+    saida = []
+    for i, item in enumerate(itens, 1):
+        if not isinstance(item, dict):
+            raise ValueError(f"'{campo}', item {i}: deve ser um objeto")
+        try:
+            saida.append({chave_data: _data(item, chave_data), chave_valor: _numero(item, chave_valor),
+                          'assoc': bool(item.get('assoc', False)),
+                          'tipo': str(item.get('tipo', '')) if tipo is None else tipo})
+        except ValueError as e:
+            raise ValueError(f"'{campo}', item {i}: {e}") from None
+    return saida
+
+
+def cenario_de_json(dados, taxas_por_emp) -> dict:
+    # mesmos campos do formulário; datas em ISO e valores em número
+    if not isinstance(dados, dict):
+        raise ValueError("o corpo deve ser um objeto JSON")
+    faltando = [c for c in OBRIGATORIOS if c not in dados]
+    if faltando:
+        raise ValueError(f"Campos obrigatórios ausentes: {', '.join(faltando)}")
+    empreendimento = dados['empreendimento']
+    if empreendimento not in taxas_por_emp:
+        raise ValueError(f"empreendimento desconhecido '{empreendimento}'")
+    dia = dados['dia_pagamento']
+    if isinstance(dia, bool) or not isinstance(dia, int) or not 1 <= dia <= 31:
+        raise ValueError("'dia_pagamento' deve ser um inteiro de 1 a 31")
+    cenario = {'cliente': str(dados.get('cliente', '')), 'dia_pagamento': dia,
+               'taxas_sel': taxas_por_emp[empreendimento]}
+    for campo in CAMPOS_NUMERICOS:
+        cenario[campo] = _numero(dados, campo)
+    for campo in CAMPOS_DATA:
+        cenario[campo] = _data(dados, campo)
+    cenario['non_rec'] = _pagamentos(dados, 'non_rec', 'data', 'valor')
+    cenario['semi_series'] = _pagamentos(dados, 'semi_series', 'd0', 'v', 'Pagamento Semestral')
+    cenario['annual_series'] = _pagamentos(dados, 'annual_series', 'd0', 'v', 'Pagamento Anual')
+    return cenario
+
+
+def disposicao_anexo(cliente) -> bytes:
+    # Content-Disposition do .xlsx: sem caracteres proibidos em nome de
+    # arquivo nem de controle (CR/LF quebrariam o header); filename em ASCII
+    # e filename* (RFC 5987) com o nome completo em UTF-8
+    nome = _INVALIDOS_ARQUIVO.sub('_', f"Financiamento {cliente}.xlsx")
+    ascii_ = re.sub(r'[^\x20-\x7e]', '_', nome)
+    return f"attachment; filename=\"{ascii_}\"; filename*=UTF-8''{quote(nome, safe='')}".encode('ascii')
+
+
+# --- Trabalho nos processos do pool ---
+def eventos_json(eventos) -> list:
+    return [{**linha, 'data': linha['data'].date().isoformat()} for linha in eventos]
+
+
+def precifica(cenario, formato='json'):
+    # devolve (resposta, resumo da medição); o resumo é registrado no
+    # processo principal, que é quem serve /metricas
+    with Medicao('api_simulacao', registro=False, formato=formato) as medicao:
+        resultado = simulate(cenario, medicao=medicao)
+        if formato == 'xlsx':
+            with medicao.etapa('planilha'):
+                wb = monta_planilha(resultado['eventos'], cenario['cliente'], cenario['valor_imovel'])
+            with medicao.etapa('salva'):
+                buf = BytesIO()
+                wb.save(buf)
+                resposta = buf.getvalue()
+            medicao.conta('bytes_escritos', len(resposta))
+        else:
+            with medicao.etapa('json'):
+                resposta = {
+                    'cliente': cenario['cliente'],
+                    'viavel': resultado['viavel'],
+                    'motivo': resultado['motivo'],
+                    'saldo': resultado['saldo'],
+                    'saldo_entrega': resultado['saldo_entrega'],
+                    'parcelas_pos_entrega': resultado['parcelas'] - 1,
+                    'total_pago': resultado['eventos'].soma_valores(),
+                    'eventos': eventos_json(resultado['eventos']),
+                }
+    return resposta, medicao.resumo()
+
+
+# --- App ASGI ---
+class APIPrecificacao:
+    def __init__(self, taxas_path=TAXAS_PATH, max_workers=None, max_fila=32, executor=None):
+        # executor: opcional (ex.: ThreadPoolExecutor nos testes); por padrão
+        # um ProcessPoolExecutor criado no startup e fechado no shutdown
+        self.taxas_path = taxas_path
+        self.max_workers = max_workers
+        self.max_fila = max_fila
+        self.em_andamento = 0
+        self.executor = executor
+        self._executor_proprio = False
+
+    def inicia(self):
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=contexto_processos())
+            self._executor_proprio = True
+
+    def fecha(self):
+        if self._executor_proprio:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor, self._executor_proprio = None, False
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            mensagem = await receive()
+            if mensagem['type'] == 'lifespan.startup':
+                self.inicia()
+                await send({'type': 'lifespan.startup.complete'})
+            elif mensagem['type'] == 'lifespan.shutdown':
+                self.fecha()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _http(self, scope, receive, send):
+        try:
+            status, tipo, corpo, extras = await self._rota(scope, receive)
+        except ErroRequisicao as e:
+            status, tipo, corpo, extras = e.status, 'json', {'erro': str(e)}, []
+            if status == 503:
+                extras = [(b'retry-after', b'1')]
+        if tipo == 'json':
+            try:
+                texto = json.dumps(corpo, ensure_ascii=False, allow_nan=False)
+            except ValueError:
+                # valores tão grandes que o saldo estoura: NaN/Infinity não é JSON válido
+                status, extras = 422, []
+                texto = json.dumps({'erro': "o cenário gera valores fora do intervalo numérico"}, ensure_ascii=False)
+            tipo, corpo = 'application/json', texto.encode('utf-8')
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(b'content-type', tipo.encode()), (b'content-length', str(len(corpo)).encode())] + extras})
+        await send({'type': 'http.response.body', 'body': corpo})
+
+    async def _rota(self, scope, receive):
+        metodo, caminho = scope['method'], scope['path'].rstrip('/') or '/'
+        rotas = {'/saude': 'GET', '/empreendimentos': 'GET', '/simulacao': 'POST', '/metricas': 'GET'}
+        if caminho not in rotas:
+            raise ErroRequisicao(404, f"rota não encontrada: {caminho}")
+        if metodo != rotas[caminho]:
+            raise ErroRequisicao(405, f"método {metodo} não permitido em {caminho}")
+        if caminho == '/saude':
+            return 200, 'json', {'status': 'ok', 'em_andamento': self.em_andamento, 'max_fila': self.max_fila}, []
+        if caminho == '/metricas':
+            return 200, 'text/plain; version=0.0.4; charset=utf-8', METRICAS.texto_prometheus().encode('utf-8'), []
+        taxas_por_emp = self._taxas()
+        if caminho == '/empreendimentos':
+            return 200, 'json', list(taxas_por_emp), []
+
+        formato = parse_qs(scope.get('query_string', b'').decode()).get('formato', ['json'])[0]
+        if formato not in ('json', 'xlsx'):
+            raise ErroRequisicao(400, f"formato inválido: {formato}")
+        try:
+            cenario = cenario_de_json(json.loads(await self._corpo(receive) or b'null'), taxas_por_emp)
+        except json.JSONDecodeError as e:
+            raise ErroRequisicao(400, f"JSON inválido: {e}") from None
+        except ValueError as e:
+            raise ErroRequisicao(400, str(e)) from None
+        resposta = await self._executa(cenario, formato)
+        if formato == 'xlsx':
+            return 200, XLSX_MIME, resposta, [(b'content-disposition', disposicao_anexo(cenario['cliente']))]
+        return 200, 'json', resposta, []
+
+    def _taxas(self):
+        try:
+            return load_taxas(self.taxas_path)
+        except (FileNotFoundError, ValueError) as e:
+            raise ErroRequisicao(500, str(e)) from None
+
+    async def _corpo(self, receive):
+        partes, tamanho = [], 0
+        while True:
+            mensagem = await receive()
+            if mensagem['type'] == 'http.disconnect':
+                raise ErroRequisicao(400, "conexão encerrada pelo cliente")
+            parte = mensagem.get('body', b'')
+            tamanho += len(parte)
+            if tamanho > MAX_CORPO:
+                raise ErroRequisicao(413, f"corpo maior que {MAX_CORPO} bytes")
+            partes.append(parte)
+            if not mensagem.get('more_body', False):
+                return b''.join(partes)
+
+    async def _executa(self, cenario, formato):
+        # fila limitada: o que passa de max_fila é recusado (backpressure);
+        # o resto espera a vez no pool
+        if self.em_andamento >= self.max_fila:
+            raise ErroRequisicao(503, "fila de simulações cheia, tente novamente")
+        self.inicia()
+        self.em_andamento += 1
+        try:
+            loop = asyncio.get_running_loop()
+            resposta, resumo = await loop.run_in_executor(self.executor, precifica, cenario, formato)
+        finally:
+            self.em_andamento -= 1
+        METRICAS.registra(resumo)
+        return resposta
+
+
+# --- Cliente em processo (testes e scripts locais, sem rede) ---
+class Resposta:
+    def __init__(self, status, headers, corpo):
+        self.status = status
+        self.headers = headers
+        self.corpo = corpo
+
+    def json(self):
+        return json.loads(self.corpo)
+
+
+class ClienteLocal:
+    # Fala ASGI direto com o app num loop próprio, incluindo startup e
+    # shutdown do lifespan:
+    #     with ClienteLocal(APIPrecificacao()) as cliente:
+    #         cliente.post('/simulacao', {...}).json()
+    def __init__(self, app):
+        self.app = app
+        self._loop = None
+        self._lifespan = None
+        self._fila_lifespan = None
+        self._respostas_lifespan = None
+
+    def __enter__(self):
+        self._loop = asyncio.new_event_loop()
+        self._fila_lifespan = asyncio.Queue()
+        self._respostas_lifespan = asyncio.Queue()
+        self._lifespan = self._loop.create_task(
+            self.app({'type': 'lifespan'}, self._fila_lifespan.get, self._respostas_lifespan.put))
+        self._loop.run_until_complete(self._envia_lifespan('startup'))
+        return self
+
+    def __exit__(self, *exc):
+        self._loop.run_until_complete(self._envia_lifespan('shutdown'))
+        self._loop.run_until_complete(self._lifespan)
+        self._loop.close()
+
+    async def _envia_lifespan(self, evento):
+        await self._fila_lifespan.put({'type': f'lifespan.{evento}'})
+        await self._respostas_lifespan.get()
+
+    async def requisicao_async(self, metodo, caminho, corpo=b''):
+        caminho, _, query = caminho.partition('?')
+        scope = {'type': 'http', 'method': metodo, 'path': caminho, 'query_string': query.encode(),
+                 'headers': [(b'content-type', b'application/json')]}
+        entrada = [{'type': 'http.request', 'body': corpo, 'more_body': False}]
+        inicio, partes = {}, []
+
+        async def receive():
+            return entrada.pop(0) if entrada else {'type': 'http.disconnect'}
+
+        async def send(mensagem):
+            if mensagem['type'] == 'http.response.start':
+                inicio.update(mensagem)
+            else:
+                partes.append(mensagem.get('body', b''))
+
+        await self.app(scope, receive, send)
+        headers = {k.decode(): v.decode() for k, v in inicio['headers']}
+        return Resposta(inicio['status'], headers, b''.join(partes))
+
+    def requisicao(self, metodo, caminho, corpo=b''):
+        return self._loop.run_until_complete(self.requisicao_async(metodo, caminho, corpo))
+
+    def get(self, caminho):
+        return self.requisicao('GET', caminho)
+
+    def post(self, caminho, dados):
+        return self.requisicao('POST', caminho, json.dumps(dados).encode('utf-8'))
+
+    def post_varios(self, caminho, lista):
+        # dispara várias requisições ao mesmo tempo (ex.: para ver o 503)
+        async def todas():
+            return await asyncio.gather(*(
+                self.requisicao_async('POST', caminho, json.dumps(d).encode('utf-8')) for d in lista))
+        return self._loop.run_until_complete(todas())
+
+
+app = APIPrecificacao()
@@ -0,0 +1,253 @@
+import argparse
+import json
+import random
+import sys
+import time
+import tracemalloc
+from dataclasses import replace
+from datetime import datetime as dt
+from io import BytesIO
+from pathlib import Path
+
+from dateutil.relativedelta import relativedelta
+
+import motor
+from metricas import Medicao
+from motor import load_taxas, simulate
+from planilha import monta_planilha
+from solver import capacidade_minima
+
+# Benchmark reprodutível do motor e da exportação. Gera cenários sintéticos
+# (semente fixa) para cada empreendimento do taxas.txt, variando o prazo
+# pós-entrega, os pagamentos avulsos, as séries semestrais/anuais e as taxas
+# extras *_PCT, e mede cada etapa em separado (menor tempo de N repetições):
+#   load_taxas  leitura e validação do taxas.txt, sem cache
+#   pre         séries + pré-entrega + entrega (etapas da Medicao do motor)
+#   pos         pós-entrega
+#   monta       escrita das linhas na planilha
+#   salva       gravação do .xlsx em memória
+# e o pico de memória (tracemalloc) de cada uma.
+#
+#   python benchmark.py                  # compara com benchmark_base.json
+#   python benchmark.py --salva-base     # grava a base nesta máquina
+#   python benchmark.py --limite 0.2     # regressão tolerada (20%)
+#
+# Sai com código 1 se alguma métrica piorar além do limite em relação à base.
+
+BASE_PADRAO = 'benchmark_base.json'
+HORIZONTES = [60, 180, 420]
+CARGAS = {
+    # avulsos, séries semestrais, séries anuais, taxas extras
+    'leve': (0, 0, 0, 0),
+    'media': (6, 1, 1, 2),
+    'pesada': (30, 3, 3, 6),
+}
+MESES_PRE = 36
+# diferenças menores que isso são ruído, mesmo que passem do limite relativo
+PISO_MS = 0.5
+PISO_KB = 64
+
+
+def gera_cenario(taxas, horizonte, carga, semente):
+    n_avulsos, n_semi, n_anual, n_extras = CARGAS[carga]
+    r = random.Random(semente)
+    base = dt(2025, r.randint(1, 12), r.randint(1, 28))
+    inicio = base + relativedelta(months=1)
+    entrega = inicio + relativedelta(months=MESES_PRE)
+    fim = entrega + relativedelta(months=horizonte)
+    dias = (fim - base).days
+    extras = tuple((f'TAXA_EXTRA_{i}{"_INCC" if i % 2 else ""}_PCT', 0.0005) for i in range(n_extras))
+    cenario = {
+        'cliente': f'{taxas.nome} {horizonte}m {carga}',
+        'valor_imovel': r.choice([200000.0, 350000.0, 500000.0]),
+        'dia_pagamento': r.choice([5, 10, 15, 28, 30, 31]),
+        'taxas_sel': replace(taxas, extras=taxas.extras + extras),
+        'data_base': base,
+        'capacidade_pre': float(r.randint(10, 30) * 100),
+        'data_inicio_pre': inicio,
+        'data_entrega': entrega,
+        'fgts': float(r.randint(0, 3) * 10000),
+        'fin_banco': float(r.randint(0, 4) * 20000),
+        'capacidade_pos_antes': 0.0,
+        'val_parcela_banco': float(r.randint(0, 5) * 100),
+        'non_rec': [{'data': base + relativedelta(days=r.randint(1, dias)), 'tipo': f'Avulso {i + 1}',
+                     'valor': float(r.randint(1, 10) * 500), 'assoc': r.random() < 0.5}
+                    for i in range(n_avulsos)],
+        'semi_series': [{'d0': base + relativedelta(months=r.randint(1, 12)), 'v': float(r.randint(1, 5) * 1000),
+                         'assoc': r.random() < 0.5, 'tipo': 'Pagamento Semestral'} for _ in range(n_semi)],
+        'annual_series': [{'d0': base + relativedelta(months=r.randint(1, 12)), 'v': float(r.randint(1, 5) * 2000),
+                           'assoc': r.random() < 0.5, 'tipo': 'Pagamento Anual'} for _ in range(n_anual)],
+    }
+    # capacidade que quita exatamente no horizonte pedido
+    cenario['capacidade_pos_antes'] = capacidade_minima(cenario, horizonte)
+    return cenario
+
+
+def gera_casos(taxas_por_emp, filtro=None):
+    casos = {}
+    for horizonte in HORIZONTES:
+        for carga in CARGAS:
+            nome = f'{horizonte}m-{carga}'
+            if filtro and nome not in filtro:
+                continue
+            casos[nome] = [
+                gera_cenario(taxas, horizonte, carga, semente=n * 1000 + horizonte)
+                for n, taxas in enumerate(taxas_por_emp.values())]
+    return casos
+
+
+def cronometra(funcao, repeticoes):
+    # menor tempo (ms) de `repeticoes` chamadas e o último retorno
+    melhor, retorno = float('inf'), None
+    for _ in range(repeticoes):
+        t0 = time.perf_counter()
+        retorno = funcao()
+        melhor = min(melhor, time.perf_counter() - t0)
+    return melhor * 1000, retorno
+
+
+def _etapas_motor(cenario, repeticoes):
+    # menor tempo (ms) de cada etapa do motor em `repeticoes` simulações
+    pre = pos = float('inf')
+    for _ in range(repeticoes):
+        with Medicao('benchmark', registro=False) as medicao:
+            resultado = simulate(cenario, medicao=medicao)
+        tempos = medicao.tempos
+        pre = min(pre, tempos['series'] + tempos['pre'] + tempos['entrega'])
+        pos = min(pos, tempos['pos'])
+    return pre * 1000, pos * 1000, resultado
+
+
+def pico_kb(funcao):
+    tracemalloc.start()
+    try:
+        funcao()
+        return tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def _monta_e_salva(args, repeticoes):
+    # tempo (ms) de montar e de salvar, medidos em separado na mesma
+    # repetição: um workbook write-only só pode (e precisa) ser salvo uma vez
+    monta = salva = float('inf')
+    for _ in range(repeticoes):
+        t0 = time.perf_counter()
+        wb = monta_planilha(*args)
+        t1 = time.perf_counter()
+        wb.save(BytesIO())
+        t2 = time.perf_counter()
+        monta, salva = min(monta, t1 - t0), min(salva, t2 - t1)
+    return monta * 1000, salva * 1000
+
+
+def _picos_planilha(args):
+    tracemalloc.start()
+    try:
+        wb = monta_planilha(*args)
+        pico_monta = tracemalloc.get_traced_memory()[1]
+        tracemalloc.reset_peak()
+        wb.save(BytesIO())
+        return pico_monta / 1024, tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def mede_caso(cenarios, repeticoes):
+    tempos = dict.fromkeys(['pre', 'pos', 'monta', 'salva'], 0.0)
+    memoria = dict.fromkeys(tempos, 0.0)
+    for cenario in cenarios:
+        t_pre, t_pos, resultado = _etapas_motor(cenario, repeticoes)
+        args = (resultado['eventos'], cenario['cliente'], cenario['valor_imovel'])
+        t_monta, t_salva = _monta_e_salva(args, repeticoes)
+        tempos['pre'] += t_pre
+        tempos['pos'] += t_pos
+        tempos['monta'] += t_monta
+        tempos['salva'] += t_salva
+
+        memoria['pre'] = max(memoria['pre'], pico_kb(lambda: simulate(cenario, parcelas_fixas=0)))
+        memoria['pos'] = max(memoria['pos'], pico_kb(lambda: simulate(cenario)))
+        m_monta, m_salva = _picos_planilha(args)
+        memoria['monta'] = max(memoria['monta'], m_monta)
+        memoria['salva'] = max(memoria['salva'], m_salva)
+    return tempos, memoria
+
+
+def mede_load_taxas(caminho, repeticoes):
+    def carrega():
+        motor._load_taxas.cache_clear()
+        return load_taxas(caminho)
+    tempo, _ = cronometra(carrega, repeticoes)
+    return tempo, pico_kb(carrega)
+
+
+def executa(caminho_taxas, repeticoes, casos_filtro=None):
+    taxas_por_emp = load_taxas(caminho_taxas)
+    metricas = {}
+    tempo, memoria = mede_load_taxas(caminho_taxas, repeticoes)
+    metricas['load_taxas'] = {'ms': tempo, 'kb': memoria}
+    casos = gera_casos(taxas_por_emp, casos_filtro)
+    # aquecimento: imports tardios, caches de calendário e do openpyxl
+    for cenarios in casos.values():
+        _monta_e_salva((simulate(cenarios[0])['eventos'], '', 0.0), 1)
+    for nome, cenarios in casos.items():
+        tempos, memorias = mede_caso(cenarios, repeticoes)
+        for etapa in tempos:
+            metricas[f'{etapa}/{nome}'] = {'ms': tempos[etapa], 'kb': memorias[etapa]}
+    return metricas
+
+
+def compara(metricas, base, limite):
+    # lista de (métrica, unidade, base, atual) que pioraram além do limite
+    regressoes = []
+    for chave, atual in metricas.items():
+        anterior = base.get(chave)
+        if anterior is None:
+            continue
+        for unidade, piso in (('ms', PISO_MS), ('kb', PISO_KB)):
+            if atual[unidade] > anterior[unidade] * (1 + limite) and atual[unidade] - anterior[unidade] > piso:
+                regressoes.append((chave, unidade, anterior[unidade], atual[unidade]))
+    return regressoes
+
+
+def imprime(metricas, base):
+    print(f"{'métrica':<28}{'ms':>10}{'base ms':>10}{'pico KB':>12}{'base KB':>10}")
+    for chave, m in metricas.items():
+        b = base.get(chave, {})
+        print(f"{chave:<28}{m['ms']:>10.2f}{b.get('ms', float('nan')):>10.2f}"
+              f"{m['kb']:>12.0f}{b.get('kb', float('nan')):>10.0f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark do motor de financiamento e da exportação .xlsx")
+    parser.add_argument('--taxas', default='taxas.txt')
+    parser.add_argument('--base', default=BASE_PADRAO, help="arquivo JSON da base de comparação")
+    parser.add_argument('--salva-base', action='store_true', help="grava as medições como nova base")
+    parser.add_argument('--limite', type=float, default=0.2, help="piora relativa tolerada (0.2 = 20%%)")
+    parser.add_argument('--repeticoes', type=int, default=5)
+    parser.add_argument('--casos', nargs='*', help="só estes casos (ex.: 420m-pesada)")
+    args = parser.parse_args(argv)
+
+    metricas = executa(args.taxas, args.repeticoes, args.casos)
+    caminho_base = Path(args.base)
+    base = json.loads(caminho_base.read_text(encoding='utf-8')) if caminho_base.exists() else {}
+    imprime(metricas, base)
+
+    if args.salva_base:
+        caminho_base.write_text(json.dumps(metricas, indent=2, sort_keys=True), encoding='utf-8')
+        print(f"Base gravada em {caminho_base}")
+        return 0
+    if not base:
+        print(f"Sem base em {caminho_base}; rode com --salva-base para criar uma.")
+        return 0
+    regressoes = compara(metricas, base, args.limite)
+    for chave, unidade, anterior, atual in regressoes:
+        print(f"REGRESSÃO {chave} [{unidade}]: {anterior:.2f} -> {atual:.2f} "
+              f"(+{(atual / anterior - 1) * 100:.0f}%)")
+    total_ms = sum(m['ms'] for m in metricas.values())
+    print(f"Total: {total_ms:.1f} ms; {len(regressoes)} regressão(ões) acima de {args.limite:.0%}")
+    return 1 if regressoes else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
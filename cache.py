@@ -0,0 +1,110 @@
+import hashlib
+import json
+import pickle
+import threading
+from collections import OrderedDict
+from dataclasses import asdict, is_dataclass
+from datetime import date
+from io import BytesIO
+from pathlib import Path
+
+from metricas import SEM_MEDICAO
+from motor import simulate
+from planilha import monta_planilha
+
+# Memoização de simulações completas (eventos + bytes do .xlsx), chaveada por
+# uma impressão digital de todas as entradas do cenário. LRU limitada por
+# quantidade de itens e por memória estimada.
+
+
+def _serializa(obj):
+    if isinstance(obj, date):
+        return obj.isoformat()
+    if is_dataclass(obj):
+        return asdict(obj)
+    raise TypeError(f"Tipo não serializável no cenário: {type(obj).__name__}")
+
+
+def impressao_digital(cenario: dict, **opcoes) -> str:
+    conteudo = json.dumps({'cenario': cenario, 'opcoes': opcoes}, default=_serializa, sort_keys=True)
+    return hashlib.sha256(conteudo.encode('utf-8')).hexdigest()
+
+
+class CacheSimulacoes:
+    def __init__(self, max_itens=64, max_bytes=64 * 1024 * 1024):
+        self.max_itens = max_itens
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._itens = OrderedDict()
+        self._bytes = 0
+        self._versao_taxas = None
+        self._lock = threading.Lock()
+
+    def obtem(self, cenario: dict, medicao=SEM_MEDICAO, simulador=None):
+        # (resultado, xlsx) do cenário; o resultado é compartilhado, não alterar
+        # simulador: incremental.SimulacaoIncremental da sessão, para a
+        # simulação continuar da anterior em vez de recomeçar
+        with medicao.etapa('impressao_digital'):
+            chave = impressao_digital(cenario)
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is not None:
+                self._itens.move_to_end(chave)
+                self.hits += 1
+                medicao.conta('cache_hits')
+                return item[0], item[1]
+            self.misses += 1
+        medicao.conta('cache_misses')
+
+        if simulador is not None:
+            resultado = simulador.simula(cenario, medicao=medicao)
+        else:
+            resultado = simulate(cenario, medicao=medicao)
+        with medicao.etapa('planilha'):
+            wb = monta_planilha(resultado['eventos'], cenario.get('cliente', ''), cenario['valor_imovel'])
+        with medicao.etapa('salva'):
+            buf = BytesIO()
+            wb.save(buf)
+            xlsx = buf.getvalue()
+        medicao.conta('bytes_escritos', len(xlsx))
+        tamanho = len(xlsx) + len(pickle.dumps(resultado, pickle.HIGHEST_PROTOCOL))
+
+        with self._lock:
+            if chave not in self._itens and tamanho <= self.max_bytes:
+                self._itens[chave] = (resultado, xlsx, tamanho)
+                self._bytes += tamanho
+                self._despeja()
+        return resultado, xlsx
+
+    def _despeja(self):
+        while self._itens and (len(self._itens) > self.max_itens or self._bytes > self.max_bytes):
+            _, (_, _, tamanho) = self._itens.popitem(last=False)
+            self._bytes -= tamanho
+            self.evictions += 1
+
+    def limpa(self):
+        with self._lock:
+            self.evictions += len(self._itens)
+            self._itens.clear()
+            self._bytes = 0
+
+    def sincroniza_taxas(self, filepath: str):
+        # esvazia o cache quando o arquivo de taxas muda (mtime/tamanho)
+        path = Path(filepath)
+        info = path.stat() if path.exists() else None
+        versao = (str(path.resolve()), info.st_mtime_ns, info.st_size) if info else None
+        if versao != self._versao_taxas:
+            if self._versao_taxas is not None:
+                self.limpa()
+            self._versao_taxas = versao
+
+    def estatisticas(self) -> dict:
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'itens': len(self._itens), 'bytes': self._bytes}
+
+
+# Instância única do processo, compartilhada entre as sessões do Streamlit
+CACHE = CacheSimulacoes()
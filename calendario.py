@@ -0,0 +1,131 @@
+import calendar
+import threading
+from collections import OrderedDict
+from datetime import date, datetime as dt
+from functools import lru_cache
+
+import numpy as np
+from dateutil.relativedelta import relativedelta
+
+# Calendário de parcelas pré-calculado: a data de cada parcela mensal, os dias
+# corridos desde a anterior e os fatores de juros (1+taxa)^(dias/30), como
+# arrays. Os calendários ficam em cache e são compartilhados entre simulações
+# com as mesmas datas; crescem sob demanda, em blocos de meses.
+
+MESES_POR_BLOCO = 120
+TABELA_DIAS = 400
+MAX_TAXAS = 8       # taxas com fatores guardados em cada calendário
+_ORDINAL_1970 = date(1970, 1, 1).toordinal()
+
+
+@lru_cache(maxsize=None)
+def ultimo_dia(ano, mes):
+    return calendar.monthrange(ano, mes)[1]
+
+
+@lru_cache(maxsize=64)
+def tabela_fatores(taxa) -> tuple:
+    # (1+taxa)^(d/30) para d = 0..TABELA_DIAS-1
+    return tuple((1 + taxa) ** (d / 30) for d in range(TABELA_DIAS))
+
+
+def fator_juros(taxa, dias):
+    if 0 <= dias < TABELA_DIAS:
+        return tabela_fatores(taxa)[dias]
+    return (1 + taxa) ** (dias / 30)
+
+
+class Calendario:
+    # Parcela i cai no mês (primeiro_mes + i), no dia preferido ou no último
+    # dia do mês; a hora vem de primeiro_mes. dias[i] conta a partir da
+    # parcela i-1 (ou de `origem`, para a primeira). As datas são calculadas
+    # em bloco como ordinais (NumPy) e os datetime só são criados quando
+    # pedidos. Ao crescer, os arrays são trocados por novos, nunca alterados,
+    # então leituras concorrentes são seguras.
+    def __init__(self, origem, primeiro_mes, dia):
+        self.origem = origem
+        self.primeiro_mes = primeiro_mes
+        self.dia = dia
+        self._hora = primeiro_mes.timetz()
+        self._datas = {}
+        self._ordinais = np.empty(0, dtype=np.int64)
+        self._dias = np.empty(0, dtype=np.int64)
+        self._fatores = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._ordinais)
+
+    def garante(self, n):
+        # estende o calendário até ter pelo menos n parcelas
+        if n <= len(self._ordinais):
+            return
+        with self._lock:
+            if n <= len(self._ordinais):
+                return
+            total = -(-n // MESES_POR_BLOCO) * MESES_POR_BLOCO
+            meses = np.arange(total) + (self.primeiro_mes.year - 1970) * 12 + self.primeiro_mes.month - 1
+            inicio_mes = meses.astype('datetime64[M]').astype('datetime64[D]')
+            dias_no_mes = ((meses + 1).astype('datetime64[M]').astype('datetime64[D]') - inicio_mes).astype(np.int64)
+            ordinais = inicio_mes.astype(np.int64) + np.minimum(self.dia, dias_no_mes) - 1 + _ORDINAL_1970
+            self._dias = np.diff(ordinais, prepend=self.origem.toordinal())
+            self._fatores = OrderedDict()
+            self._ordinais = ordinais
+
+    def data(self, i):
+        d = self._datas.get(i)
+        if d is None:
+            self.garante(i + 1)
+            d = self._datas[i] = dt.combine(date.fromordinal(int(self._ordinais[i])), self._hora)
+        return d
+
+    def fim_bloco(self, inicio, n, ate=None):
+        # índice final (exclusivo) de até n parcelas a partir de `inicio`,
+        # parando antes da primeira data >= ate
+        self.garante(inicio + n)
+        if ate is None:
+            return inicio + n
+        # na mesma data, a parcela só fica antes de `ate` se a hora dela for menor
+        lado = 'left' if self._hora >= ate.timetz() else 'right'
+        return inicio + int(np.searchsorted(self._ordinais[inicio:inicio + n], ate.toordinal(), lado))
+
+    def ordinais(self, inicio, fim) -> np.ndarray:
+        self.garante(fim)
+        return self._ordinais[inicio:fim]
+
+    def dias(self, inicio, fim) -> np.ndarray:
+        self.garante(fim)
+        return self._dias[inicio:fim]
+
+    def fatores(self, taxa, inicio, fim) -> np.ndarray:
+        # fatores de juros das parcelas [inicio, fim), guardados para as
+        # MAX_TAXAS taxas usadas por último (a grade de sensibilidade passa por
+        # muitas taxas no mesmo calendário)
+        self.garante(fim)
+        with self._lock:
+            fatores = self._fatores.get(taxa)
+            if fatores is None or len(fatores) < fim:
+                dias = self._dias
+                tabela = np.asarray(tabela_fatores(taxa))
+                na_tabela = (dias >= 0) & (dias < TABELA_DIAS)
+                fatores = np.where(na_tabela, tabela[np.clip(dias, 0, TABELA_DIAS - 1)], (1 + taxa) ** (dias / 30))
+                self._fatores[taxa] = fatores
+                if len(self._fatores) > MAX_TAXAS:
+                    self._fatores.popitem(last=False)
+            self._fatores.move_to_end(taxa)
+        return fatores[inicio:fim]
+
+
+@lru_cache(maxsize=1024)
+def _calendario(origem, primeiro_mes, dia):
+    return Calendario(origem, primeiro_mes, dia)
+
+
+def calendario(origem, primeiro_mes, dia) -> Calendario:
+    # primeiro_mes: qualquer data do mês da 1ª parcela (o dia é ignorado)
+    return _calendario(origem, primeiro_mes.replace(day=1), int(dia))
+
+
+def calendario_pos(data_entrega, dia) -> Calendario:
+    # parcelas pós-entrega: a partir do mês seguinte ao da entrega
+    return calendario(data_entrega, data_entrega.replace(day=1) + relativedelta(months=1), dia)
@@ -0,0 +1,173 @@
+import math
+from array import array
+from datetime import datetime as dt
+
+import numpy as np
+
+# Armazenamento colunar das linhas do fluxo. Cada coluna é um array.array
+# contíguo (exposto ao NumPy sem cópia); o tipo da linha é um código pequeno e
+# as descrições livres ficam internadas numa tabela de rótulos. Campos sem
+# valor (o "-" da planilha) são NaN.
+
+BASE, PRE, POS, AVULSO, ASSOCIADO, ABATIMENTO, ENTREGA = range(7)
+
+_ROTULOS_FIXOS = {
+    BASE: 'Data-Base (assinatura do contrato)',
+    ENTREGA: 'Data da entrega das chaves',
+}
+_ROTULOS_PARCELA = {
+    PRE: "{}ª Parcela Pré-Entrega",
+    POS: "{}ª Parcela Pós-Entrega",
+}
+_NUMERICAS = ('valor', 'juros', 'dias', 'taxa_efetiva', 'incc', 'ipca', 'mudanca', 'saldo')
+NAN = math.nan
+
+
+class Eventos:
+    __slots__ = ('n_extras', 'rotulos', '_indice_rotulo', 'data', 'codigo', 'parcela', 'rotulo',
+                 'valor', 'juros', 'dias', 'taxa_efetiva', 'incc', 'ipca', 'mudanca', 'saldo', 'extras')
+
+    def __init__(self, n_extras=0):
+        self.n_extras = n_extras
+        self.rotulos = []
+        self._indice_rotulo = {}
+        self.data = array('q')      # ordinal do dia
+        self.codigo = array('b')
+        self.parcela = array('q')   # 0 = linha sem número de parcela
+        self.rotulo = array('q')    # índice em self.rotulos, -1 se derivado do código
+        for nome in _NUMERICAS:
+            setattr(self, nome, array('d'))
+        self.extras = array('d')    # matriz linhas x n_extras, achatada
+
+    # --- Escrita (usada pelo motor) ---
+    def _interna(self, rotulo):
+        if rotulo is None:
+            return -1
+        indice = self._indice_rotulo.get(rotulo)
+        if indice is None:
+            indice = self._indice_rotulo[rotulo] = len(self.rotulos)
+            self.rotulos.append(rotulo)
+        return indice
+
+    def adiciona(self, data, codigo, parcela=0, rotulo=None, valor=NAN, juros=NAN, dias=NAN,
+                 taxa_efetiva=NAN, incc=NAN, ipca=NAN, extras=None, mudanca=NAN, saldo=NAN):
+        self.data.append(data.toordinal())
+        self.codigo.append(codigo)
+        self.parcela.append(parcela)
+        self.rotulo.append(self._interna(rotulo))
+        self.valor.append(valor)
+        self.juros.append(juros)
+        self.dias.append(dias)
+        self.taxa_efetiva.append(taxa_efetiva)
+        self.incc.append(incc)
+        self.ipca.append(ipca)
+        self.mudanca.append(mudanca)
+        self.saldo.append(saldo)
+        self.extras.extend(extras if extras is not None else [NAN] * self.n_extras)
+
+    def adiciona_bloco(self, ordinais, codigo, parcela_inicial, valor, juros, dias, taxa_efetiva,
+                       incc, ipca, extras, mudanca, saldo):
+        # várias linhas de uma vez a partir de vetores NumPy de mesmo tamanho
+        n = len(ordinais)
+        self.data.frombytes(np.asarray(ordinais, dtype=np.int64).tobytes())
+        self.codigo.frombytes(np.full(n, codigo, dtype=np.int8).tobytes())
+        self.parcela.frombytes(np.arange(parcela_inicial, parcela_inicial + n, dtype=np.int64).tobytes())
+        self.rotulo.frombytes(np.full(n, -1, dtype=np.int64).tobytes())
+        for nome, coluna in (('valor', valor), ('juros', juros), ('dias', dias), ('taxa_efetiva', taxa_efetiva),
+                             ('incc', incc), ('ipca', ipca), ('mudanca', mudanca), ('saldo', saldo)):
+            getattr(self, nome).frombytes(np.broadcast_to(np.asarray(coluna, dtype=np.float64), (n,)).tobytes())
+        self.extras.frombytes(np.asarray(extras, dtype=np.float64).reshape(n, self.n_extras).tobytes())
+
+    def prefixo(self, n) -> 'Eventos':
+        # cópia das n primeiras linhas, para continuar a partir delas
+        copia = Eventos(self.n_extras)
+        copia.rotulos = list(self.rotulos)
+        copia._indice_rotulo = dict(self._indice_rotulo)
+        for nome in ('data', 'codigo', 'parcela', 'rotulo') + _NUMERICAS:
+            setattr(copia, nome, getattr(self, nome)[:n])
+        copia.extras = self.extras[:n * self.n_extras]
+        return copia
+
+    # --- Leitura ---
+    def __len__(self):
+        return len(self.data)
+
+    def coluna(self, nome) -> np.ndarray:
+        # visão NumPy sem cópia; não adicione linhas enquanto ela existir
+        col = getattr(self, nome)
+        if not len(col):
+            return np.empty(0, dtype=np.int8 if nome == 'codigo' else np.float64 if col.typecode == 'd' else np.int64)
+        return np.frombuffer(col, dtype={'q': np.int64, 'b': np.int8, 'd': np.float64}[col.typecode])
+
+    def matriz_extras(self) -> np.ndarray:
+        return self.coluna('extras').reshape(len(self), self.n_extras)
+
+    def tipo(self, i) -> str:
+        codigo = self.codigo[i]
+        if codigo in _ROTULOS_PARCELA:
+            return _ROTULOS_PARCELA[codigo].format(self.parcela[i])
+        if codigo in _ROTULOS_FIXOS:
+            return _ROTULOS_FIXOS[codigo]
+        return self.rotulos[self.rotulo[i]]
+
+    def largura_tipo(self) -> int:
+        # comprimento do maior tipo(i), sem montar o de cada linha: nas
+        # parcelas basta o maior número, nas demais os rótulos usados
+        codigo = self.coluna('codigo')
+        larguras = [0]
+        for cod, modelo in _ROTULOS_PARCELA.items():
+            parcelas = self.coluna('parcela')[codigo == cod]
+            if len(parcelas):
+                larguras.append(len(modelo.format(parcelas.max())))
+        larguras += [len(rotulo) for cod, rotulo in _ROTULOS_FIXOS.items() if (codigo == cod).any()]
+        livres = ~np.isin(codigo, list(_ROTULOS_PARCELA) + list(_ROTULOS_FIXOS))
+        larguras += [len(self.rotulos[i]) for i in np.unique(self.coluna('rotulo')[livres]).tolist()]
+        return max(larguras)
+
+    def ordem(self) -> np.ndarray:
+        # índices por data; estável, como o sorted() de antes
+        return np.argsort(self.coluna('data'), kind='stable')
+
+    def soma_valores(self) -> float:
+        return float(np.nansum(self.coluna('valor')))
+
+    def linha(self, i) -> dict:
+        # visão em dict de uma linha, no formato antigo de `eventos`
+        def campo(v):
+            return "-" if math.isnan(v) else v
+        extras = list(self.extras[i * self.n_extras:(i + 1) * self.n_extras])
+        return {
+            'data': dt.fromordinal(self.data[i]),
+            'parcela': self.parcela[i] or '',
+            'tipo': self.tipo(i),
+            'valor': campo(self.valor[i]),
+            'juros': campo(self.juros[i]),
+            'dias_corridos': "-" if math.isnan(self.dias[i]) else int(self.dias[i]),
+            'taxa_efetiva': campo(self.taxa_efetiva[i]),
+            'incc': campo(self.incc[i]),
+            'ipca': campo(self.ipca[i]),
+            'taxas_extra': "-" if math.isnan(self.juros[i]) or any(map(math.isnan, extras)) else extras,
+            'Total de mudança (R$)': campo(self.mudanca[i]),
+            'saldo': campo(self.saldo[i]),
+        }
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return self.linha(i)
+
+    def __iter__(self):
+        return (self.linha(i) for i in range(len(self)))
+
+    def para_dataframe(self):
+        # pandas é opcional; as colunas numéricas entram sem cópia
+        import pandas as pd
+        colunas = {nome: self.coluna(nome) for nome in ('parcela', 'codigo') + _NUMERICAS}
+        colunas['data'] = (self.coluna('data') - dt(1970, 1, 1).toordinal()).astype('datetime64[D]')
+        colunas['tipo'] = [self.tipo(i) for i in range(len(self))]
+        extras = self.matriz_extras()
+        for j in range(self.n_extras):
+            colunas[f'extra_{j}'] = extras[:, j]
+        return pd.DataFrame(colunas, copy=False)
@@ -1,19 +1,182 @@
 import streamlit as st
 import streamlit_authenticator as stauth
-from pathlib import Path
-from io import BytesIO
-import calendar
+import altair as alt
+import pandas as pd
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime as dt, time
-from dateutil.relativedelta import relativedelta
-from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill
-from openpyxl.utils import get_column_letter
+from cache import CACHE
+from incremental import SimulacaoIncremental
+from lote import COLUNAS_CSV, exporta_lote, le_cenarios_csv
+from metricas import Medicao
+from montecarlo import le_serie_historica, projeta
+from sensibilidade import PRAZO, eixo_percentual, eixo_prazo, valor_base, varre
+from motor import HORIZONTE_PARCELAS, Taxas, load_taxas
+from planilha import XLSX_MIME
+from solver import capacidade_minima, prazo_quitacao, valor_maximo_imovel
+
+# Métricas por etapa vão para o stderr em JSON, uma linha por geração
+log_metricas = logging.getLogger('financiamento.metricas')
+if not log_metricas.handlers:
+    log_metricas.addHandler(logging.StreamHandler())
+    log_metricas.setLevel(logging.INFO)
 
 st.set_page_config(
     page_title="Gerador de Planilha de Financiamento",
     layout="centered"
 )
 
+# Parâmetros e métricas da análise de sensibilidade
+PARAMETROS_SENSIBILIDADE = {
+    'taxa_pos': "Taxa de juros pós-entrega",
+    'TAXA_IPCA': "IPCA",
+    'taxa_pre': "Taxa de juros pré-entrega",
+    'TAXA_INCC': "INCC",
+    'capacidade_pos_antes': "Capacidade de pagamento pós-entrega",
+    'valor_imovel': "Valor do imóvel",
+    PRAZO: "Prazo (parcelas pós-entrega)",
+}
+METRICAS_SENSIBILIDADE = {
+    'mes_quitacao': "Parcelas pós-entrega até quitar",
+    'total_pago': "Total pago (R$)",
+    'saldo_final': "Saldo final (R$)",
+}
+
+
+def grafico_sensibilidade(linhas, eixo_x, eixo_y, metrica, eixo_z=None):
+    # heatmap da métrica; com 3 parâmetros, um heatmap por valor do 3º
+    df = pd.DataFrame(linhas)
+    grafico = alt.Chart(df).mark_rect().encode(
+        x=alt.X(f'{eixo_x}:O', title=PARAMETROS_SENSIBILIDADE[eixo_x], axis=alt.Axis(format='.4~g')),
+        y=alt.Y(f'{eixo_y}:O', title=PARAMETROS_SENSIBILIDADE[eixo_y], sort='descending', axis=alt.Axis(format='.4~g')),
+        color=alt.Color(f'{metrica}:Q', title=METRICAS_SENSIBILIDADE[metrica]),
+        tooltip=list(df.columns),
+    )
+    if eixo_z:
+        grafico = grafico.properties(width=140, height=140).facet(
+            facet=alt.Facet(f'{eixo_z}:O', title=PARAMETROS_SENSIBILIDADE[eixo_z]), columns=4)
+    return grafico
+
+
+# Gerações pesadas (planilha, sensibilidade, Monte Carlo, lote) rodam num
+# pool de threads único do servidor, fora do script: a tela continua
+# respondendo e acompanha a tarefa por um fragmento que se atualiza sozinho.
+TRABALHADORES = int(os.environ.get('GERACAO_TRABALHADORES', '2'))
+INTERVALO_ATUALIZACAO = 0.5  # s
+# seções calculadas a partir do cenário do formulário (o lote lê o próprio CSV)
+SECOES_CENARIO = ('metas', 'sensibilidade', 'monte_carlo', 'planilha')
+
+
+@st.cache_resource
+def executor():
+    # compartilhado pelas sessões; limita quantas gerações rodam ao mesmo tempo
+    return ThreadPoolExecutor(max_workers=TRABALHADORES, thread_name_prefix='geracao')
+
+
+def gera_planilha(cenario, capturar_perfil, simulador):
+    with Medicao('gerar_planilha', perfil=capturar_perfil) as medicao:
+        resultado, xlsx = CACHE.obtem(cenario, medicao, simulador)
+    return {'resultado': resultado, 'xlsx': xlsx,
+            'perfil_arquivo': medicao.perfil_arquivo, 'perfil_texto': medicao.perfil_texto}
+
+
+def calcula_sensibilidade(cenario, eixos, linhas):
+    # `linhas` vai sendo preenchida para a tela mostrar o heatmap parcial
+    for lote in varre(cenario, eixos):
+        linhas.extend(lote)
+    return linhas
+
+
+def dispara(nome, funcao, *args, **kwargs):
+    # uma tarefa por nome e sessão; devolve False se a anterior não terminou
+    tarefa = st.session_state.tarefas.get(nome)
+    if tarefa is not None and not tarefa.done():
+        st.warning("A geração anterior ainda está em andamento; aguarde.")
+        return False
+    st.session_state.resultados.pop(nome, None)
+    st.session_state.descartadas.discard(nome)
+    st.session_state.tarefas[nome] = executor().submit(funcao, *args, **kwargs)
+    return True
+
+
+def invalida(nomes):
+    # Os resultados dessas seções deixam de valer. Tarefa ainda na fila é
+    # cancelada; a que já está rodando continua registrada (outra do mesmo
+    # nome só é disparada quando ela acabar) e o retorno dela é descartado.
+    for nome in nomes:
+        st.session_state.resultados.pop(nome, None)
+        tarefa = st.session_state.tarefas.get(nome)
+        if tarefa is None:
+            continue
+        if tarefa.cancel() or tarefa.done():
+            del st.session_state.tarefas[nome]
+        else:
+            st.session_state.descartadas.add(nome)
+
+
+def recolhe(nome):
+    # move o retorno da tarefa terminada para os resultados da sessão
+    tarefa = st.session_state.tarefas.get(nome)
+    if tarefa is not None and tarefa.done():
+        del st.session_state.tarefas[nome]
+        if nome in st.session_state.descartadas:
+            st.session_state.descartadas.discard(nome)
+            return None
+        try:
+            st.session_state.resultados[nome] = tarefa.result()
+        except ValueError as e:
+            st.session_state.resultados[nome] = e
+    resultado = st.session_state.resultados.get(nome)
+    if isinstance(resultado, ValueError):
+        # a seção mostra o erro no lugar do resultado
+        st.error(str(resultado))
+        return None
+    return resultado
+
+
+def pendente(nome):
+    tarefa = st.session_state.tarefas.get(nome)
+    return tarefa is not None and not tarefa.done()
+
+
+@st.fragment(run_every=INTERVALO_ATUALIZACAO)
+def acompanha(nome, texto, parcial=None):
+    # só este trecho reexecuta enquanto a tarefa roda; ao terminar, a página
+    # inteira é refeita uma vez para mostrar o resultado
+    if not pendente(nome):
+        st.rerun()
+    if parcial is None or nome in st.session_state.descartadas:
+        st.info(texto)
+    else:
+        parcial()
+
+
+# Tabelas editáveis dos pagamentos adicionais (uma linha por pagamento)
+COLUNAS_PAGAMENTOS = {
+    'data': st.column_config.DateColumn("Data", format="DD/MM/YYYY"),
+    'valor': st.column_config.NumberColumn("Valor (R$)", min_value=0.0, step=0.01, format="%.2f"),
+    'descricao': st.column_config.TextColumn("Descrição"),
+    'assoc': st.column_config.CheckboxColumn("Atribuir a parcela normal do mês?", default=False),
+}
+
+
+def tabela_vazia(descricao=True):
+    colunas = {'data': pd.Series(dtype='datetime64[ns]'), 'valor': pd.Series(dtype='float64')}
+    if descricao:
+        colunas['descricao'] = pd.Series(dtype='object')
+    colunas['assoc'] = pd.Series(dtype='bool')
+    return pd.DataFrame(colunas)
+
+
+def linhas_preenchidas(df):
+    # linhas com data e valor; assoc vazio (linha nova) conta como não
+    return [{**linha, 'data': dt.combine(pd.Timestamp(linha['data']).date(), time()), 'valor': float(linha['valor']),
+             'assoc': linha['assoc'] is True}
+            for linha in df.to_dict('records') if not pd.isna(linha['data']) and not pd.isna(linha['valor'])]
+
+
 # Hardcoded credentials — replace or fetch from st.secrets or .env
 USERNAME = "brfinancial"
 PASSWORD = "1234"
@@ -21,449 +184,309 @@ PASSWORD = "1234"
 # Set initial session state
 if "authenticated" not in st.session_state:
     st.session_state.authenticated = False
+# simulação anterior da sessão, para a próxima continuar dela
+if "simulador" not in st.session_state:
+    st.session_state.simulador = SimulacaoIncremental()
+# (os formulários usam chaves form_*: a chave de um formulário fica reservada
+# na sessão e não pode receber valores)
+# tarefas em andamento e resultados já calculados, por seção; descartadas:
+# tarefas de um cenário anterior que ainda estão rodando
+if "tarefas" not in st.session_state:
+    st.session_state.tarefas = {}
+    st.session_state.resultados = {}
+    st.session_state.descartadas = set()
+    st.session_state.tabelas = {'non_rec': tabela_vazia(), 'semi': tabela_vazia(False), 'anual': tabela_vazia(False)}
+
 
 def login():
     st.title("Login")
 
-    username = st.text_input("Username")
-    password = st.text_input("Password", type="password")
+    with st.form("form_login"):
+        username = st.text_input("Username")
+        password = st.text_input("Password", type="password")
+        entrar = st.form_submit_button("Login")
 
-    if st.button("Login"):
+    if entrar:
         if username == USERNAME and password == PASSWORD:
             st.session_state.authenticated = True
-            # --- Auxiliares de taxa externa ---
-            def load_taxas(filepath: str) -> dict:
-                taxas = {}
-                path = Path(filepath)
-                if not path.exists():
-                    st.error(f"Arquivo de taxas não encontrado: {filepath}")
-                    return taxas
-                with open(path, 'r', encoding='utf-8') as f:
-                    content = f.read().strip()
-                blocos = [b.strip() for b in content.split("\n\n") if b.strip()]
-                for bloco in blocos:
-                    linhas = bloco.splitlines()
-                    nome = linhas[0].strip()
-                    taxas[nome] = {}
-                    for linha in linhas[1:]:
-                        if '=' in linha:
-                            chave, valor = linha.split('=', 1)
-                            try:
-                                taxas[nome][chave.strip()] = float(valor.strip())
-                            except ValueError:
-                                taxas[nome][chave.strip()] = valor.strip()
-                return taxas
-
-            # --- Funções de cálculo ---
-            HEADER_FILL = PatternFill(start_color="FFD3D3D3", end_color="FFD3D3D3", fill_type="solid")
-            DATE_FORMAT = 'dd/mm/yyyy'
-            CURRENCY_FORMAT = '"R$" #,##0.00'
-            PERCENT_FORMAT = '0.00%'
-
-            def adjust_day(date, preferred_day):
-                try:
-                    return date.replace(day=preferred_day)
-                except ValueError:
-                    last = calendar.monthrange(date.year, date.month)[1]
-                    return date.replace(day=last)
-
-            def days_in_month(date):
-                return calendar.monthrange(date.year, date.month)[1]
-
-            class PaymentTracker:
-                def __init__(self, dia_pagamento, taxa_juros):
-                    self.last_date = None
-                    self.dia = dia_pagamento
-                    self.taxa = taxa_juros
-                def calculate(self, current_date, saldo):
-                    if self.last_date is None:
-                        self.last_date = current_date
-                        return 0.0, 0, 0.0
-                    dias_corridos = (current_date - self.last_date).days
-                    taxa_efetiva = ((1+self.taxa) ** (dias_corridos / 30)-1)
-                    juros = saldo * ((1+self.taxa) ** (dias_corridos / 30)-1)
-                    self.last_date = current_date
-                    return juros, dias_corridos, taxa_efetiva
-
-            # --- App Streamlit ---
-            def main():
-                st.title("Bem-vindo ao gerador de financiamento da Br Financial!")
-
-                # Carrega taxas externas
-                taxas_path = 'taxas.txt'
-                taxas_por_emp = load_taxas(taxas_path)
-                
-                # Entradas básicas
-                cliente = st.text_input("Qual o nome do cliente?")
-                valor_imovel = st.number_input("Qual o valor total do imóvel (R$)", min_value=0.0, step=0.01, format="%.2f")
-                dia_pagamento = st.number_input("Qual o dia preferencial de pagamento das parcelas mensais? (1-31)", min_value=1, max_value=31, step=1)
-
-                # Selectbox dinâmico
-                empreendimento = st.selectbox("Selecione o empreendimento", options=list(taxas_por_emp.keys()))
-                taxas_sel = taxas_por_emp.get(empreendimento, {})
-                # Extrai taxas específicas
-                TAXA_EMISSAO_CCB = taxas_sel.get('TAXA_EMISSAO_CCB', 0.0)
-                TAXA_EMISSAO_CONTRATO_ALIENACAO_FIDUCIARIA = taxas_sel.get('TAXA_EMISSAO_CONTRATO_ALIENACAO_FIDUCIARIA', 0.0)
-                TAXA_REGISTRO_IMOVEL = taxas_sel.get('TAXA_REGISTRO_IMOVEL', 0.0)
-                TAXA_ESCRITURA_IMOVEL = taxas_sel.get('TAXA_ESCRITURA_IMOVEL',0.0)
-                TAXA_SEGURO_PRESTAMISTA_PCT = taxas_sel.get('TAXA_SEGURO_PRESTAMISTA_PCT', 0.0)
-                TAXA_INCC = taxas_sel.get('TAXA_INCC', 0.0)
-                TAXA_IPCA = taxas_sel.get('TAXA_IPCA', 0.0)
-                taxa_pre = taxas_sel.get('taxa_pre', 0.0)
-                taxa_pos = taxas_sel.get('taxa_pos', 0.0)
-                # extras (percentuais)
-                taxas_extras = []
-                for chave, val in taxas_sel.items():
-                    if chave.endswith('_PCT') and chave not in ['TAXA_SEGURO_PRESTAMISTA_PCT']:
-                        periodo = 'pré-entrega da chave' if 'INCC' in chave else 'pós-entrega da chave'
-                        taxas_extras.append({'pct': val, 'periodo': periodo})
-
-                # Datas e valores adicionais
-                data_base_date = st.date_input("Data-base (data de assinatura do contrato)", value=dt.now().date())
-                data_base = dt.combine(data_base_date, time())
-                capacidade_pre = st.number_input("Qual a capacidade de pagamento do cliente nas parcelas mensais ANTES da entrega das chaves? (R$)", min_value=0.0, step=0.01)
-                data_inicio_pre = dt.combine(st.date_input("Data início dos pagamentos mensais durante a construção (pré-entrega)"), time())
-                data_entrega = dt.combine(st.date_input("Data de CONCLUSÃO da obra e entrega das chaves"), time())
-                fgts = st.number_input("Valor do FGTS para abatimento do saldo devedor (R$)", min_value=0.0, step=0.01)
-                fin_banco = st.number_input("Valor financiado pelo banco (abatimento no saldo devedor) (R$)", min_value=0.0, step=0.01)
-                capacidade_pos_antes = st.number_input("Qual a capacidade de pagamento do cliente nas parcelas mensais DEPOIS da entrega das conclusão da obra? (R$)", min_value=0.0, step=0.01)
-                val_parcela_banco = st.number_input("Qual o valor da parcela mensal para pagamento do financiamento do banco? (R$)", min_value=0.0, step=0.01)
-                capacidade_pos = capacidade_pos_antes - val_parcela_banco
-
-                # Pagamentos não recorrentes
-                st.subheader("Pagamentos adicionais às parcelas")
-                n_non_rec = st.number_input("Quantos pagamentos adicionais terão? (Caso não haja, deixe zerado)", min_value=0, step=1)
-                non_rec = []
-                for i in range(int(n_non_rec)):
-                    d_date = st.date_input(f"Data do pagamento {i+1}", key=f"nr_d_{i}")
-                    d = dt.combine(d_date, time())
-                    v = st.number_input(f"Valor pagamento {i+1} (R$)", min_value=0.0, step=0.01, key=f"nr_v_{i}")
-                    desc = st.text_input(f"Descrição do pagamento {i+1}", key=f"nr_desc_{i}")
-                    assoc = st.checkbox(f"Atribuir a parcela normal do mês?", key=f"nr_assoc_{i}")
-                    if assoc:
-                        d = adjust_day(d, dia_pagamento)
-                    non_rec.append({'data': d, 'tipo': desc, 'valor': v, 'assoc': assoc})
-
-                # Séries semestrais e anuais
-                st.subheader("Pagamentos Semestrais")
-                n_semi = st.number_input("Quantos pagamentos recorrentes semestrais terão? (Caso não haja, deixe zerado)", min_value=0, step=1)
-                semi_series = []
-                for i in range(int(n_semi)):
-                    d0_date = st.date_input(f"Data das parcelas semestrais {i+1}", key=f"s_d0_{i}")
-                    d0 = dt.combine(d0_date, time())
-                    v = st.number_input(f"Valor da parcela semestral {i+1} (R$)", min_value=0.0, step=0.01, key=f"s_v_{i}")
-                    assoc = st.checkbox(f"Atribuir a parcela normal do mês? {i+1}", key=f"s_assoc_{i}")
-                    semi_series.append({'d0': d0, 'v': v, 'assoc': assoc, 'tipo': 'Pagamento Semestral'})
-
-                st.subheader("Pagamentos Anuais")
-                n_ann = st.number_input("Quantos pagamentos recorrentes anuais terão? (Caso não haja, deixe zerado)", min_value=0, step=1)
-                annual_series = []
-                for i in range(int(n_ann)):
-                    d0_date = st.date_input(f"Data das parcelas anuais {i+1}", key=f"a_d0_{i}")
-                    d0 = dt.combine(d0_date, time())
-                    v = st.number_input(f"Valor da parcela anual {i+1} (R$)", min_value=0.0, step=0.01, key=f"a_v_{i}")
-                    assoc = st.checkbox(f"Atribuir a parcela normal do mês? {i+1}", key=f"a_assoc_{i}")
-                    annual_series.append({'d0': d0, 'v': v, 'assoc': assoc, 'tipo': 'Pagamento Anual'})
-
-                # Geração da planilha
-                if st.button("Gerar Planilha"):
-                    # --- Agrega séries em non_rec ---
-                    for series in semi_series:
-                        for n in range(100):
-                            d = series['d0'] + relativedelta(months=6 * n)
-                            if series['assoc']:
-                                d = adjust_day(d, dia_pagamento)
-                            non_rec.append({
-                                'data': d,
-                                'tipo': f"{n+1}ª Parcela Semestral",
-                                'valor': series['v'],
-                                'assoc': series['assoc']
-                            })
-                    for series in annual_series:
-                        for n in range(100):
-                            d = series['d0'] + relativedelta(years=n)
-                            if series['assoc']:
-                                d = adjust_day(d, dia_pagamento) 
-                            non_rec.append({
-                                'data': d,
-                                'tipo': f"{n+1}ª Parcela Anual",
-                                'valor': series['v'],
-                                'assoc': series['assoc']
-                            })
-
-                    # --- Separa pré e pós entre non_rec ---
-                    pre_nr = sorted([e for e in non_rec if e['data'] < data_entrega], key=lambda x: x['data'])
-                    post_nr = sorted([e for e in non_rec if e['data'] >= data_entrega], key=lambda x: x['data'])
-
-                    eventos = []
-                    saldo = valor_imovel
-
-                    # Data base (assinatura do contrato)
-                    eventos.append({
-                        'data': data_base,
-                        'parcela': '',
-                        'tipo': 'Data-Base (assinatura do contrato)',
-                        'valor': "-",
-                        'juros': 0.0,
-                        'dias_corridos': 0,
-                        'taxa_efetiva': 0.0,
-                        'incc': 0.0,
-                        'ipca': 0.0,
-                        'taxas_extra': [0.0] * len(taxas_extras),
-                        'Total de mudança (R$)': 0.0,
-                        'saldo': "-"
-                    })
-
-                    tracker_pre = PaymentTracker(dia_pagamento, taxa_pre)
-                    tracker_pre.last_date = data_base
-                
-                    # 1) PRÉ-ENTREGA ------------------------------------------------
-                    mc_pre = sc_pre = ac_pre = 0
-                    pre_count = 1
-                    prev_date = cursor = data_inicio_pre
-
-                    while True:
-                        d_evt = adjust_day(cursor, dia_pagamento)
-                        if d_evt >= data_entrega:
-                            break
-                        # não-recorrentes pré não associados entre prev_date e d_evt
-                        for ev_nr in [e for e in pre_nr if not e['assoc'] and prev_date < e['data'] < d_evt]:
-                            juros, dias_corr, taxa_eff = tracker_pre.calculate(ev_nr['data'], saldo)
-                            incc_nr = saldo * TAXA_INCC
-                            extras_nr = [saldo * t['pct'] if t['periodo'] in ['pré-entrega da chave', 'ambos'] else 0.0 for t in taxas_extras]
-                            total_taxas_nr = sum(extras_nr) + incc_nr
-                            abat_nr = ev_nr['valor'] - juros - total_taxas_nr
-                            saldo -= abat_nr
-                            eventos.append({**ev_nr, 'juros': juros, 'dias_corridos': dias_corr, 'taxa_efetiva': taxa_eff,
-                                            'incc': incc_nr, 'ipca': 0.0, 'taxas_extra': extras_nr,
-                                            'Total de mudança (R$)': abat_nr, 'saldo': saldo})
-                    
-                        # Parcela mensal pré-entrega (com associações)
-                        juros, dias_corr, taxa_eff = tracker_pre.calculate(d_evt, saldo)
-                        incc = saldo * TAXA_INCC
-                        extras = [saldo * t['pct'] if t['periodo'] in ['pré-entrega da chave', 'ambos'] else 0.0 for t in taxas_extras]
-                        total_taxas = sum(extras) + incc
-                        # soma de associações pré
-                        # 1) parcela mensal pré (sem associados)
-                        valor_parcela = capacidade_pre
-                        abat_principal = valor_parcela - juros - total_taxas
-                        saldo -= abat_principal
-                        eventos.append({
-                            'data': d_evt,
-                            'parcela': pre_count,
-                            'tipo': f"{pre_count}ª Parcela Pré-Entrega",
-                            'valor': valor_parcela,
-                            'juros': juros,
-                            'dias_corridos': dias_corr,
-                            'taxa_efetiva': taxa_eff,
-                            'incc': incc,
-                            'ipca': 0.0,
-                            'taxas_extra': extras,
-                            'Total de mudança (R$)': abat_principal,
-                            'saldo': saldo
-                        })
-
-                        # 2) cada pagamento adicional associado em linha própria
-                        for ev_assoc in [e for e in pre_nr if e['assoc'] and e['data'] == d_evt]:
-                            juros_a, dias_a, txef_a = tracker_pre.calculate(ev_assoc['data'], saldo)
-                            incc_a = saldo * TAXA_INCC
-                            extras_a = [saldo * t['pct'] for t in taxas_extras if t['periodo'] in ['pré-entrega da chave','ambos']]
-                            total_taxas_a = incc_a + sum(extras_a)
-                            abat_a = ev_assoc['valor'] - juros_a - total_taxas_a
-                            saldo -= abat_a
-                            eventos.append({
-                                'data': d_evt,
-                                'parcela': '',
-                                'tipo': ev_assoc['tipo'],
-                                'valor': ev_assoc['valor'],
-                                'juros': juros_a,
-                                'dias_corridos': dias_a,
-                                'taxa_efetiva': txef_a,
-                                'incc': incc_a,
-                                'ipca': 0.0,
-                                'taxas_extra': extras_a,
-                                'Total de mudança (R$)': abat_a,
-                                'saldo': saldo
-                            })
-                        pre_count += 1
-                        prev_date = d_evt
-                        cursor += relativedelta(months=1)
-
-
-                    # 2) ENTREGA ------------------------------------------------------
-                    ent = data_entrega
-                    zero_extras = [0.0] * len(taxas_extras)
-                    # abatimentos
-                    for desc, v in [('Abatimento FGTS', fgts), ('Abatimento Fin. Banco', fin_banco)]:
-                        saldo -= v
-                        eventos.append({'data': ent, 'parcela': '', 'tipo': desc, 'valor': v,
-                                        'juros': 0.0, 'dias_corridos': '', 'taxa_efetiva': '',
-                                        'incc': 0.0, 'ipca': 0.0, 'taxas_extra': zero_extras,
-                                        'Total de mudança (R$)': v, 'saldo': saldo})
-                    # taxas de emissão e registro
-                    for nome, val in [('Emissão CCB', TAXA_EMISSAO_CCB), ('Alienação Fiduciária', TAXA_EMISSAO_CONTRATO_ALIENACAO_FIDUCIARIA),
-                                    ('Registro', TAXA_REGISTRO_IMOVEL), ('Escritura Imóvel', TAXA_ESCRITURA_IMOVEL)]:
-                        saldo += val
-                    # seguro prestamista
-                    fee = saldo * TAXA_SEGURO_PRESTAMISTA_PCT
-                    saldo += fee
-                    
-                    #Data da entrega
-                    eventos.append({
-                        'data': data_entrega,
-                        'parcela': '',
-                        'tipo': 'Data da entrega das chaves',
-                        'valor': "-",
-                        'juros': "-",
-                        'dias_corridos': "-",
-                        'taxa_efetiva': "-",
-                        'incc': "-",
-                        'ipca': "-",
-                        'taxas_extra': "-",
-                        'Total de mudança (R$)': "-",
-                        'saldo': saldo
-                    })
-
-                    # 3) PÓS-ENTREGA --------------------------------------------------
-                    tracker_pos = PaymentTracker(dia_pagamento, taxa_pos)
-                    tracker_pos.last_date = data_entrega
-                    prev_date = data_entrega
-                    cursor = data_entrega
-                    post_count = 1
-                    parcelas = 1
-                    while saldo > 0:
-                        d_evt = adjust_day(cursor + relativedelta(months=1), dia_pagamento)
-                        # não-recorrentes pós não associados entre prev_date e d_evt
-                        for ev_nr in [e for e in post_nr if not e['assoc'] and prev_date < e['data'] < d_evt]:
-                            juros, dias_corr, taxa_eff = tracker_pos.calculate(ev_nr['data'], saldo)
-                            ipca_nr = saldo * TAXA_IPCA
-                            extras_nr = [saldo * t['pct'] if t['periodo'] in ['pós-entrega da chave', 'ambos'] else 0.0 for t in taxas_extras]
-                            total_taxas_nr = sum(extras_nr) + ipca_nr
-                            abat_nr = ev_nr['valor'] - juros - total_taxas_nr
-                            saldo -= abat_nr
-                            eventos.append({**ev_nr,'parcela': parcelas, 'juros': juros, 'dias_corridos': dias_corr, 'taxa_efetiva': taxa_eff,
-                                            'incc': 0.0, 'ipca': ipca_nr, 'taxas_extra': extras_nr,
-                                            'Total de mudança (R$)': abat_nr, 'saldo': saldo})
-
-                        # parcela mensal pós-entrega (com associações)
-                        # 1) parcela mensal pós (sem associados)
-                        juros, dias_corr, txef = tracker_pos.calculate(d_evt, saldo)
-                        ipca = saldo * TAXA_IPCA
-                        extras = [saldo * t['pct'] for t in taxas_extras if t['periodo'] in ['pós-entrega da chave','ambos']]
-                        abat_princ = capacidade_pos - juros - (ipca + sum(extras))
-                        saldo -= abat_princ
-                        eventos.append({
-                            'data': d_evt,
-                            'parcela': post_count,
-                            'tipo': f"{post_count}ª Parcela Pós-Entrega",
-                            'valor': capacidade_pos,
-                            'juros': juros,
-                            'dias_corridos': dias_corr,
-                            'taxa_efetiva': txef,
-                            'incc': 0.0,
-                            'ipca': ipca,
-                            'taxas_extra': extras,
-                            'Total de mudança (R$)': abat_princ,
-                            'saldo': saldo
-                        })
-
-                        # 2) cada pagamento adicional associado em linha própria
-                        for ev_assoc in [e for e in post_nr if e['assoc'] and e['data'] == d_evt]:
-                            juros_a, dias_a, txef_a = tracker_pos.calculate(ev_assoc['data'], saldo)
-                            ipca_a = saldo * TAXA_IPCA
-                            extras_a = [saldo * t['pct'] for t in taxas_extras if t['periodo'] in ['pós-entrega da chave','ambos']]
-                            total_taxas_a = ipca_a + sum(extras_a)
-                            abat_a = ev_assoc['valor'] - juros_a - total_taxas_a
-                            saldo -= abat_a
-                            eventos.append({
-                                'data': d_evt,
-                                'parcela': '',
-                                'tipo': ev_assoc['tipo'],
-                                'valor': ev_assoc['valor'],
-                                'juros': juros_a,
-                                'dias_corridos': dias_a,
-                                'taxa_efetiva': txef_a,
-                                'incc': 0.0,
-                                'ipca': ipca_a,
-                                'taxas_extra': extras_a,
-                                'Total de mudança (R$)': abat_a,
-                                'saldo': saldo
-                            })
-                            
-                        post_count += 1
-                        parcelas += 1
-                        prev_date = d_evt
-                        cursor = d_evt
-
-                    # --- Montar planilha ---
-                    wb = Workbook()
-                    ws = wb.active
-                    ws.title = f"Financ-{cliente}"[:31]
-
-
-                    headers = ["Data","Tipo","Valor Pago (R$)"]
-                    for i, h in enumerate(headers, 1):
-                        cell = ws.cell(row=1, column=i, value=h)
-                        cell.fill = HEADER_FILL
-                        cell.font = Font(bold=True)
-                    # linha inicial
-                    ws.append(["-", "-", valor_imovel])
-                    # eventos
-                    for ev in sorted(eventos, key=lambda x: x['data']):
-                        row = [ev['data'], ev['tipo'], ev.get('valor', 0)]
-                        ws.append(row)
-                        
-                    # 3) Insere linha em branco
-                    ws.append([''] * len(headers))
-                    
-                    # 4) Insere linha de TOTAIS
-                    soma_total = sum(ev['valor'] for ev in eventos if isinstance(ev['valor'], (int, float)))
-                    ws.append(['TOTAIS', '', soma_total])
-                    totals_row = ws.max_row
-                    ws.cell(row=totals_row, column=1).fill = HEADER_FILL
-                    ws.cell(row=totals_row, column=1).font = Font(bold=True)
-
-                    # Formatação de colunas
-                    for col_idx, h in enumerate(headers, start=1):
-                        for row_idx in range(2, ws.max_row + 1):
-                            cell = ws.cell(row=row_idx, column=col_idx)
-                            if col_idx == 1:
-                                cell.number_format = DATE_FORMAT
-                            else:
-                                cell.number_format = CURRENCY_FORMAT
-
-                    # Ajuste automático de largura
-                    for col_cells in ws.columns:
-                        max_length = max(len(str(c.value)) for c in col_cells if c.value is not None)
-                        ws.column_dimensions[get_column_letter(col_cells[0].column)].width = max_length + 2
-
-                    # Se excedeu parcelas e ainda há saldo devedor
-                    if parcelas > 420 and saldo < 0:
-                        st.error(
-                            f"Financiamento de {cliente} não é possível! "
-                            "A quantidade de parcelas excede 420 e o saldo devedor continua positivo."
-                            f"Restariam {cliente} do saldo devedor."
-                            "Simule novamente"
-                            )
-                    
-                    # download
-                    buf = BytesIO()
-                    wb.save(buf)
-                    buf.seek(0)
-                    st.download_button("Download Excel", data=buf,
-                                    file_name=f"Financiamento {cliente}.xlsx",
-                                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
-
-            if __name__ == "__main__":
-                main()
+            st.rerun()
         else:
             st.error("Erro no login! Suas credenciais estão incorretas. " \
             "\nCaso não tenha uma credencial, entre em contato " \
             "\n com um gerente: (11)3047-2555")
 
+
+# --- App Streamlit ---
+def formulario_cenario(taxas_por_emp):
+    # As entradas ficam num formulário: editar um campo não reexecuta nada;
+    # o cenário só é montado (e guardado na sessão) ao clicar em "Aplicar"
+    with st.form("form_cenario"):
+        # Entradas básicas
+        cliente = st.text_input("Qual o nome do cliente?")
+        valor_imovel = st.number_input("Qual o valor total do imóvel (R$)", min_value=0.0, step=0.01, format="%.2f")
+        dia_pagamento = st.number_input("Qual o dia preferencial de pagamento das parcelas mensais? (1-31)", min_value=1, max_value=31, step=1)
+
+        empreendimento = st.selectbox("Selecione o empreendimento", options=list(taxas_por_emp.keys()))
+
+        # Datas e valores adicionais
+        data_base_date = st.date_input("Data-base (data de assinatura do contrato)", value=dt.now().date())
+        capacidade_pre = st.number_input("Qual a capacidade de pagamento do cliente nas parcelas mensais ANTES da entrega das chaves? (R$)", min_value=0.0, step=0.01)
+        data_inicio_pre = st.date_input("Data início dos pagamentos mensais durante a construção (pré-entrega)")
+        data_entrega = st.date_input("Data de CONCLUSÃO da obra e entrega das chaves")
+        fgts = st.number_input("Valor do FGTS para abatimento do saldo devedor (R$)", min_value=0.0, step=0.01)
+        fin_banco = st.number_input("Valor financiado pelo banco (abatimento no saldo devedor) (R$)", min_value=0.0, step=0.01)
+        capacidade_pos_antes = st.number_input("Qual a capacidade de pagamento do cliente nas parcelas mensais DEPOIS da entrega das conclusão da obra? (R$)", min_value=0.0, step=0.01)
+        val_parcela_banco = st.number_input("Qual o valor da parcela mensal para pagamento do financiamento do banco? (R$)", min_value=0.0, step=0.01)
+        prazo_alvo = st.number_input("Prazo desejado (quantidade de parcelas pós-entrega)", min_value=1, max_value=HORIZONTE_PARCELAS, value=HORIZONTE_PARCELAS, step=1)
+
+        # Pagamentos não recorrentes e séries: uma tabela cada, linhas adicionadas com "+"
+        st.subheader("Pagamentos adicionais às parcelas")
+        non_rec = st.data_editor(st.session_state.tabelas['non_rec'], num_rows="dynamic", column_config=COLUNAS_PAGAMENTOS,
+                                 hide_index=True, key="nr_tabela")
+        st.subheader("Pagamentos Semestrais")
+        st.caption("Data da primeira parcela semestral; as seguintes caem a cada 6 meses.")
+        semi = st.data_editor(st.session_state.tabelas['semi'], num_rows="dynamic", column_config=COLUNAS_PAGAMENTOS,
+                              hide_index=True, key="s_tabela")
+        st.subheader("Pagamentos Anuais")
+        st.caption("Data da primeira parcela anual; as seguintes caem a cada 12 meses.")
+        anual = st.data_editor(st.session_state.tabelas['anual'], num_rows="dynamic", column_config=COLUNAS_PAGAMENTOS,
+                               hide_index=True, key="a_tabela")
+
+        if not st.form_submit_button("Aplicar"):
+            return
+
+    cenario = {
+        'cliente': cliente,
+        'valor_imovel': valor_imovel,
+        'dia_pagamento': dia_pagamento,
+        'taxas_sel': taxas_por_emp.get(empreendimento, Taxas()),
+        'data_base': dt.combine(data_base_date, time()),
+        'capacidade_pre': capacidade_pre,
+        'data_inicio_pre': dt.combine(data_inicio_pre, time()),
+        'data_entrega': dt.combine(data_entrega, time()),
+        'fgts': fgts,
+        'fin_banco': fin_banco,
+        'capacidade_pos_antes': capacidade_pos_antes,
+        'val_parcela_banco': val_parcela_banco,
+        'non_rec': [{'data': l['data'], 'tipo': l['descricao'] if isinstance(l['descricao'], str) else '',
+                     'valor': l['valor'], 'assoc': l['assoc']}
+                    for l in linhas_preenchidas(non_rec)],
+        'semi_series': [{'d0': l['data'], 'v': l['valor'], 'assoc': l['assoc'], 'tipo': 'Pagamento Semestral'}
+                        for l in linhas_preenchidas(semi)],
+        'annual_series': [{'d0': l['data'], 'v': l['valor'], 'assoc': l['assoc'], 'tipo': 'Pagamento Anual'}
+                          for l in linhas_preenchidas(anual)],
+    }
+    # resultados calculados para o cenário anterior deixam de valer
+    st.session_state.cenario = cenario
+    st.session_state.prazo_alvo = int(prazo_alvo)
+    invalida(SECOES_CENARIO)
+
+
+def secao_metas(cenario, prazo_alvo):
+    # Calculadora de metas (sem gerar a planilha); forma fechada, roda na hora
+    st.subheader("Calculadora de metas")
+    if st.button("Calcular metas"):
+        prazo = prazo_quitacao(cenario)
+        if prazo is None:
+            linhas = [f"Com a capacidade informada o saldo não é quitado em {HORIZONTE_PARCELAS} parcelas."]
+        else:
+            linhas = [f"Com a capacidade informada o saldo é quitado em {prazo} parcelas pós-entrega."]
+        linhas.append(f"Capacidade mínima (depois da entrega) para quitar em {prazo_alvo} parcelas: R$ {capacidade_minima(cenario, prazo_alvo):,.2f}")
+        linhas.append(f"Valor máximo do imóvel para a capacidade informada em {prazo_alvo} parcelas: R$ {valor_maximo_imovel(cenario, prazo_alvo):,.2f}")
+        st.session_state.resultados['metas'] = linhas
+    for linha in st.session_state.resultados.get('metas', []):
+        st.write(linha)
+
+
+def secao_sensibilidade(cenario, prazo_alvo):
+    # Análise de sensibilidade: grade "e se?" calculada em paralelo
+    st.subheader("Análise de sensibilidade")
+    opcoes = list(PARAMETROS_SENSIBILIDADE)
+    with st.form("form_sensibilidade"):
+        eixo_x = st.selectbox("Parâmetro do eixo X", opcoes, format_func=PARAMETROS_SENSIBILIDADE.get)
+        eixo_y = st.selectbox("Parâmetro do eixo Y", opcoes, index=1, format_func=PARAMETROS_SENSIBILIDADE.get)
+        eixo_z = st.selectbox("3º parâmetro (opcional)", [None] + opcoes,
+                              format_func=lambda p: PARAMETROS_SENSIBILIDADE.get(p, "Nenhum"))
+        variacao = st.slider("Variação em torno do valor informado (± %)", min_value=5, max_value=50, value=20, step=5) / 100
+        n_pontos = st.slider("Pontos por parâmetro", min_value=3, max_value=20, value=20)
+        calcular = st.form_submit_button("Calcular sensibilidade")
+    metrica = st.selectbox("Métrica", list(METRICAS_SENSIBILIDADE), format_func=METRICAS_SENSIBILIDADE.get)
+
+    if calcular:
+        escolhidos = [p for p in (eixo_x, eixo_y, eixo_z) if p]
+        if len(set(escolhidos)) < len(escolhidos):
+            st.error("Escolha parâmetros diferentes para cada eixo.")
+        else:
+            eixos = {}
+            for parametro in (eixo_x, eixo_y, eixo_z):
+                if parametro == PRAZO:
+                    eixos[parametro] = eixo_prazo(max(1, round(prazo_alvo * (1 - variacao))), round(prazo_alvo * (1 + variacao)), n_pontos)
+                elif parametro:
+                    eixos[parametro] = sorted(set(eixo_percentual(valor_base(cenario, parametro), variacao, n_pontos)))
+            if any(len(valores) < 2 for valores in eixos.values()):
+                st.warning("Algum parâmetro escolhido está zerado; não há o que variar em torno dele.")
+            total = 1
+            for valores in eixos.values():
+                total *= len(valores)
+            linhas = []
+            if dispara('sensibilidade', calcula_sensibilidade, cenario, eixos, linhas):
+                st.session_state.sensibilidade_config = {'eixos': (eixo_x, eixo_y, eixo_z), 'total': total, 'linhas': linhas}
+
+    config = st.session_state.get('sensibilidade_config')
+    if pendente('sensibilidade'):
+        def parcial():
+            # cópia: a lista continua crescendo na thread da tarefa
+            linhas = list(config['linhas'])
+            st.progress(len(linhas) / config['total'], text=f"{len(linhas)} de {config['total']} pontos")
+            if linhas:
+                st.altair_chart(grafico_sensibilidade(linhas, *config['eixos'][:2], metrica, config['eixos'][2]))
+        acompanha('sensibilidade', "Calculando...", parcial)
+    elif recolhe('sensibilidade') is not None:
+        linhas = st.session_state.resultados['sensibilidade']
+        st.altair_chart(grafico_sensibilidade(linhas, *config['eixos'][:2], metrica, config['eixos'][2]))
+        st.dataframe(pd.DataFrame(linhas).rename(columns={**PARAMETROS_SENSIBILIDADE, **METRICAS_SENSIBILIDADE}))
+
+
+def secao_monte_carlo(cenario, prazo_alvo):
+    # Projeção estocástica: INCC/IPCA sorteados mês a mês (Monte Carlo)
+    st.subheader("Projeção estocástica de INCC e IPCA")
+    with st.form("form_monte_carlo"):
+        n_caminhos = st.number_input("Quantidade de caminhos", min_value=100, max_value=100000, value=10000, step=1000)
+        fonte = st.radio("Origem dos índices", ["Passeio aleatório com reversão à média", "Série histórica (CSV)"])
+        st.caption("Passeio aleatório:")
+        volatilidade = st.number_input("Volatilidade mensal dos índices (%)", min_value=0.0, value=0.2, step=0.05, format="%.2f") / 100
+        reversao = st.slider("Velocidade de reversão à média", min_value=0.0, max_value=1.0, value=0.1, step=0.05)
+        correlacao = st.slider("Correlação INCC x IPCA", min_value=-1.0, max_value=1.0, value=0.7, step=0.1)
+        st.caption("Série histórica: CSV com as colunas: mes, incc, ipca (índices mensais em %)")
+        serie_csv = st.file_uploader("Arquivo CSV com a série histórica", type=["csv"])
+        projetar = st.form_submit_button("Projetar")
+
+    if projetar:
+        try:
+            if fonte.startswith("Série"):
+                if serie_csv is None:
+                    raise ValueError("Envie o CSV com a série histórica.")
+                serie = le_serie_historica(io.TextIOWrapper(serie_csv, encoding='utf-8-sig'))
+                dispara('monte_carlo', projeta, cenario, int(n_caminhos), prazo_alvo, fonte='historico', serie=serie)
+            else:
+                dispara('monte_carlo', projeta, cenario, int(n_caminhos), prazo_alvo, volatilidade=volatilidade,
+                        reversao=reversao, correlacao=correlacao)
+        except ValueError as e:
+            st.error(str(e))
+
+    if pendente('monte_carlo'):
+        acompanha('monte_carlo', "Projetando os caminhos...")
+    elif (projecao := recolhe('monte_carlo')) is not None:
+        referencia = projecao['deterministico']['mes_quitacao']
+        st.write(f"Probabilidade de quitar em até {projecao['horizonte']} parcelas pós-entrega: {projecao['prob_quitacao']:.1%} "
+                 f"(com os índices fixos do taxas.txt: {'quita em ' + str(referencia) + ' parcelas' if referencia else 'não quita'}).")
+        st.dataframe(pd.DataFrame({
+            "Parcelas pós-entrega até quitar": {f"P{p}": str(v) if v is not None else f"> {projecao['horizonte']}" for p, v in projecao['mes_quitacao'].items()},
+            "Total pago (R$)": {f"P{p}": v for p, v in projecao['total_pago'].items()},
+        }))
+        st.line_chart(pd.DataFrame({f"P{p}": faixa for p, faixa in projecao['saldo'].items()},
+                                   index=pd.to_datetime(projecao['datas'])))
+
+
+def secao_planilha(cenario):
+    # Geração da planilha
+    with st.form("form_planilha"):
+        capturar_perfil = st.checkbox("Capturar perfil de desempenho (cProfile) desta geração")
+        gerar = st.form_submit_button("Gerar Planilha")
+    if gerar:
+        dispara('planilha', gera_planilha, cenario, capturar_perfil, st.session_state.simulador)
+
+    if pendente('planilha'):
+        acompanha('planilha', "Gerando a planilha...")
+    elif (gerada := recolhe('planilha')) is not None:
+        resultado = gerada['resultado']
+        saldo = resultado['saldo']
+        if gerada['perfil_texto']:
+            with st.expander(f"Perfil salvo em {gerada['perfil_arquivo']}"):
+                st.code(gerada['perfil_texto'])
+
+        # Se excedeu parcelas ou não amortiza e ainda há saldo devedor
+        if not resultado['viavel']:
+            st.error(
+                f"Financiamento de {cenario['cliente']} não é possível! "
+                f"{resultado['motivo']} "
+                f"Restariam R$ {saldo:,.2f} do saldo devedor. "
+                "Simule novamente"
+                )
+
+        # download
+        st.download_button("Download Excel", data=gerada['xlsx'],
+                        file_name=f"Financiamento {cenario['cliente']}.xlsx",
+                        mime=XLSX_MIME)
+
+
+def leitor_arquivo(arquivo):
+    # o download_button não aceita o SpooledTemporaryFile do lote: o conteúdo
+    # é lido só quando o botão é clicado (fora da execução da página)
+    def le():
+        arquivo.seek(0)
+        return arquivo.read()
+    return le
+
+
+def secao_lote(taxas_por_emp):
+    # Exportação em lote (vários clientes a partir de um CSV)
+    st.subheader("Exportação em lote")
+    st.caption("CSV com as colunas: " + ", ".join(COLUNAS_CSV))
+    with st.form("form_lote"):
+        arquivo_csv = st.file_uploader("Arquivo CSV com os cenários", type=["csv"])
+        formato_lote = st.radio("Formato", ["Uma planilha (uma aba por cliente)", "ZIP (uma planilha por cliente)"])
+        gerar = st.form_submit_button("Gerar Lote")
+    if gerar and arquivo_csv is None:
+        st.warning("Envie o CSV com os cenários.")
+    elif gerar:
+        try:
+            cenarios = le_cenarios_csv(io.TextIOWrapper(arquivo_csv, encoding='utf-8-sig'), taxas_por_emp)
+        except ValueError as e:
+            st.error(str(e))
+        else:
+            zip_lote = formato_lote.startswith("ZIP")
+            if dispara('lote', exporta_lote, cenarios, 'zip' if zip_lote else 'xlsx'):
+                st.session_state.lote_zip = zip_lote
+
+    if pendente('lote'):
+        acompanha('lote', "Gerando o lote...")
+    elif (saida := recolhe('lote')) is not None:
+        zip_lote = st.session_state.lote_zip
+        st.download_button("Download Lote", data=leitor_arquivo(saida),
+                        file_name="Financiamentos.zip" if zip_lote else "Financiamentos.xlsx",
+                        mime="application/zip" if zip_lote else XLSX_MIME)
+
+
+def main():
+    st.title("Bem-vindo ao gerador de financiamento da Br Financial!")
+
+    # Carrega taxas externas
+    taxas_path = 'taxas.txt'
+    CACHE.sincroniza_taxas(taxas_path)
+    try:
+        taxas_por_emp = load_taxas(taxas_path)
+    except (FileNotFoundError, ValueError) as e:
+        st.error(str(e))
+        taxas_por_emp = {}
+
+    formulario_cenario(taxas_por_emp)
+    cenario = st.session_state.get('cenario')
+    if cenario is None:
+        st.info("Preencha os dados do cliente e clique em Aplicar.")
+    else:
+        prazo_alvo = st.session_state.prazo_alvo
+        secao_metas(cenario, prazo_alvo)
+        secao_sensibilidade(cenario, prazo_alvo)
+        secao_monte_carlo(cenario, prazo_alvo)
+        secao_planilha(cenario)
+    secao_lote(taxas_por_emp)
+
+
 def logout():
     if st.sidebar.button("Logout"):
         st.session_state.authenticated = False
+        st.rerun()
 
 # Check login status
 if not st.session_state.authenticated:
@@ -471,7 +494,4 @@ if not st.session_state.authenticated:
 else:
     st.sidebar.success(f"Logged in as {USERNAME}")
     logout()
-
-    # 🔐 Protected content
-    st.title("BR Financial Dashboard")
-    st.write("Here is your secure content.")
+    main()
@@ -0,0 +1,132 @@
+import threading
+from datetime import datetime as dt
+
+from metricas import SEM_MEDICAO
+from motor import (HORIZONTE_PARCELAS, adjust_day, as_datetime, calendario_pos, como_taxas,
+                   percentuais_por_periodo, simulate, taxas_extras_de, total_pagamentos)
+
+# Re-simulação incremental: numa sessão interativa, a simulação seguinte
+# costuma diferir da anterior em um único campo (uma parcela anual no fim do
+# contrato, a capacidade pós-entrega...). O motor registra pontos de controle
+# (motor.PontoControle) e a nova simulação continua do último ponto anterior à
+# primeira data afetada pela mudança, copiando as linhas até ali.
+
+INICIO = dt.min     # a mudança afeta desde a data-base: simula tudo de novo
+SEM_MUDANCA = dt.max
+
+
+def _fases_taxas(cenario):
+    # o que cada fase lê das taxas: juros e índices da fase, extras *_PCT
+    # (um por taxa, então o número de colunas também conta) e custos da entrega
+    taxas = como_taxas(cenario.get('taxas_sel'))
+    pcts_pre, pcts_pos = percentuais_por_periodo(taxas_extras_de(taxas))
+    pre = (taxas.taxa_pre, taxas.TAXA_INCC, tuple(pcts_pre))
+    entrega = (taxas.TAXA_EMISSAO_CCB, taxas.TAXA_EMISSAO_CONTRATO_ALIENACAO_FIDUCIARIA, taxas.TAXA_REGISTRO_IMOVEL,
+               taxas.TAXA_ESCRITURA_IMOVEL, taxas.TAXA_SEGURO_PRESTAMISTA_PCT)
+    pos = (taxas.taxa_pos, taxas.TAXA_IPCA, tuple(pcts_pos))
+    return pre, entrega, pos
+
+
+def _entradas(cenario, max_parcelas=HORIZONTE_PARCELAS) -> dict:
+    # o que a simulação lê do cenário, agrupado pela fase que cada parte afeta
+    dia = int(cenario['dia_pagamento'])
+    data_entrega = as_datetime(cenario['data_entrega'])
+    pre_taxas, entrega_taxas, pos_taxas = _fases_taxas(cenario)
+    non_rec = sorted(
+        ((adjust_day(as_datetime(e['data']), dia) if e['assoc'] else as_datetime(e['data']),
+          e['tipo'], e['valor'], e['assoc']) for e in cenario.get('non_rec', [])),
+        key=lambda e: e[0])
+    series = [[(adjust_day(as_datetime(s['d0']), dia) if s['assoc'] else as_datetime(s['d0']), s['v'], s['assoc'],
+                s.get('tipo'), meses) for s in cenario.get(chave, [])]
+              for chave, meses in (('semi_series', 6), ('annual_series', 12))]
+    # total dos pagamentos até a última parcela possível, que o motor desconta
+    # do saldo ao checar se a parcela pós amortiza
+    horizonte = calendario_pos(data_entrega, dia).data(max_parcelas - 1)
+    return {
+        'pre': (cenario['valor_imovel'], dia, as_datetime(cenario['data_base']),
+                as_datetime(cenario['data_inicio_pre']), cenario.get('capacidade_pre', 0.0), pre_taxas),
+        'data_entrega': data_entrega,
+        'entrega': (cenario.get('fgts', 0.0), cenario.get('fin_banco', 0.0), entrega_taxas),
+        'pos': (cenario.get('capacidade_pos_antes', 0.0) - cenario.get('val_parcela_banco', 0.0), pos_taxas),
+        'pagamentos': [non_rec] + series,
+        'total_pagamentos': total_pagamentos(cenario, dia, horizonte),
+    }
+
+
+def _primeira_diferenca(a, b):
+    # listas ordenadas de pagamentos ou séries (data da 1ª ocorrência na
+    # posição 0): menor data a partir da primeira posição que difere
+    i = next((i for i, (x, y) in enumerate(zip(a, b)) if x != y), min(len(a), len(b)))
+    return min((e[0] for e in a[i:] + b[i:]), default=SEM_MUDANCA)
+
+
+def _data_afetada(anterior: dict, novo: dict) -> dt:
+    if anterior['pre'] != novo['pre']:
+        return INICIO
+    entrega = novo['data_entrega']
+    afetada = SEM_MUDANCA
+    if anterior['data_entrega'] != entrega:
+        afetada = min(anterior['data_entrega'], entrega)
+    elif anterior['entrega'] != novo['entrega']:
+        afetada = entrega
+    elif anterior['pos'] != novo['pos']:
+        # a partir da 1ª parcela pós: o ponto do início do pós-entrega vale
+        afetada = calendario_pos(entrega, novo['pre'][1]).data(0)
+
+    for a, n in zip(anterior['pagamentos'], novo['pagamentos']):
+        afetada = min(afetada, _primeira_diferenca(a, n))
+    # antes da primeira diferença, o que falta pagar muda pela diferença dos
+    # totais: com total menor a checagem de amortização pode parar o pós-entrega
+    # mais cedo, a partir da 2ª parcela
+    if novo['total_pagamentos'] < anterior['total_pagamentos']:
+        afetada = min(afetada, calendario_pos(entrega, novo['pre'][1]).data(0))
+    return afetada
+
+
+def data_afetada(anterior: dict, novo: dict) -> dt:
+    # Primeira data em que os dois cenários podem divergir: os pontos de
+    # controle com data anterior a ela continuam valendo para o novo.
+    # INICIO se nada é aproveitável; SEM_MUDANCA se o resultado é o mesmo.
+    return _data_afetada(_entradas(anterior), _entradas(novo))
+
+
+class SimulacaoIncremental:
+    # Última simulação de uma sessão e os pontos de controle dela. Uma
+    # instância por sessão; as simulações da mesma instância rodam uma de cada
+    # vez (a tela dispara tarefas em threads e uma pode começar antes de a
+    # anterior terminar).
+    def __init__(self):
+        self.entradas = None
+        self.opcoes = None
+        self.resultado = None
+        self.pontos = []
+        self.retomada = None     # ponto de onde a última simulação continuou (None = do início)
+        self._lock = threading.Lock()
+
+    def simula(self, cenario: dict, medicao=SEM_MEDICAO, **opcoes) -> dict:
+        # mesmo retorno de motor.simulate (opcoes: vetorizado, parcelas_fixas,
+        # max_parcelas); o resultado é compartilhado, não alterar
+        with self._lock:
+            return self._simula(cenario, medicao, opcoes)
+
+    def _simula(self, cenario, medicao, opcoes):
+        ponto = None
+        entradas = _entradas(cenario, opcoes.get('max_parcelas', HORIZONTE_PARCELAS))
+        if self.resultado is not None and opcoes == self.opcoes:
+            afetada = _data_afetada(self.entradas, entradas)
+            if afetada == SEM_MUDANCA:
+                medicao.conta('simulacoes_reaproveitadas')
+                return self.resultado
+            validos = [i for i, p in enumerate(self.pontos) if p.data < afetada]
+            if validos:
+                ponto = self.pontos[validos[-1]]
+                self.pontos = self.pontos[:validos[-1] + 1]
+        novos = []
+        resultado = simulate(cenario, medicao=medicao, pontos=novos,
+                             retomada=(ponto, self.resultado) if ponto else None, **opcoes)
+        self.pontos = (self.pontos if ponto else []) + novos
+        self.entradas = entradas
+        self.opcoes = opcoes
+        self.resultado = resultado
+        self.retomada = ponto
+        return resultado
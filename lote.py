@@ -0,0 +1,168 @@
+import csv
+import math
+import re
+import shutil
+import zipfile
+from datetime import datetime as dt
+from tempfile import SpooledTemporaryFile
+
+from openpyxl import Workbook
+
+from motor import simulate_iter
+from planilha import INVALIDOS_ABA, cria_resumo, escreve_aba, escreve_resumo, monta_planilha, soma_valores
+
+# Exportação em lote: vários cenários (ex.: de um CSV) numa planilha com uma
+# aba por cliente, ou num ZIP com uma planilha por cliente. A saída é montada
+# num arquivo temporário que só vai para o disco quando passa de ESPACO_MEMORIA.
+
+ESPACO_MEMORIA = 32 * 1024 * 1024
+COLUNAS_CSV = [
+    'cliente', 'empreendimento', 'valor_imovel', 'dia_pagamento', 'data_base',
+    'capacidade_pre', 'data_inicio_pre', 'data_entrega', 'fgts', 'fin_banco',
+    'capacidade_pos_antes', 'val_parcela_banco',
+]
+OBRIGATORIAS = {'cliente', 'empreendimento', 'valor_imovel', 'dia_pagamento',
+                'data_base', 'data_inicio_pre', 'data_entrega'}
+_DATAS = {'data_base', 'data_inicio_pre', 'data_entrega'}
+_INVALIDOS_ARQUIVO = re.compile(r'[<>:"/\\|?*]')
+_MILHAR = re.compile(r'^-?\d{1,3}(\.\d{3})+$')
+
+
+def _numero(texto, coluna):
+    texto = texto.strip()
+    if not texto:
+        return 0.0
+    if ',' in texto or _MILHAR.match(texto):
+        # formato brasileiro: 1.234,56 ou 350.000 (ponto só como milhar)
+        texto = texto.replace('.', '').replace(',', '.')
+    try:
+        valor = float(texto)
+    except ValueError:
+        valor = math.nan
+    if not math.isfinite(valor):
+        raise ValueError(f"'{coluna}' deve ser numérico")
+    if valor < 0:
+        raise ValueError(f"'{coluna}' não pode ser negativo")
+    return valor
+
+
+def _dia(texto):
+    try:
+        dia = int(texto.strip())
+    except ValueError:
+        dia = 0
+    if not 1 <= dia <= 31:
+        raise ValueError("'dia_pagamento' deve ser um inteiro de 1 a 31")
+    return dia
+
+
+def _data(texto, coluna):
+    texto = texto.strip()
+    try:
+        if '/' in texto:
+            return dt.strptime(texto, '%d/%m/%Y')
+        return dt.fromisoformat(texto)
+    except ValueError:
+        raise ValueError(f"'{coluna}' deve ser uma data DD/MM/AAAA ou AAAA-MM-DD") from None
+
+
+def le_cenarios_csv(arquivo, taxas_por_emp) -> list:
+    # arquivo: texto com cabeçalho; separador ',' ou ';'
+    conteudo = arquivo.read()
+    try:
+        dialeto = csv.Sniffer().sniff(conteudo.splitlines()[0] if conteudo else ',', delimiters=',;')
+    except csv.Error:
+        raise ValueError("O cabeçalho do CSV deve separar as colunas com ',' ou ';'") from None
+    leitor = csv.DictReader(conteudo.splitlines(), dialect=dialeto)
+    faltando = OBRIGATORIAS - set(leitor.fieldnames or [])
+    if faltando:
+        raise ValueError(f"Colunas obrigatórias ausentes no CSV: {', '.join(sorted(faltando))}")
+    cenarios = []
+    for n, linha in enumerate(leitor, start=2):
+        # linhas curtas deixam as últimas colunas como None
+        linha = {coluna: valor or '' for coluna, valor in linha.items()}
+        try:
+            empreendimento = linha['empreendimento'].strip()
+            if empreendimento not in taxas_por_emp:
+                raise ValueError(f"empreendimento desconhecido '{empreendimento}'")
+            cenario = {'cliente': linha['cliente'].strip(), 'taxas_sel': taxas_por_emp[empreendimento],
+                       'non_rec': [], 'semi_series': [], 'annual_series': []}
+            for coluna in COLUNAS_CSV[2:]:
+                valor = linha.get(coluna, '')
+                if coluna in _DATAS:
+                    cenario[coluna] = _data(valor, coluna)
+                elif coluna == 'dia_pagamento':
+                    cenario[coluna] = _dia(valor)
+                else:
+                    cenario[coluna] = _numero(valor, coluna)
+        except ValueError as e:
+            raise ValueError(f"CSV, linha {n}: {e}") from None
+        cenarios.append(cenario)
+    return cenarios
+
+
+def nomes_unicos(nomes, limite=None, invalidos=INVALIDOS_ABA, padrao='Cliente'):
+    # remove caracteres proibidos, corta no limite e numera os repetidos
+    usados = set()
+    saida = []
+    for nome in nomes:
+        base = invalidos.sub('_', str(nome)).strip() or padrao
+        candidato = base[:limite] if limite else base
+        n = 2
+        while candidato.lower() in usados:
+            sufixo = f" ({n})"
+            candidato = (base[:limite - len(sufixo)] if limite else base) + sufixo
+            n += 1
+        usados.add(candidato.lower())
+        saida.append(candidato)
+    return saida
+
+
+def _linha_resumo(cenario, resultado):
+    return (cenario.get('cliente', ''), resultado['parcelas'] - 1, soma_valores(resultado['eventos']),
+            resultado['saldo'], resultado['viavel'], resultado['motivo'])
+
+
+def _exporta_xlsx(cenarios, resultados, destino):
+    wb = Workbook(write_only=True)
+    resumo = cria_resumo(wb)
+    # "Resumo" já está em uso pela aba de resumo
+    titulos = nomes_unicos(['Resumo'] + [c.get('cliente', '') for c in cenarios], limite=31)[1:]
+    linhas = []
+    for cenario, resultado, titulo in zip(cenarios, resultados, titulos):
+        escreve_aba(wb, titulo, resultado['eventos'], cenario['valor_imovel'])
+        linhas.append(_linha_resumo(cenario, resultado))
+    escreve_resumo(resumo, linhas)
+    wb.save(destino)
+
+
+def _exporta_zip(cenarios, resultados, destino):
+    nomes = nomes_unicos([c.get('cliente', '') for c in cenarios], invalidos=_INVALIDOS_ARQUIVO)
+    linhas = []
+    # as planilhas já são comprimidas; o ZIP só as agrupa
+    with zipfile.ZipFile(destino, 'w', zipfile.ZIP_STORED) as zf:
+        for cenario, resultado, nome in zip(cenarios, resultados, nomes):
+            with SpooledTemporaryFile(max_size=ESPACO_MEMORIA) as tmp:
+                monta_planilha(resultado['eventos'], cenario.get('cliente', ''), cenario['valor_imovel']).save(tmp)
+                tmp.seek(0)
+                with zf.open(f"Financiamento {nome}.xlsx", 'w') as saida:
+                    shutil.copyfileobj(tmp, saida)
+            linhas.append(_linha_resumo(cenario, resultado))
+        wb = Workbook(write_only=True)
+        escreve_resumo(cria_resumo(wb), linhas)
+        with zf.open("Resumo.xlsx", 'w') as saida:
+            wb.save(saida)
+
+
+def exporta_lote(cenarios, formato='xlsx', max_workers=None):
+    # Simula os cenários no pool de processos e grava cada resultado assim que
+    # ele chega; devolve o arquivo temporário posicionado no início
+    cenarios = list(cenarios)
+    resultados = simulate_iter(cenarios, max_workers)
+    destino = SpooledTemporaryFile(max_size=ESPACO_MEMORIA)
+    if formato == 'zip':
+        _exporta_zip(cenarios, resultados, destino)
+    else:
+        _exporta_xlsx(cenarios, resultados, destino)
+    destino.seek(0)
+    return destino
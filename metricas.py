@@ -0,0 +1,182 @@
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+
+# Instrumentação por etapa: tempo de parede, iterações, eventos e bytes de cada
+# geração de planilha. Cada medição vira uma linha de log estruturado (JSON,
+# logger "financiamento.metricas") e é acumulada no registro do processo,
+# exportado no formato texto do Prometheus (arquivo e/ou endpoint /metricas).
+# Com perfil=True a medição também captura um cProfile da requisição.
+
+logger = logging.getLogger('financiamento.metricas')
+
+# limites (s) dos buckets do histograma de duração das etapas
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+METRICAS_ARQUIVO = os.environ.get('METRICAS_ARQUIVO')
+PASTA_PERFIS = os.environ.get('PERFIS_DIR', 'perfis')
+
+
+class Medicao:
+    # Uso:
+    #     with Medicao('gerar_planilha') as m:
+    #         with m.etapa('planilha'): ...
+    #         m.conta('bytes_escritos', n)
+    # Em laços longos (como no motor) as etapas podem ser marcadas em
+    # sequência com m.marca('pre'), m.marca('entrega'), ..., m.marca(None).
+    # registro=False: não acumula nem loga (ex.: no processo do pool, que
+    # devolve resumo() para o processo principal registrar)
+    def __init__(self, operacao, perfil=False, registro=None, **rotulos):
+        self.operacao = operacao
+        self.rotulos = rotulos
+        self.tempos = defaultdict(float)
+        self.contagens = defaultdict(int)
+        self.duracao = 0.0
+        self.perfil = cProfile.Profile() if perfil else None
+        self.perfil_arquivo = None
+        self.perfil_texto = None
+        self._registro = METRICAS if registro is None else registro
+        self._corrente = None
+        self._inicio = None
+
+    def __enter__(self):
+        self._inicio = time.perf_counter()
+        if self.perfil is not None:
+            self.perfil.enable()
+        return self
+
+    def __exit__(self, tipo, valor, tb):
+        self.marca(None)
+        if self.perfil is not None:
+            self.perfil.disable()
+            self._salva_perfil()
+        self.duracao = time.perf_counter() - self._inicio
+        if tipo is not None:
+            self.rotulos['erro'] = tipo.__name__
+        if self._registro:
+            self._registro.registra(self.resumo())
+        return False
+
+    @contextmanager
+    def etapa(self, nome):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.tempos[nome] += time.perf_counter() - t0
+
+    def marca(self, nome):
+        # encerra a etapa corrente (se houver) e começa `nome`
+        agora = time.perf_counter()
+        if self._corrente is not None:
+            self.tempos[self._corrente[0]] += agora - self._corrente[1]
+        self._corrente = (nome, agora) if nome is not None else None
+
+    def conta(self, nome, n=1):
+        self.contagens[nome] += n
+
+    def resumo(self) -> dict:
+        return {'operacao': self.operacao, 'duracao_s': self.duracao, 'etapas': dict(self.tempos),
+                'contagens': dict(self.contagens), 'rotulos': dict(self.rotulos),
+                'perfil': self.perfil_arquivo}
+
+    def _salva_perfil(self):
+        pasta = Path(PASTA_PERFIS)
+        pasta.mkdir(parents=True, exist_ok=True)
+        caminho = pasta / f"{self.operacao}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.prof"
+        self.perfil.dump_stats(caminho)
+        self.perfil_arquivo = str(caminho)
+        saida = io.StringIO()
+        pstats.Stats(self.perfil, stream=saida).sort_stats('cumulative').print_stats(30)
+        self.perfil_texto = saida.getvalue()
+
+
+class _SemMedicao:
+    # substituto sem custo quando ninguém está medindo
+    def etapa(self, nome):
+        return nullcontext()
+
+    def marca(self, nome):
+        pass
+
+    def conta(self, nome, n=1):
+        pass
+
+
+SEM_MEDICAO = _SemMedicao()
+
+
+class RegistroMetricas:
+    def __init__(self, arquivo=METRICAS_ARQUIVO):
+        self.arquivo = arquivo
+        self._lock = threading.Lock()
+        self._operacoes = defaultdict(int)
+        self._erros = defaultdict(int)
+        self._soma = defaultdict(float)            # (operacao, etapa) -> segundos
+        self._buckets = defaultdict(lambda: [0] * (len(BUCKETS) + 1))
+        self._contagens = defaultdict(int)         # (operacao, nome) -> total
+
+    def registra(self, resumo: dict):
+        # acumula uma medição (também as vindas de outros processos) e loga
+        operacao = resumo['operacao']
+        with self._lock:
+            self._operacoes[operacao] += 1
+            if 'erro' in resumo['rotulos']:
+                self._erros[operacao] += 1
+            for etapa, segundos in [('total', resumo['duracao_s'])] + list(resumo['etapas'].items()):
+                chave = (operacao, etapa)
+                self._soma[chave] += segundos
+                buckets = self._buckets[chave]
+                buckets[next((i for i, limite in enumerate(BUCKETS) if segundos <= limite), len(BUCKETS))] += 1
+            for nome, n in resumo['contagens'].items():
+                self._contagens[(operacao, nome)] += n
+        logger.info(json.dumps(resumo, ensure_ascii=False, default=str))
+        if self.arquivo:
+            self.escreve_prometheus(self.arquivo)
+
+    def texto_prometheus(self) -> str:
+        linhas = [
+            '# HELP financiamento_operacoes_total Operações medidas.',
+            '# TYPE financiamento_operacoes_total counter',
+        ]
+        with self._lock:
+            for operacao, n in sorted(self._operacoes.items()):
+                linhas.append(f'financiamento_operacoes_total{{operacao="{operacao}"}} {n}')
+            linhas += ['# HELP financiamento_erros_total Operações que terminaram com exceção.',
+                       '# TYPE financiamento_erros_total counter']
+            for operacao, n in sorted(self._erros.items()):
+                linhas.append(f'financiamento_erros_total{{operacao="{operacao}"}} {n}')
+            linhas += ['# HELP financiamento_etapa_segundos Tempo de parede por etapa.',
+                       '# TYPE financiamento_etapa_segundos histogram']
+            for (operacao, etapa), buckets in sorted(self._buckets.items()):
+                rotulo = f'operacao="{operacao}",etapa="{etapa}"'
+                acumulado = 0
+                for limite, n in zip(BUCKETS + ('+Inf',), buckets):
+                    acumulado += n
+                    linhas.append(f'financiamento_etapa_segundos_bucket{{{rotulo},le="{limite}"}} {acumulado}')
+                linhas.append(f'financiamento_etapa_segundos_sum{{{rotulo}}} {self._soma[(operacao, etapa)]}')
+                linhas.append(f'financiamento_etapa_segundos_count{{{rotulo}}} {acumulado}')
+            linhas += ['# HELP financiamento_contagem_total Iterações, eventos e bytes por operação.',
+                       '# TYPE financiamento_contagem_total counter']
+            for (operacao, nome), n in sorted(self._contagens.items()):
+                linhas.append(f'financiamento_contagem_total{{operacao="{operacao}",nome="{nome}"}} {n}')
+        return '\n'.join(linhas) + '\n'
+
+    def escreve_prometheus(self, caminho):
+        # troca atômica, para o coletor (textfile do node_exporter) nunca ler
+        # um arquivo pela metade
+        caminho = Path(caminho)
+        temporario = caminho.with_name(f'.{caminho.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+        temporario.write_text(self.texto_prometheus(), encoding='utf-8')
+        os.replace(temporario, caminho)
+
+
+# Registro único do processo
+METRICAS = RegistroMetricas()
@@ -0,0 +1,222 @@
+import csv
+from datetime import date, datetime as dt
+
+import numpy as np
+
+from eventos import ABATIMENTO, ASSOCIADO, BASE, ENTREGA, POS
+from motor import HORIZONTE_PARCELAS, como_taxas, percentuais_por_periodo, simulate, taxas_extras_de
+
+# Projeção estocástica (Monte Carlo) de INCC e IPCA. O motor aplica taxas
+# constantes do taxas.txt; aqui cada caminho tem um índice por mês, sorteado
+# de um passeio aleatório com reversão à média ou reamostrado de uma série
+# histórica local. Os índices são sorteados mês a mês, à medida que a
+# recorrência avança: a memória fica proporcional ao número de caminhos, não
+# a caminhos x meses.
+#
+# A sequência de linhas do fluxo (datas, pagamentos, fator de juros) não
+# depende dos índices, então vem de uma única simulação determinística com
+# parcelas_fixas=horizonte. Cada linha é afim no saldo,
+#     saldo' = saldo * (fator + índice do mês + extras) - valor,
+# e a recorrência avança linha a linha com todos os caminhos de uma vez.
+
+PERCENTIS = (5, 25, 50, 75, 95)
+_ORDINAL_1970 = date(1970, 1, 1).toordinal()
+
+
+# --- Caminhos dos índices ---
+def caminhos_passeio(n_caminhos, n_meses, incc, ipca, volatilidade=0.002, reversao=0.1,
+                     correlacao=0.7, media_incc=None, media_ipca=None, semente=None):
+    # Passeio aleatório com reversão à média (reversao=0 é um passeio puro):
+    #   x[t] = x[t-1] + reversao * (media - x[t-1]) + volatilidade * ruído
+    # começando nos valores do taxas.txt; INCC e IPCA com ruídos correlacionados.
+    # Gera, mês a mês, (incc, ipca) do mês, cada um com n_caminhos valores.
+    rng = np.random.default_rng(semente)
+    medias = np.array([incc if media_incc is None else media_incc, ipca if media_ipca is None else media_ipca])
+    cholesky = np.linalg.cholesky([[1.0, correlacao], [correlacao, 1.0]])
+    atual = np.broadcast_to(np.array([incc, ipca]), (n_caminhos, 2))
+    for _ in range(n_meses):
+        ruido = rng.standard_normal((n_caminhos, 2)) @ cholesky.T * volatilidade
+        atual = atual + reversao * (medias - atual) + ruido
+        yield atual[:, 0], atual[:, 1]
+
+
+def le_serie_historica(arquivo) -> np.ndarray:
+    # arquivo: texto com cabeçalho mes,incc,ipca; separador ',' ou ';'.
+    # Índices mensais em porcentagem (0,45 = 0,45% no mês), com vírgula ou
+    # ponto decimal. Devolve array (meses x 2) de frações, na ordem do arquivo.
+    conteudo = arquivo.read()
+    dialeto = csv.Sniffer().sniff(conteudo.splitlines()[0] if conteudo else ',', delimiters=',;')
+    leitor = csv.DictReader(conteudo.splitlines(), dialect=dialeto)
+    faltando = {'mes', 'incc', 'ipca'} - {c.strip().lower() for c in leitor.fieldnames or []}
+    if faltando:
+        raise ValueError(f"Colunas obrigatórias ausentes na série histórica: {', '.join(sorted(faltando))}")
+    valores = []
+    for n, linha in enumerate(leitor, start=2):
+        linha = {k.strip().lower(): (v or '').strip() for k, v in linha.items()}
+        try:
+            valores.append([float(linha[c].replace(',', '.')) / 100 for c in ('incc', 'ipca')])
+        except ValueError:
+            raise ValueError(f"Linha {n} da série histórica: INCC/IPCA não numérico") from None
+    if len(valores) < 12:
+        raise ValueError("A série histórica precisa de pelo menos 12 meses.")
+    return np.array(valores)
+
+
+def caminhos_historicos(serie, n_caminhos, n_meses, bloco=12, semente=None):
+    # Reamostragem em blocos de meses consecutivos da série histórica (mantém
+    # a autocorrelação e a relação INCC x IPCA). Gera, mês a mês, (incc, ipca).
+    rng = np.random.default_rng(semente)
+    bloco = min(bloco, len(serie))
+    for t in range(n_meses):
+        if t % bloco == 0:
+            inicios = rng.integers(0, len(serie) - bloco + 1, size=n_caminhos)
+        mes = serie[inicios + t % bloco]
+        yield mes[:, 0], mes[:, 1]
+
+
+# --- Estrutura do fluxo ---
+def _meses(ordinais):
+    # ordinal de data -> número do mês (ano * 12 + mês)
+    return (ordinais - _ORDINAL_1970).astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+
+
+def estrutura(cenario, horizonte=HORIZONTE_PARCELAS):
+    # Linhas do fluxo determinístico até `horizonte` parcelas pós-entrega,
+    # decompostas nos termos da recorrência afim. Devolve um dict de arrays
+    # por linha: fator (juros + extras), valor (subtraído), usa_incc/usa_ipca,
+    # mes (desde a data-base), fim_iteracao (parcela pós que a linha encerra).
+    taxas = como_taxas(cenario.get('taxas_sel'))
+    pcts_pre, pcts_pos = percentuais_por_periodo(taxas_extras_de(taxas))
+    resultado = simulate(cenario, parcelas_fixas=horizonte)
+    eventos = resultado['eventos']
+    codigo = eventos.coluna('codigo')
+    n = len(codigo)
+    entrega = int(np.flatnonzero(codigo == ENTREGA)[0])
+    pos = np.arange(n) > entrega
+
+    taxa_efetiva = np.nan_to_num(eventos.coluna('taxa_efetiva'))
+    fator = 1 + taxa_efetiva + np.where(pos, sum(pcts_pos), sum(pcts_pre))
+    valor = np.nan_to_num(eventos.coluna('valor'))
+    # total pago como na sensibilidade: parcelas, pagamentos e abatimentos
+    pago_acumulado = np.cumsum(valor)
+    com_indice = (codigo != BASE) & (codigo != ABATIMENTO) & (codigo != ENTREGA)
+    fator[~com_indice] = 1.0
+
+    # entrega: (saldo + custos) * (1 + seguro)
+    custos = (taxas.TAXA_EMISSAO_CCB + taxas.TAXA_EMISSAO_CONTRATO_ALIENACAO_FIDUCIARIA
+              + taxas.TAXA_REGISTRO_IMOVEL + taxas.TAXA_ESCRITURA_IMOVEL)
+    fator[entrega] = 1 + taxas.TAXA_SEGURO_PRESTAMISTA_PCT
+    valor[entrega] = -custos * (1 + taxas.TAXA_SEGURO_PRESTAMISTA_PCT)
+    valor[codigo == BASE] = 0.0
+
+    # cada iteração pós-entrega termina na parcela (ou no último associado dela)
+    parcela = eventos.coluna('parcela')
+    fim_iteracao = np.zeros(n, dtype=np.int64)
+    for i in np.flatnonzero(codigo == POS):
+        j = i
+        while j + 1 < n and codigo[j + 1] == ASSOCIADO:
+            j += 1
+        fim_iteracao[j] = parcela[i]
+    datas = eventos.coluna('data')
+    meses = _meses(datas) - _meses(datas[:1])[0]
+    return {
+        'fator': fator,
+        'valor': valor,
+        'usa_incc': com_indice & ~pos,
+        'usa_ipca': com_indice & pos,
+        'mes': np.maximum(meses, 0),
+        'fim_iteracao': fim_iteracao,
+        'entrega': entrega,
+        'datas': datas,
+        'valor_imovel': cenario['valor_imovel'],
+        'pago_acumulado': pago_acumulado,
+        # saldo ao fim de cada mês = última linha do mês (as datas não recuam)
+        'ultima_do_mes': np.r_[meses[1:] != meses[:-1], True],
+    }
+
+
+# --- Projeção ---
+def recorrencia(e, caminhos):
+    # Aplica as linhas de `estrutura` a todos os caminhos; `caminhos` gera
+    # (incc, ipca) de cada mês desde a data-base, em ordem. Depois da quitação
+    # o saldo do caminho fica congelado, como o motor que para de gerar
+    # parcelas. Devolve (percentis do saldo no fim de cada mês [meses x
+    # PERCENTIS], parcela de quitação [inf = não quitou], total pago).
+    caminhos = iter(caminhos)
+    incc, ipca = next(caminhos)
+    n_caminhos = len(incc)
+    mes_atual = 0
+    saldo = np.full(n_caminhos, float(e['valor_imovel']))
+    quitado = np.zeros(n_caminhos, dtype=bool)
+    saldo_quitacao = np.zeros(n_caminhos)
+    mes_quitacao = np.full(n_caminhos, np.inf)
+    total_pago = np.full(n_caminhos, e['pago_acumulado'][-1])
+    ultima_do_mes = e['ultima_do_mes']
+    saldos_mes = np.empty((int(ultima_do_mes.sum()), len(PERCENTIS)))
+    m = 0
+    for i in range(len(e['fator'])):
+        # as datas não recuam: o mês da linha só avança
+        while mes_atual < e['mes'][i]:
+            incc, ipca = next(caminhos)
+            mes_atual += 1
+        fator = e['fator'][i]
+        if e['usa_incc'][i]:
+            fator = fator + incc
+        elif e['usa_ipca'][i]:
+            fator = fator + ipca
+        saldo = saldo * fator - e['valor'][i]
+        k = e['fim_iteracao'][i]
+        if i == e['entrega'] or k:
+            novos = ~quitado & (saldo <= 0)
+            if novos.any():
+                quitado |= novos
+                saldo_quitacao[novos] = saldo[novos]
+                mes_quitacao[novos] = k
+                total_pago[novos] = e['pago_acumulado'][i]
+        if ultima_do_mes[i]:
+            saldos_mes[m] = np.percentile(np.where(quitado, saldo_quitacao, saldo), PERCENTIS)
+            m += 1
+    return saldos_mes, mes_quitacao, total_pago
+
+
+def _constantes(n_meses, incc, ipca):
+    # um único caminho com os índices do taxas.txt
+    for _ in range(n_meses):
+        yield np.array([incc]), np.array([ipca])
+
+
+def _faixas(valores):
+    # sem interpolação: com caminhos que não quitam (inf) o percentil
+    # continua sendo um valor observado
+    return dict(zip(PERCENTIS, np.percentile(valores, PERCENTIS, method='inverted_cdf').tolist()))
+
+
+def projeta(cenario, n_caminhos=10000, horizonte=HORIZONTE_PARCELAS, fonte='passeio',
+            serie=None, semente=None, **parametros_passeio):
+    # fonte='passeio' (parametros_passeio vão para caminhos_passeio) ou
+    # 'historico' (serie: array de le_serie_historica). Devolve as faixas de
+    # percentis do saldo no fim de cada mês, da parcela de quitação (None =
+    # além do horizonte) e do total pago, a probabilidade de quitar dentro do
+    # horizonte e, para comparação, o resultado com os índices constantes.
+    taxas = como_taxas(cenario.get('taxas_sel'))
+    e = estrutura(cenario, horizonte)
+    n_meses = int(e['mes'].max()) + 1
+    if fonte == 'historico':
+        caminhos = caminhos_historicos(serie, n_caminhos, n_meses, semente=semente)
+    else:
+        caminhos = caminhos_passeio(n_caminhos, n_meses, taxas.TAXA_INCC, taxas.TAXA_IPCA,
+                                    semente=semente, **parametros_passeio)
+    saldos_mes, mes_quitacao, total_pago = recorrencia(e, caminhos)
+    _, mes_ref, pago_ref = recorrencia(e, _constantes(n_meses, taxas.TAXA_INCC, taxas.TAXA_IPCA))
+    return {
+        'caminhos': n_caminhos,
+        'horizonte': horizonte,
+        'percentis': PERCENTIS,
+        'datas': [dt.fromordinal(int(o)) for o in e['datas'][e['ultima_do_mes']]],
+        'saldo': dict(zip(PERCENTIS, saldos_mes.T)),
+        'mes_quitacao': {p: None if np.isinf(v) else int(v) for p, v in _faixas(mes_quitacao).items()},
+        'total_pago': _faixas(total_pago),
+        'prob_quitacao': float(np.isfinite(mes_quitacao).mean()),
+        'deterministico': {'mes_quitacao': None if np.isinf(mes_ref[0]) else int(mes_ref[0]),
+                           'total_pago': float(pago_ref[0])},
+    }
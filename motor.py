@@ -0,0 +1,621 @@
+import heapq
+import math
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, fields
+from datetime import date, datetime as dt, time
+from functools import lru_cache
+from pathlib import Path
+from types import MappingProxyType
+
+import numpy as np
+from dateutil.relativedelta import relativedelta
+
+from calendario import TABELA_DIAS, calendario, calendario_pos, fator_juros, tabela_fatores, ultimo_dia
+from eventos import ABATIMENTO, ASSOCIADO, AVULSO, BASE, ENTREGA, POS, PRE, Eventos
+from metricas import SEM_MEDICAO
+
+# Motor de cálculo do fluxo de financiamento, independente do Streamlit.
+# Um cenário é um dict com os mesmos valores lidos pelos widgets do app:
+#   cliente, valor_imovel, dia_pagamento, taxas_sel (Taxas ou dict do taxas.txt),
+#   data_base, capacidade_pre, data_inicio_pre, data_entrega, fgts, fin_banco,
+#   capacidade_pos_antes, val_parcela_banco, non_rec, semi_series, annual_series
+
+
+# --- Auxiliares de taxa externa ---
+@dataclass(frozen=True)
+class Taxas:
+    # Bloco de um empreendimento no taxas.txt; chaves ausentes valem 0.0
+    nome: str = ''
+    TAXA_EMISSAO_CCB: float = 0.0
+    TAXA_EMISSAO_CONTRATO_ALIENACAO_FIDUCIARIA: float = 0.0
+    TAXA_REGISTRO_IMOVEL: float = 0.0
+    TAXA_ESCRITURA_IMOVEL: float = 0.0
+    TAXA_SEGURO_PRESTAMISTA_PCT: float = 0.0
+    TAXA_INCC: float = 0.0
+    TAXA_IPCA: float = 0.0
+    taxa_pre: float = 0.0
+    taxa_pos: float = 0.0
+    # demais chaves *_PCT, na ordem do arquivo: ((chave, pct), ...)
+    extras: tuple = ()
+
+    @classmethod
+    def de_dict(cls, valores: dict, nome: str = '') -> 'Taxas':
+        campos = {f.name for f in fields(cls)} - {'nome', 'extras'}
+        conhecidas, extras = {}, []
+        for chave, valor in valores.items():
+            if chave in campos:
+                conhecidas[chave] = float(valor)
+            elif chave.endswith('_PCT'):
+                extras.append((chave, float(valor)))
+            else:
+                raise ValueError(f"Chave desconhecida '{chave}' nas taxas de '{nome}'")
+        return cls(nome=nome, extras=tuple(extras), **conhecidas)
+
+
+def como_taxas(taxas_sel) -> Taxas:
+    # aceita o registro já carregado ou um dict com as chaves do taxas.txt
+    if isinstance(taxas_sel, Taxas):
+        return taxas_sel
+    return Taxas.de_dict(taxas_sel or {})
+
+
+def parse_taxas(content: str, origem: str = 'taxas.txt') -> dict:
+    taxas = {}
+    blocos = [b.strip() for b in content.strip().split("\n\n") if b.strip()]
+    for bloco in blocos:
+        linhas = bloco.splitlines()
+        nome = linhas[0].strip()
+        valores = {}
+        for linha in linhas[1:]:
+            if '=' not in linha:
+                if linha.strip():
+                    raise ValueError(f"{origem}: linha inválida em '{nome}': {linha.strip()!r}")
+                continue
+            chave, valor = linha.split('=', 1)
+            try:
+                valores[chave.strip()] = float(valor.strip())
+            except ValueError:
+                raise ValueError(f"{origem}: valor não numérico em '{nome}': {chave.strip()} = {valor.strip()!r}") from None
+        try:
+            taxas[nome] = Taxas.de_dict(valores, nome)
+        except ValueError as e:
+            raise ValueError(f"{origem}: {e}") from None
+    return MappingProxyType(taxas)
+
+
+@lru_cache(maxsize=8)
+def _load_taxas(path: str, mtime_ns: int, tamanho: int):
+    # chave inclui mtime e tamanho: editar o arquivo invalida a entrada
+    with open(path, 'r', encoding='utf-8') as f:
+        return parse_taxas(f.read(), path)
+
+
+def load_taxas(filepath: str):
+    path = Path(filepath)
+    if not path.exists():
+        raise FileNotFoundError(f"Arquivo de taxas não encontrado: {filepath}")
+    info = path.stat()
+    return _load_taxas(str(path.resolve()), info.st_mtime_ns, info.st_size)
+
+
+def taxas_extras_de(taxas: Taxas) -> list:
+    # extras (percentuais)
+    taxas_extras = []
+    for chave, val in taxas.extras:
+        periodo = 'pré-entrega da chave' if 'INCC' in chave else 'pós-entrega da chave'
+        taxas_extras.append({'pct': val, 'periodo': periodo})
+    return taxas_extras
+
+
+def percentuais_por_periodo(taxas_extras) -> tuple:
+    # (pcts_pre, pcts_pos): um percentual por taxa extra, zerado fora do período
+    pcts_pre = [t['pct'] if t['periodo'] in ['pré-entrega da chave', 'ambos'] else 0.0 for t in taxas_extras]
+    pcts_pos = [t['pct'] if t['periodo'] in ['pós-entrega da chave', 'ambos'] else 0.0 for t in taxas_extras]
+    return pcts_pre, pcts_pos
+
+
+# --- Funções de cálculo ---
+def adjust_day(date, preferred_day):
+    return date.replace(day=min(preferred_day, ultimo_dia(date.year, date.month)))
+
+
+def days_in_month(date):
+    return ultimo_dia(date.year, date.month)
+
+
+def as_datetime(d):
+    if isinstance(d, dt):
+        return d
+    if isinstance(d, date):
+        return dt.combine(d, time())
+    return dt.fromisoformat(str(d))
+
+
+class PaymentTracker:
+    def __init__(self, dia_pagamento, taxa_juros):
+        self.last_date = None
+        self.dia = dia_pagamento
+        self.taxa = taxa_juros
+        self.fatores = tabela_fatores(taxa_juros)
+
+    def calculate(self, current_date, saldo):
+        if self.last_date is None:
+            self.last_date = current_date
+            return 0.0, 0, 0.0
+        dias_corridos = (current_date - self.last_date).days
+        if 0 <= dias_corridos < TABELA_DIAS:
+            taxa_efetiva = self.fatores[dias_corridos] - 1
+        else:
+            taxa_efetiva = fator_juros(self.taxa, dias_corridos) - 1
+        juros = saldo * taxa_efetiva
+        self.last_date = current_date
+        return juros, dias_corridos, taxa_efetiva
+
+
+# --- Séries recorrentes e fila de eventos ---
+MAX_OCORRENCIAS = 100
+
+
+def expande_serie(series, meses, rotulo, dia_pagamento):
+    # Gera as ocorrências sob demanda, em ordem de data
+    d0 = as_datetime(series['d0'])
+    for n in range(MAX_OCORRENCIAS):
+        d = d0 + relativedelta(months=meses * n)
+        if series['assoc']:
+            d = adjust_day(d, dia_pagamento)
+        yield {
+            'data': d,
+            'tipo': f"{n+1}ª Parcela {rotulo}",
+            'valor': series['v'],
+            'assoc': series['assoc']
+        }
+
+
+def ocorrencias_ate(series, meses, dia_pagamento, limite) -> int:
+    # quantas ocorrências da série caem até o limite, sem expandi-la: a
+    # ocorrência n fica no mês de d0 + n * meses
+    d0 = as_datetime(series['d0'])
+    n = min(((limite.year - d0.year) * 12 + limite.month - d0.month) // meses + 1, MAX_OCORRENCIAS)
+    while n > 0:
+        d = d0 + relativedelta(months=meses * (n - 1))
+        if (adjust_day(d, dia_pagamento) if series['assoc'] else d) <= limite:
+            return n
+        n -= 1
+    return 0
+
+
+def pagamentos_avulsos(cenario, dia_pagamento) -> list:
+    # não recorrentes em ordem de data; os associados caem no dia da parcela
+    non_rec = []
+    for e in cenario.get('non_rec', []):
+        d = as_datetime(e['data'])
+        if e['assoc']:
+            d = adjust_day(d, dia_pagamento)
+        non_rec.append({**e, 'data': d})
+    return sorted(non_rec, key=lambda x: x['data'])
+
+
+def total_pagamentos(cenario, dia_pagamento, limite) -> float:
+    # soma dos pagamentos avulsos e das séries com data até o limite
+    total = sum(e['valor'] for e in pagamentos_avulsos(cenario, dia_pagamento) if e['data'] <= limite)
+    for chave, meses in (('semi_series', 6), ('annual_series', 12)):
+        total += sum(s['v'] * ocorrencias_ate(s, meses, dia_pagamento, limite) for s in cenario.get(chave, []))
+    return total
+
+
+def fontes_eventos(cenario, dia_pagamento) -> list:
+    # Pagamentos não recorrentes e as séries, cada fonte em ordem de data
+    return ([pagamentos_avulsos(cenario, dia_pagamento)]
+            + [expande_serie(series, 6, 'Semestral', dia_pagamento) for series in cenario.get('semi_series', [])]
+            + [expande_serie(series, 12, 'Anual', dia_pagamento) for series in cenario.get('annual_series', [])])
+
+
+class FilaEventos:
+    # Merge preguiçoso das fontes de pagamentos (cada uma já ordenada por data).
+    # Só é consumido o que a simulação alcança, então as séries nunca são
+    # expandidas além da data corrente.
+    def __init__(self, fontes):
+        self._it = heapq.merge(*fontes, key=lambda e: e['data'])
+        self._prox = next(self._it, None)
+        self.consumidos = 0
+        self.valor_consumido = 0.0
+
+    def _avanca(self):
+        e = self._prox
+        self._prox = next(self._it, None)
+        self.consumidos += 1
+        self.valor_consumido += e['valor']
+        return e
+
+    def proxima_data(self):
+        return None if self._prox is None else self._prox['data']
+
+    def descarta_antes(self, limite):
+        while self._prox is not None and self._prox['data'] < limite:
+            self._avanca()
+
+    def descarta_ate(self, limite):
+        while self._prox is not None and self._prox['data'] <= limite:
+            self._avanca()
+
+    def janela(self, inicio, fim):
+        # avulsos com inicio < data < fim e associados com data == fim;
+        # o que ficar para trás nunca mais seria lançado e é descartado
+        avulsos, assoc = [], []
+        while self._prox is not None and self._prox['data'] <= fim:
+            e = self._avanca()
+            if e['assoc']:
+                if e['data'] == fim:
+                    assoc.append(e)
+            elif inicio < e['data'] < fim:
+                avulsos.append(e)
+        return avulsos, assoc
+
+
+# --- Caminho vetorizado (NumPy) ---
+BLOCO_MESES = 120
+HORIZONTE_PARCELAS = 420
+
+
+def amortiza_bloco(saldo, fator, encargos, capacidade, quita=True):
+    # Recorrência afim saldo' = saldo*(fator + encargos) - capacidade, com
+    # fator = (1+taxa)^(d/30) vindo do calendário, resolvida com produtos
+    # acumulados. Retorna os saldos antes/depois de cada parcela e o fator de
+    # juros, truncados na primeira parcela que quita.
+    prod = np.cumprod(fator + encargos)
+    saldo_fim = prod * (saldo - capacidade * np.cumsum(1 / prod))
+    quitou = np.flatnonzero(saldo_fim <= 0) if quita else ()
+    if len(quitou):
+        n = quitou[0] + 1
+        fator, saldo_fim = fator[:n], saldo_fim[:n]
+    saldo_ini = np.concatenate(([saldo], saldo_fim[:-1]))
+    return saldo_ini, saldo_fim, fator
+
+
+# --- Pontos de controle ---
+# A cada INTERVALO_PONTOS parcelas (e no início do pós-entrega) a simulação
+# pode registrar o estado do laço; uma simulação posterior com entradas que só
+# mudam depois desse ponto continua dali, copiando as linhas anteriores.
+INTERVALO_PONTOS = 12
+
+
+@dataclass(frozen=True)
+class PontoControle:
+    fase: str                    # 'pre' ou 'pos'
+    data: dt                     # data da última parcela já lançada (entrega, no início do pós)
+    saldo: float
+    contador: int                # pre_count/post_count da próxima parcela
+    ultima_data: dt              # last_date do PaymentTracker da fase
+    linhas: int                  # linhas de eventos até aqui
+    consumido_ate: dt = None     # pagamentos da fila com data <= esta já foram lançados
+    saldo_entrega: float = None  # só no pós-entrega
+
+
+# --- Simulação ---
+def nao_amortiza(saldo, taxa, encargos, capacidade):
+    # Se a parcela não cobre os juros do menor mês possível (28 dias) mais os
+    # encargos, o saldo nunca diminui. Com pagamentos extras pela frente,
+    # passe o saldo menos o total deles: cada um abate no máximo o seu valor,
+    # então o saldo nunca fica abaixo disso (e só não quita se for positivo).
+    # Aceita arrays de saldos.
+    return (saldo > 0) & (saldo * ((1 + taxa) ** (28 / 30) - 1 + encargos) >= capacidade)
+
+
+def simulate(cenario: dict, vetorizado: bool = True, parcelas_fixas: int = None,
+             max_parcelas: int = HORIZONTE_PARCELAS, medicao=SEM_MEDICAO,
+             pontos: list = None, retomada: tuple = None) -> dict:
+    # parcelas_fixas: roda exatamente esse número de parcelas pós-entrega,
+    # mesmo depois de quitar (usado pelo solver para avaliar o saldo)
+    # max_parcelas: teto de parcelas pós-entrega; acima dele o financiamento
+    # é dado como inviável e o saldo restante é devolvido
+    # medicao: metricas.Medicao que recebe o tempo e as contagens por etapa
+    # pontos: lista que recebe os PontoControle da simulação
+    # retomada: (PontoControle, resultado anterior) de onde continuar; as
+    # entradas até a data do ponto devem ser as mesmas (ver SimulacaoIncremental)
+    valor_imovel = cenario['valor_imovel']
+    dia_pagamento = int(cenario['dia_pagamento'])
+    taxas = como_taxas(cenario.get('taxas_sel'))
+    data_base = as_datetime(cenario['data_base'])
+    capacidade_pre = cenario.get('capacidade_pre', 0.0)
+    data_inicio_pre = as_datetime(cenario['data_inicio_pre'])
+    data_entrega = as_datetime(cenario['data_entrega'])
+    fgts = cenario.get('fgts', 0.0)
+    fin_banco = cenario.get('fin_banco', 0.0)
+    capacidade_pos = cenario.get('capacidade_pos_antes', 0.0) - cenario.get('val_parcela_banco', 0.0)
+
+    # Extrai taxas específicas
+    TAXA_EMISSAO_CCB = taxas.TAXA_EMISSAO_CCB
+    TAXA_EMISSAO_CONTRATO_ALIENACAO_FIDUCIARIA = taxas.TAXA_EMISSAO_CONTRATO_ALIENACAO_FIDUCIARIA
+    TAXA_REGISTRO_IMOVEL = taxas.TAXA_REGISTRO_IMOVEL
+    TAXA_ESCRITURA_IMOVEL = taxas.TAXA_ESCRITURA_IMOVEL
+    TAXA_SEGURO_PRESTAMISTA_PCT = taxas.TAXA_SEGURO_PRESTAMISTA_PCT
+    TAXA_INCC = taxas.TAXA_INCC
+    TAXA_IPCA = taxas.TAXA_IPCA
+    taxa_pre = taxas.taxa_pre
+    taxa_pos = taxas.taxa_pos
+    taxas_extras = taxas_extras_de(taxas)
+    pcts_pre, pcts_pos = percentuais_por_periodo(taxas_extras)
+
+    medicao.marca('series')
+    # --- Fila única: avulsos + séries semestrais e anuais ---
+    fila = FilaEventos(fontes_eventos(cenario, dia_pagamento))
+
+    zero_extras = [0.0] * len(taxas_extras)
+    ponto = None
+    if retomada is not None:
+        ponto, anterior = retomada
+        eventos = anterior['eventos'].prefixo(ponto.linhas)
+        saldo = ponto.saldo
+        if ponto.consumido_ate is not None:
+            fila.descarta_ate(ponto.consumido_ate)
+        medicao.conta('linhas_reaproveitadas', ponto.linhas)
+    else:
+        eventos = Eventos(len(taxas_extras))
+        saldo = valor_imovel
+        # Data base (assinatura do contrato)
+        eventos.adiciona(data_base, BASE, juros=0.0, dias=0, taxa_efetiva=0.0, incc=0.0, ipca=0.0,
+                         extras=zero_extras, mudanca=0.0)
+
+    def registra_ponto(fase, data, saldo, contador, ultima_data, consumido_ate, saldo_entrega=None, linhas=None):
+        linhas = len(eventos) if linhas is None else linhas
+        if pontos is not None and (ponto is None or linhas > ponto.linhas):
+            pontos.append(PontoControle(fase, data, float(saldo), contador, ultima_data, linhas,
+                                        consumido_ate, saldo_entrega))
+
+    if ponto is None or ponto.fase == 'pre':
+        tracker_pre = PaymentTracker(dia_pagamento, taxa_pre)
+        calendario_pre = calendario(data_base, data_inicio_pre, dia_pagamento)
+
+        # 1) PRÉ-ENTREGA ------------------------------------------------
+        medicao.marca('pre')
+        if ponto is None:
+            tracker_pre.last_date = data_base
+            pre_count = 1
+            prev_date = data_inicio_pre
+        else:
+            tracker_pre.last_date = ponto.ultima_data
+            pre_count = ponto.contador
+            prev_date = ponto.data
+        pre_inicial = pre_count
+
+        while True:
+            d_evt = calendario_pre.data(pre_count - 1)
+            if d_evt >= data_entrega:
+                break
+            # não-recorrentes pré não associados entre prev_date e d_evt
+            avulsos, associados = fila.janela(prev_date, d_evt)
+            for ev_nr in avulsos:
+                juros, dias_corr, taxa_eff = tracker_pre.calculate(ev_nr['data'], saldo)
+                incc_nr = saldo * TAXA_INCC
+                extras_nr = [saldo * pct for pct in pcts_pre]
+                total_taxas_nr = sum(extras_nr) + incc_nr
+                abat_nr = ev_nr['valor'] - juros - total_taxas_nr
+                saldo -= abat_nr
+                eventos.adiciona(ev_nr['data'], AVULSO, 0, ev_nr['tipo'], ev_nr['valor'], juros, dias_corr, taxa_eff,
+                                 incc_nr, 0.0, extras_nr, abat_nr, saldo)
+
+            # 1) parcela mensal pré (sem associados)
+            juros, dias_corr, taxa_eff = tracker_pre.calculate(d_evt, saldo)
+            incc = saldo * TAXA_INCC
+            extras = [saldo * pct for pct in pcts_pre]
+            total_taxas = sum(extras) + incc
+            valor_parcela = capacidade_pre
+            abat_principal = valor_parcela - juros - total_taxas
+            saldo -= abat_principal
+            eventos.adiciona(d_evt, PRE, pre_count, None, valor_parcela, juros, dias_corr, taxa_eff,
+                             incc, 0.0, extras, abat_principal, saldo)
+
+            # 2) cada pagamento adicional associado em linha própria
+            for ev_assoc in associados:
+                juros_a, dias_a, txef_a = tracker_pre.calculate(ev_assoc['data'], saldo)
+                incc_a = saldo * TAXA_INCC
+                extras_a = [saldo * pct for pct in pcts_pre]
+                total_taxas_a = incc_a + sum(extras_a)
+                abat_a = ev_assoc['valor'] - juros_a - total_taxas_a
+                saldo -= abat_a
+                eventos.adiciona(d_evt, ASSOCIADO, 0, ev_assoc['tipo'], ev_assoc['valor'], juros_a, dias_a, txef_a,
+                                 incc_a, 0.0, extras_a, abat_a, saldo)
+            pre_count += 1
+            prev_date = d_evt
+            if (pre_count - 1) % INTERVALO_PONTOS == 0:
+                registra_ponto('pre', d_evt, saldo, pre_count, tracker_pre.last_date, d_evt)
+        # fim do pré-entrega: última parcela antes da entrega
+        if pre_count > 1 and (pre_count - 1) % INTERVALO_PONTOS:
+            registra_ponto('pre', prev_date, saldo, pre_count, tracker_pre.last_date, prev_date)
+
+        # 2) ENTREGA ------------------------------------------------------
+        medicao.marca('entrega')
+        medicao.conta('iteracoes_pre', pre_count - pre_inicial)
+        ent = data_entrega
+        # abatimentos
+        for desc, v in [('Abatimento FGTS', fgts), ('Abatimento Fin. Banco', fin_banco)]:
+            saldo -= v
+            eventos.adiciona(ent, ABATIMENTO, 0, desc, v, juros=0.0, incc=0.0, ipca=0.0,
+                             extras=zero_extras, mudanca=v, saldo=saldo)
+        # taxas de emissão e registro
+        for nome, val in [('Emissão CCB', TAXA_EMISSAO_CCB), ('Alienação Fiduciária', TAXA_EMISSAO_CONTRATO_ALIENACAO_FIDUCIARIA),
+                          ('Registro', TAXA_REGISTRO_IMOVEL), ('Escritura Imóvel', TAXA_ESCRITURA_IMOVEL)]:
+            saldo += val
+        # seguro prestamista
+        fee = saldo * TAXA_SEGURO_PRESTAMISTA_PCT
+        saldo += fee
+
+        # Data da entrega
+        eventos.adiciona(data_entrega, ENTREGA, saldo=saldo)
+
+        saldo_entrega = saldo
+        registra_ponto('pos', data_entrega, saldo, 1, data_entrega, None, saldo_entrega)
+        post_count = 1
+        prev_date = ultima_data = data_entrega
+        saldos = []
+    else:
+        saldo_entrega = ponto.saldo_entrega
+        post_count = ponto.contador
+        prev_date = ponto.data
+        ultima_data = ponto.ultima_data
+        saldos = anterior['saldos'][:post_count - 1]
+
+    # 3) PÓS-ENTREGA --------------------------------------------------
+    medicao.marca('pos')
+    tracker_pos = PaymentTracker(dia_pagamento, taxa_pos)
+    tracker_pos.last_date = ultima_data
+    calendario_parcelas = calendario_pos(data_entrega, dia_pagamento)
+    post_inicial = post_count
+    parcelas = post_count
+    fila.descarta_antes(data_entrega)
+    encargos_pos = TAXA_IPCA + sum(pcts_pos)
+    limite = max_parcelas if parcelas_fixas is None else parcelas_fixas
+    # checagem de amortização (a partir da 2ª parcela): o saldo menos os
+    # pagamentos que ainda podem entrar no fluxo, os com data até a última
+    # parcela possível (as séries vão até MAX_OCORRENCIAS)
+    if parcelas_fixas is None:
+        ultima_parcela = calendario_parcelas.data(limite - 1)
+        pendentes = total_pagamentos(cenario, dia_pagamento, ultima_parcela)
+    motivo = None
+    while post_count <= limite and (saldo > 0 or parcelas_fixas is not None):
+        if parcelas_fixas is None:
+            restante = (0.0 if (fila.proxima_data() or dt.max) > ultima_parcela
+                        else pendentes - fila.valor_consumido)
+            if post_count > 1 and nao_amortiza(saldo - restante, taxa_pos, encargos_pos, capacidade_pos):
+                motivo = ("A parcela pós-entrega não cobre os juros e encargos do mês, nem com os pagamentos "
+                          "extras restantes; o saldo devedor não diminui.")
+                break
+        # meses sem eventos intercalados seguem pelo caminho vetorizado
+        if vetorizado:
+            n_bloco = limite - post_count + 1
+            if parcelas_fixas is None:
+                n_bloco = min(BLOCO_MESES, n_bloco)
+            inicio = post_count - 1
+            fim = calendario_parcelas.fim_bloco(inicio, n_bloco, ate=fila.proxima_data())
+            if fim > inicio:
+                saldo_ini, saldo_fim, fator = amortiza_bloco(
+                    saldo, calendario_parcelas.fatores(taxa_pos, inicio, fim), encargos_pos, capacidade_pos,
+                    quita=parcelas_fixas is None)
+                if parcelas_fixas is None:
+                    # a checagem vale em cada parcela do bloco, como no laço escalar:
+                    # o bloco para antes da primeira que ela barraria
+                    barradas = np.flatnonzero(nao_amortiza(saldo_ini - restante, taxa_pos, encargos_pos,
+                                                           capacidade_pos)[int(post_count == 1):])
+                    if len(barradas):
+                        k = barradas[0] + int(post_count == 1)
+                        saldo_ini, saldo_fim, fator = saldo_ini[:k], saldo_fim[:k], fator[:k]
+                n = len(saldo_fim)
+                juros_v = saldo_ini * (fator - 1)
+                ipca_v = saldo_ini * TAXA_IPCA
+                abat_v = capacidade_pos - juros_v - (ipca_v + saldo_ini * sum(pcts_pos))
+                eventos.adiciona_bloco(calendario_parcelas.ordinais(inicio, inicio + n), POS, post_count,
+                                       capacidade_pos, juros_v, calendario_parcelas.dias(inicio, inicio + n),
+                                       fator - 1, 0.0, ipca_v, np.outer(saldo_ini, pcts_pos), abat_v, saldo_fim)
+                # pontos de controle dentro do bloco
+                for k in range(-post_count % INTERVALO_PONTOS, n, INTERVALO_PONTOS):
+                    d_ponto = calendario_parcelas.data(inicio + k)
+                    registra_ponto('pos', d_ponto, saldo_fim[k], post_count + k + 1, d_ponto, d_ponto,
+                                   saldo_entrega, len(eventos) - n + k + 1)
+                post_count += n
+                parcelas += n
+                medicao.conta('blocos_vetorizados')
+                prev_date = tracker_pos.last_date = calendario_parcelas.data(inicio + n - 1)
+                saldos.extend(saldo_fim.tolist())
+                saldo = float(saldo_fim[-1])
+                continue
+
+        d_evt = calendario_parcelas.data(post_count - 1)
+        # não-recorrentes pós não associados entre prev_date e d_evt
+        avulsos, associados = fila.janela(prev_date, d_evt)
+        for ev_nr in avulsos:
+            juros, dias_corr, taxa_eff = tracker_pos.calculate(ev_nr['data'], saldo)
+            ipca_nr = saldo * TAXA_IPCA
+            extras_nr = [saldo * pct for pct in pcts_pos]
+            total_taxas_nr = sum(extras_nr) + ipca_nr
+            abat_nr = ev_nr['valor'] - juros - total_taxas_nr
+            saldo -= abat_nr
+            eventos.adiciona(ev_nr['data'], AVULSO, parcelas, ev_nr['tipo'], ev_nr['valor'], juros, dias_corr, taxa_eff,
+                             0.0, ipca_nr, extras_nr, abat_nr, saldo)
+
+        # 1) parcela mensal pós (sem associados)
+        juros, dias_corr, txef = tracker_pos.calculate(d_evt, saldo)
+        ipca = saldo * TAXA_IPCA
+        extras = [saldo * pct for pct in pcts_pos]
+        abat_princ = capacidade_pos - juros - (ipca + sum(extras))
+        saldo -= abat_princ
+        eventos.adiciona(d_evt, POS, post_count, None, capacidade_pos, juros, dias_corr, txef,
+                         0.0, ipca, extras, abat_princ, saldo)
+
+        # 2) cada pagamento adicional associado em linha própria
+        for ev_assoc in associados:
+            juros_a, dias_a, txef_a = tracker_pos.calculate(ev_assoc['data'], saldo)
+            ipca_a = saldo * TAXA_IPCA
+            extras_a = [saldo * pct for pct in pcts_pos]
+            total_taxas_a = ipca_a + sum(extras_a)
+            abat_a = ev_assoc['valor'] - juros_a - total_taxas_a
+            saldo -= abat_a
+            eventos.adiciona(d_evt, ASSOCIADO, 0, ev_assoc['tipo'], ev_assoc['valor'], juros_a, dias_a, txef_a,
+                             0.0, ipca_a, extras_a, abat_a, saldo)
+
+        post_count += 1
+        parcelas += 1
+        prev_date = d_evt
+        saldos.append(saldo)
+        if (post_count - 1) % INTERVALO_PONTOS == 0:
+            registra_ponto('pos', d_evt, saldo, post_count, tracker_pos.last_date, d_evt, saldo_entrega)
+
+    if not math.isfinite(saldo):
+        motivo = "O saldo devedor saiu do intervalo numérico; confira os valores informados."
+    elif motivo is None and parcelas_fixas is None and saldo > 0:
+        motivo = f"A quantidade de parcelas excede {max_parcelas} e o saldo devedor continua positivo."
+    medicao.marca(None)
+    medicao.conta('iteracoes_pos', post_count - post_inicial)
+    medicao.conta('pagamentos_fila', fila.consumidos)
+    medicao.conta('eventos', len(eventos))
+
+    return {'eventos': eventos, 'saldo': saldo, 'parcelas': parcelas,
+            'saldo_entrega': saldo_entrega, 'saldos': saldos,
+            'viavel': motivo is None, 'motivo': motivo}
+
+
+# --- Pool de processos ---
+# Um pool só por processo, compartilhado pelo lote e pela sensibilidade (que
+# a tela chama de threads): o número de processos fica limitado mesmo com
+# várias gerações ao mesmo tempo. Os processos nascem de um forkserver (ou
+# spawn): um fork feito de uma thread copiaria locks presos pelas outras.
+PROCESSOS = int(os.environ.get('SIMULACAO_PROCESSOS', '0')) or os.cpu_count() or 1
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def contexto_processos():
+    metodo = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    return multiprocessing.get_context(metodo)
+
+
+def pool_processos() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        # um processo que morre quebra o pool inteiro: troca por um novo
+        if _pool is None or _pool._broken:
+            _pool = ProcessPoolExecutor(max_workers=PROCESSOS, mp_context=contexto_processos())
+        return _pool
+
+
+def simulate_iter(cenarios, max_workers=None, chunksize=None):
+    # Distribui os cenários no pool de processos e devolve os resultados à
+    # medida que ficam prontos, na ordem de entrada. max_workers=1 roda aqui
+    # mesmo; acima disso só dimensiona os lotes enviados ao pool
+    cenarios = list(cenarios)
+    if not cenarios:
+        return
+    workers = max_workers or PROCESSOS
+    if workers == 1 or len(cenarios) == 1:
+        yield from map(simulate, cenarios)
+        return
+    if chunksize is None:
+        chunksize = max(1, len(cenarios) // (workers * 4))
+    # fechar o gerador antes do fim cancela os lotes que ainda não começaram
+    yield from pool_processos().map(simulate, cenarios, chunksize=chunksize)
+
+
+def simulate_many(cenarios, max_workers=None, chunksize=None) -> list:
+    return list(simulate_iter(cenarios, max_workers, chunksize))
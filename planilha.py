@@ -0,0 +1,129 @@
+import math
+import re
+from datetime import datetime as dt
+from io import BytesIO
+
+import numpy as np
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, PatternFill
+from openpyxl.utils import get_column_letter
+
+# --- Formatação da planilha ---
+HEADER_FILL = PatternFill(start_color="FFD3D3D3", end_color="FFD3D3D3", fill_type="solid")
+DATE_FORMAT = 'dd/mm/yyyy'
+CURRENCY_FORMAT = '"R$" #,##0.00'
+PERCENT_FORMAT = '0.00%'
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+BOLD = Font(bold=True)
+HEADERS = ["Data", "Tipo", "Valor Pago (R$)"]
+# caracteres que o Excel não aceita no nome da aba (máx. 31 caracteres)
+INVALIDOS_ABA = re.compile(r'[\[\]:*?/\\]')
+
+
+def soma_valores(eventos):
+    return eventos.soma_valores()
+
+
+def _linhas(eventos, valor_imovel):
+    # linha inicial
+    yield ["-", "-", valor_imovel]
+    # eventos, lidos direto das colunas do Eventos
+    datas, valores = eventos.data, eventos.valor
+    for i in eventos.ordem().tolist():
+        valor = valores[i]
+        yield [dt.fromordinal(datas[i]), eventos.tipo(i), "-" if math.isnan(valor) else valor]
+    # linha em branco
+    yield [''] * len(HEADERS)
+
+
+def _largura_moeda(valores) -> int:
+    # largura de "R$ 1.234.567,89": só a magnitude e o sinal mudam o tamanho
+    valores = np.asarray(valores, dtype=np.float64)
+    valores = valores[~np.isnan(valores)]
+    if not len(valores):
+        return 0
+    return len(f"R$ {np.abs(valores).max():,.2f}") + bool((valores < 0).any())
+
+
+def _celula(ws, number_format=None, destaque=False):
+    cell = WriteOnlyCell(ws)
+    if number_format:
+        cell.number_format = number_format
+    if destaque:
+        cell.fill = HEADER_FILL
+        cell.font = BOLD
+    return cell
+
+
+def _grava(ws, celulas, valores):
+    # cada linha é gravada no append, então as células já estilizadas podem
+    # ser reaproveitadas de uma linha para a outra
+    for cell, valor in zip(celulas, valores):
+        cell.value = valor
+    ws.append(celulas)
+
+
+def escreve_aba(wb, titulo, eventos, valor_imovel):
+    # Aba em modo write-only: o estilo é resolvido uma vez por coluna e vai
+    # junto com cada célula. No write-only as larguras vêm antes da 1ª linha,
+    # então saem direto das colunas do Eventos e as linhas são gravadas à
+    # medida que são geradas
+    ws = wb.create_sheet(title=INVALIDOS_ABA.sub('_', titulo)[:31])
+    total = soma_valores(eventos)
+    larguras = [max(len(HEADERS[0]), len('TOTAIS'), len(DATE_FORMAT)),
+                max(len(HEADERS[1]), eventos.largura_tipo()),
+                max(len(HEADERS[2]), _largura_moeda(eventos.coluna('valor')), _largura_moeda([valor_imovel, total]))]
+    for i, largura in enumerate(larguras, 1):
+        ws.column_dimensions[get_column_letter(i)].width = largura + 2
+
+    _grava(ws, [_celula(ws, destaque=True) for _ in HEADERS], HEADERS)
+    corpo = [_celula(ws, DATE_FORMAT)] + [_celula(ws, CURRENCY_FORMAT) for _ in HEADERS[1:]]
+    for linha in _linhas(eventos, valor_imovel):
+        _grava(ws, corpo, linha)
+    totais = [_celula(ws, DATE_FORMAT, destaque=True)] + corpo[1:]
+    _grava(ws, totais, ['TOTAIS', '', total])
+    return ws
+
+
+RESUMO_HEADERS = ["Cliente", "Parcelas Pós-Entrega", "Total Pago (R$)", "Saldo Final (R$)", "Viável", "Observação"]
+
+
+def cria_resumo(wb, titulo="Resumo"):
+    # cria a aba já na 1ª posição; as linhas são gravadas depois, uma por
+    # cliente, com escreve_resumo
+    ws = wb.create_sheet(title=titulo)
+    for letra, largura in zip("ABCDEF", [30, 22, 18, 18, 8, 60]):
+        ws.column_dimensions[letra].width = largura
+    _grava(ws, [_celula(ws, destaque=True) for _ in RESUMO_HEADERS], RESUMO_HEADERS)
+    return ws
+
+
+def escreve_resumo(ws, linhas):
+    # linhas: (cliente, parcelas, total, saldo, viavel, motivo)
+    formatos = [None, None, CURRENCY_FORMAT, CURRENCY_FORMAT, None, None]
+    corpo = [_celula(ws, f) for f in formatos]
+    soma_total = 0.0
+    for cliente, parcelas, total, saldo, viavel, motivo in linhas:
+        soma_total += total
+        _grava(ws, corpo, [cliente, parcelas, total, saldo, "Sim" if viavel else "Não", motivo or ''])
+    _grava(ws, corpo, [''] * len(RESUMO_HEADERS))
+    totais = [_celula(ws, destaque=True)] + corpo[1:]
+    _grava(ws, totais, ['TOTAIS', '', soma_total, '', '', ''])
+
+
+def monta_planilha(eventos, cliente, valor_imovel) -> Workbook:
+    wb = Workbook(write_only=True)
+    escreve_aba(wb, f"Financ-{cliente}", eventos, valor_imovel)
+    return wb
+
+
+def salva_planilha(eventos, cliente, valor_imovel, destino):
+    # destino: caminho ou arquivo binário aberto
+    monta_planilha(eventos, cliente, valor_imovel).save(destino)
+
+
+def planilha_bytes(eventos, cliente, valor_imovel) -> bytes:
+    buf = BytesIO()
+    salva_planilha(eventos, cliente, valor_imovel, buf)
+    return buf.getvalue()
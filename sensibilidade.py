@@ -0,0 +1,136 @@
+import math
+from concurrent.futures import as_completed
+from dataclasses import replace
+from itertools import product
+
+import numpy as np
+
+from eventos import ASSOCIADO, POS
+from motor import HORIZONTE_PARCELAS, PROCESSOS, como_taxas, pool_processos, simulate
+
+# Análise de sensibilidade ("e se?"): varre uma grade de 2 ou 3 parâmetros
+# (taxas, capacidade, prazo) e, para cada ponto, informa em quantas parcelas
+# pós-entrega o saldo é quitado, o total pago e o saldo final. Os pontos são
+# avaliados em paralelo no pool de processos do motor e devolvidos à medida
+# que ficam prontos; cada processo reaproveita o calendário de datas em cache,
+# já que todos os pontos têm as mesmas datas.
+#
+# O prazo não exige simulações extras: uma simulação até o maior prazo da
+# grade já contém o resultado de todos os prazos menores.
+
+PARAMETROS_TAXA = ('taxa_pos', 'taxa_pre', 'TAXA_IPCA', 'TAXA_INCC')
+PARAMETROS_CENARIO = ('capacidade_pos_antes', 'capacidade_pre', 'valor_imovel', 'fgts', 'fin_banco')
+PRAZO = 'prazo'
+PARAMETROS = PARAMETROS_TAXA + PARAMETROS_CENARIO + (PRAZO,)
+METRICAS = ('mes_quitacao', 'total_pago', 'saldo_final')
+
+
+def valor_base(cenario, parametro):
+    if parametro in PARAMETROS_TAXA:
+        return getattr(como_taxas(cenario.get('taxas_sel')), parametro)
+    if parametro == PRAZO:
+        return HORIZONTE_PARCELAS
+    return cenario.get(parametro, 0.0)
+
+
+def eixo_percentual(base, variacao, n):
+    # n valores de base*(1-variacao) a base*(1+variacao); variacao=0.2 -> ±20%
+    return [base * (1 + p) for p in np.linspace(-variacao, variacao, n)]
+
+
+def eixo_prazo(minimo, maximo, n):
+    return sorted({int(round(p)) for p in np.linspace(minimo, maximo, n)})
+
+
+def aplica(cenario, ajustes):
+    # cópia rasa do cenário com os ajustes (exceto o prazo) aplicados
+    taxas = {k: v for k, v in ajustes.items() if k in PARAMETROS_TAXA}
+    novo = {**cenario, **{k: v for k, v in ajustes.items() if k in PARAMETROS_CENARIO}}
+    if taxas:
+        novo['taxas_sel'] = replace(como_taxas(cenario.get('taxas_sel')), **taxas)
+    return novo
+
+
+def _resultados_por_prazo(resultado, prazos):
+    # recorta uma simulação feita até max(prazos) em cada prazo pedido; é o
+    # mesmo que simular de novo com max_parcelas=prazo
+    eventos, saldos = resultado['eventos'], resultado['saldos']
+    codigo, parcela = eventos.coluna('codigo'), eventos.coluna('parcela')
+    acumulado = np.cumsum(np.nan_to_num(eventos.coluna('valor')))
+    if resultado['saldo_entrega'] <= 0:
+        mes_quitacao = 0
+    else:
+        quitou = np.flatnonzero(np.asarray(saldos) <= 0)
+        mes_quitacao = int(quitou[0]) + 1 if quitou.size else None
+    for prazo in prazos:
+        n = min(prazo, len(saldos))
+        fim = len(eventos)
+        if n:
+            # até a n-ésima parcela pós-entrega e seus pagamentos associados
+            fim = int(np.flatnonzero((codigo == POS) & (parcela == n))[0]) + 1
+            while fim < len(eventos) and codigo[fim] == ASSOCIADO:
+                fim += 1
+        quita = mes_quitacao is not None and mes_quitacao <= prazo
+        yield prazo, {
+            'mes_quitacao': mes_quitacao if quita else None,
+            'total_pago': float(acumulado[fim - 1]),
+            'saldo_final': saldos[n - 1] if n else resultado['saldo_entrega'],
+        }
+
+
+def avalia(cenario, pontos, prazos=None):
+    # Avalia uma lista de ajustes; roda dentro do pool. Cada ponto vira uma
+    # linha por prazo: {**ajustes, 'prazo', 'mes_quitacao', 'total_pago', 'saldo_final'}
+    prazos = sorted(prazos or [HORIZONTE_PARCELAS])
+    linhas = []
+    for ajustes in pontos:
+        resultado = simulate(aplica(cenario, ajustes), max_parcelas=prazos[-1])
+        for prazo, metricas in _resultados_por_prazo(resultado, prazos):
+            linhas.append({**ajustes, PRAZO: prazo, **metricas})
+    return linhas
+
+
+def varre(cenario, eixos, max_workers=None, pontos_por_tarefa=None):
+    # eixos: {parametro: [valores]} com 2 ou 3 parâmetros de PARAMETROS.
+    # Gera listas de linhas (ver avalia) conforme as tarefas terminam, fora
+    # de ordem, para a tela ir se completando.
+    desconhecidos = set(eixos) - set(PARAMETROS)
+    if desconhecidos:
+        raise ValueError(f"Parâmetros desconhecidos: {', '.join(sorted(desconhecidos))}")
+    prazos = eixos.get(PRAZO)
+    nomes = [p for p in eixos if p != PRAZO]
+    pontos = [dict(zip(nomes, valores)) for valores in product(*(eixos[p] for p in nomes))] or [{}]
+    workers = max_workers or PROCESSOS
+    if workers == 1 or len(pontos) == 1:
+        for ponto in pontos:
+            yield avalia(cenario, [ponto], prazos)
+        return
+    if pontos_por_tarefa is None:
+        # tarefas pequenas o bastante para a tela atualizar com frequência
+        pontos_por_tarefa = max(1, math.ceil(len(pontos) / (workers * 8)))
+    pool = pool_processos()
+    tarefas = [pool.submit(avalia, cenario, pontos[i:i + pontos_por_tarefa], prazos)
+               for i in range(0, len(pontos), pontos_por_tarefa)]
+    try:
+        for tarefa in as_completed(tarefas):
+            yield tarefa.result()
+    finally:
+        # o pool é compartilhado: se a varredura for abandonada, libera a fila
+        for tarefa in tarefas:
+            tarefa.cancel()
+
+
+def matriz(linhas, eixo_x, eixo_y, metrica, fixos=None):
+    # (valores_x, valores_y, matriz[y, x]) de uma métrica para heatmap;
+    # fixos filtra o 3º eixo, ex.: {'prazo': 360}. Pontos ainda não
+    # calculados (ou sem quitação) ficam NaN.
+    fixos = fixos or {}
+    selecionadas = [l for l in linhas if all(l.get(k) == v for k, v in fixos.items())]
+    xs = sorted({l[eixo_x] for l in selecionadas})
+    ys = sorted({l[eixo_y] for l in selecionadas})
+    ix, iy = {v: i for i, v in enumerate(xs)}, {v: i for i, v in enumerate(ys)}
+    m = np.full((len(ys), len(xs)), np.nan)
+    for l in selecionadas:
+        if l[metrica] is not None:
+            m[iy[l[eixo_y]], ix[l[eixo_x]]] = l[metrica]
+    return xs, ys, m
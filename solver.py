@@ -0,0 +1,52 @@
+import math
+
+import numpy as np
+
+from motor import HORIZONTE_PARCELAS, simulate
+
+# Metas sobre o motor: prazo de quitação, capacidade mínima e valor máximo do
+# imóvel. O saldo após cada parcela é afim no valor do imóvel e na capacidade
+# (todas as etapas do fluxo são afins no saldo), então duas avaliações da
+# trajetória bastam para resolver em forma fechada, sem busca por tentativas.
+
+
+def trajetoria(cenario: dict, n_parcelas: int = HORIZONTE_PARCELAS, **ajustes) -> np.ndarray:
+    # saldo na entrega seguido do saldo ao fim de cada uma das n_parcelas
+    # pós-entrega, sem parar ao quitar
+    resultado = simulate({**cenario, **ajustes}, parcelas_fixas=n_parcelas)
+    return np.asarray([resultado['saldo_entrega']] + resultado['saldos'])
+
+
+def prazo_quitacao(cenario: dict, horizonte: int = HORIZONTE_PARCELAS):
+    # número de parcelas pós-entrega até quitar; None se não quita no horizonte
+    quitou = np.flatnonzero(trajetoria(cenario, horizonte) <= 0)
+    return int(quitou[0]) if quitou.size else None
+
+
+def capacidade_minima(cenario: dict, n_parcelas: int = HORIZONTE_PARCELAS) -> float:
+    # menor capacidade_pos_antes que quita em até n_parcelas
+    banco = cenario.get('val_parcela_banco', 0.0)
+    passo = 1000.0
+    a = trajetoria(cenario, n_parcelas, capacidade_pos_antes=banco)
+    b = (a - trajetoria(cenario, n_parcelas, capacidade_pos_antes=banco + passo)) / passo
+    # saldo_k(cap) = a_k - b_k * cap: quita até n se cap >= min(a_k / b_k)
+    if a[0] <= 0:
+        return banco
+    validos = b > 0
+    if not validos.any():
+        return math.inf
+    minimo = max(float(np.min(a[validos] / b[validos])), 0.0)
+    return banco + math.ceil(round(minimo * 100, 6)) / 100
+
+
+def valor_maximo_imovel(cenario: dict, n_parcelas: int = HORIZONTE_PARCELAS) -> float:
+    # maior valor_imovel que a capacidade informada quita em até n_parcelas
+    passo = 100000.0
+    c = trajetoria(cenario, n_parcelas, valor_imovel=0.0)
+    d = (trajetoria(cenario, n_parcelas, valor_imovel=passo) - c) / passo
+    # saldo_k(v) = c_k + d_k * v: quita até n se v <= max(-c_k / d_k)
+    validos = d > 0
+    if not validos.any():
+        return 0.0
+    maximo = float(np.max(-c[validos] / d[validos]))
+    return max(math.floor(round(maximo * 100, 6)) / 100, 0.0)
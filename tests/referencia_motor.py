@@ -0,0 +1,315 @@
+import calendar
+from datetime import date, datetime as dt, time
+
+from dateutil.relativedelta import relativedelta
+
+# Cópia congelada do laço de simulação anterior às otimizações (motor.py do
+# commit 7783b0b): uma lista de dicts por linha, pagamentos varridos mês a
+# mês e séries expandidas de uma vez. Serve de referência para os testes do
+# motor; não alterar.
+
+
+def taxas_extras_de(taxas_sel: dict) -> list:
+    # extras (percentuais)
+    taxas_extras = []
+    for chave, val in taxas_sel.items():
+        if chave.endswith('_PCT') and chave not in ['TAXA_SEGURO_PRESTAMISTA_PCT']:
+            periodo = 'pré-entrega da chave' if 'INCC' in chave else 'pós-entrega da chave'
+            taxas_extras.append({'pct': val, 'periodo': periodo})
+    return taxas_extras
+
+
+# --- Funções de cálculo ---
+def adjust_day(date, preferred_day):
+    try:
+        return date.replace(day=preferred_day)
+    except ValueError:
+        last = calendar.monthrange(date.year, date.month)[1]
+        return date.replace(day=last)
+
+
+def as_datetime(d):
+    if isinstance(d, dt):
+        return d
+    if isinstance(d, date):
+        return dt.combine(d, time())
+    return dt.fromisoformat(str(d))
+
+
+class PaymentTracker:
+    def __init__(self, dia_pagamento, taxa_juros):
+        self.last_date = None
+        self.dia = dia_pagamento
+        self.taxa = taxa_juros
+
+    def calculate(self, current_date, saldo):
+        if self.last_date is None:
+            self.last_date = current_date
+            return 0.0, 0, 0.0
+        dias_corridos = (current_date - self.last_date).days
+        taxa_efetiva = ((1+self.taxa) ** (dias_corridos / 30)-1)
+        juros = saldo * ((1+self.taxa) ** (dias_corridos / 30)-1)
+        self.last_date = current_date
+        return juros, dias_corridos, taxa_efetiva
+
+
+# --- Simulação ---
+def simulate(cenario: dict) -> dict:
+    valor_imovel = cenario['valor_imovel']
+    dia_pagamento = int(cenario['dia_pagamento'])
+    taxas_sel = cenario.get('taxas_sel', {})
+    data_base = as_datetime(cenario['data_base'])
+    capacidade_pre = cenario.get('capacidade_pre', 0.0)
+    data_inicio_pre = as_datetime(cenario['data_inicio_pre'])
+    data_entrega = as_datetime(cenario['data_entrega'])
+    fgts = cenario.get('fgts', 0.0)
+    fin_banco = cenario.get('fin_banco', 0.0)
+    capacidade_pos = cenario.get('capacidade_pos_antes', 0.0) - cenario.get('val_parcela_banco', 0.0)
+
+    # Extrai taxas específicas
+    TAXA_EMISSAO_CCB = taxas_sel.get('TAXA_EMISSAO_CCB', 0.0)
+    TAXA_EMISSAO_CONTRATO_ALIENACAO_FIDUCIARIA = taxas_sel.get('TAXA_EMISSAO_CONTRATO_ALIENACAO_FIDUCIARIA', 0.0)
+    TAXA_REGISTRO_IMOVEL = taxas_sel.get('TAXA_REGISTRO_IMOVEL', 0.0)
+    TAXA_ESCRITURA_IMOVEL = taxas_sel.get('TAXA_ESCRITURA_IMOVEL', 0.0)
+    TAXA_SEGURO_PRESTAMISTA_PCT = taxas_sel.get('TAXA_SEGURO_PRESTAMISTA_PCT', 0.0)
+    TAXA_INCC = taxas_sel.get('TAXA_INCC', 0.0)
+    TAXA_IPCA = taxas_sel.get('TAXA_IPCA', 0.0)
+    taxa_pre = taxas_sel.get('taxa_pre', 0.0)
+    taxa_pos = taxas_sel.get('taxa_pos', 0.0)
+    taxas_extras = taxas_extras_de(taxas_sel)
+
+    # Pagamentos não recorrentes (associados caem no dia da parcela)
+    non_rec = []
+    for e in cenario.get('non_rec', []):
+        d = as_datetime(e['data'])
+        if e['assoc']:
+            d = adjust_day(d, dia_pagamento)
+        non_rec.append({**e, 'data': d})
+
+    # --- Agrega séries em non_rec ---
+    for series in cenario.get('semi_series', []):
+        d0 = as_datetime(series['d0'])
+        for n in range(100):
+            d = d0 + relativedelta(months=6 * n)
+            if series['assoc']:
+                d = adjust_day(d, dia_pagamento)
+            non_rec.append({
+                'data': d,
+                'tipo': f"{n+1}ª Parcela Semestral",
+                'valor': series['v'],
+                'assoc': series['assoc']
+            })
+    for series in cenario.get('annual_series', []):
+        d0 = as_datetime(series['d0'])
+        for n in range(100):
+            d = d0 + relativedelta(years=n)
+            if series['assoc']:
+                d = adjust_day(d, dia_pagamento)
+            non_rec.append({
+                'data': d,
+                'tipo': f"{n+1}ª Parcela Anual",
+                'valor': series['v'],
+                'assoc': series['assoc']
+            })
+
+    # --- Separa pré e pós entre non_rec ---
+    pre_nr = sorted([e for e in non_rec if e['data'] < data_entrega], key=lambda x: x['data'])
+    post_nr = sorted([e for e in non_rec if e['data'] >= data_entrega], key=lambda x: x['data'])
+
+    eventos = []
+    saldo = valor_imovel
+
+    # Data base (assinatura do contrato)
+    eventos.append({
+        'data': data_base,
+        'parcela': '',
+        'tipo': 'Data-Base (assinatura do contrato)',
+        'valor': "-",
+        'juros': 0.0,
+        'dias_corridos': 0,
+        'taxa_efetiva': 0.0,
+        'incc': 0.0,
+        'ipca': 0.0,
+        'taxas_extra': [0.0] * len(taxas_extras),
+        'Total de mudança (R$)': 0.0,
+        'saldo': "-"
+    })
+
+    tracker_pre = PaymentTracker(dia_pagamento, taxa_pre)
+    tracker_pre.last_date = data_base
+
+    # 1) PRÉ-ENTREGA ------------------------------------------------
+    pre_count = 1
+    prev_date = cursor = data_inicio_pre
+
+    while True:
+        d_evt = adjust_day(cursor, dia_pagamento)
+        if d_evt >= data_entrega:
+            break
+        # não-recorrentes pré não associados entre prev_date e d_evt
+        for ev_nr in [e for e in pre_nr if not e['assoc'] and prev_date < e['data'] < d_evt]:
+            juros, dias_corr, taxa_eff = tracker_pre.calculate(ev_nr['data'], saldo)
+            incc_nr = saldo * TAXA_INCC
+            extras_nr = [saldo * t['pct'] if t['periodo'] in ['pré-entrega da chave', 'ambos'] else 0.0 for t in taxas_extras]
+            total_taxas_nr = sum(extras_nr) + incc_nr
+            abat_nr = ev_nr['valor'] - juros - total_taxas_nr
+            saldo -= abat_nr
+            eventos.append({**ev_nr, 'juros': juros, 'dias_corridos': dias_corr, 'taxa_efetiva': taxa_eff,
+                            'incc': incc_nr, 'ipca': 0.0, 'taxas_extra': extras_nr,
+                            'Total de mudança (R$)': abat_nr, 'saldo': saldo})
+
+        # 1) parcela mensal pré (sem associados)
+        juros, dias_corr, taxa_eff = tracker_pre.calculate(d_evt, saldo)
+        incc = saldo * TAXA_INCC
+        extras = [saldo * t['pct'] if t['periodo'] in ['pré-entrega da chave', 'ambos'] else 0.0 for t in taxas_extras]
+        total_taxas = sum(extras) + incc
+        valor_parcela = capacidade_pre
+        abat_principal = valor_parcela - juros - total_taxas
+        saldo -= abat_principal
+        eventos.append({
+            'data': d_evt,
+            'parcela': pre_count,
+            'tipo': f"{pre_count}ª Parcela Pré-Entrega",
+            'valor': valor_parcela,
+            'juros': juros,
+            'dias_corridos': dias_corr,
+            'taxa_efetiva': taxa_eff,
+            'incc': incc,
+            'ipca': 0.0,
+            'taxas_extra': extras,
+            'Total de mudança (R$)': abat_principal,
+            'saldo': saldo
+        })
+
+        # 2) cada pagamento adicional associado em linha própria
+        for ev_assoc in [e for e in pre_nr if e['assoc'] and e['data'] == d_evt]:
+            juros_a, dias_a, txef_a = tracker_pre.calculate(ev_assoc['data'], saldo)
+            incc_a = saldo * TAXA_INCC
+            extras_a = [saldo * t['pct'] for t in taxas_extras if t['periodo'] in ['pré-entrega da chave', 'ambos']]
+            total_taxas_a = incc_a + sum(extras_a)
+            abat_a = ev_assoc['valor'] - juros_a - total_taxas_a
+            saldo -= abat_a
+            eventos.append({
+                'data': d_evt,
+                'parcela': '',
+                'tipo': ev_assoc['tipo'],
+                'valor': ev_assoc['valor'],
+                'juros': juros_a,
+                'dias_corridos': dias_a,
+                'taxa_efetiva': txef_a,
+                'incc': incc_a,
+                'ipca': 0.0,
+                'taxas_extra': extras_a,
+                'Total de mudança (R$)': abat_a,
+                'saldo': saldo
+            })
+        pre_count += 1
+        prev_date = d_evt
+        cursor += relativedelta(months=1)
+
+    # 2) ENTREGA ------------------------------------------------------
+    ent = data_entrega
+    zero_extras = [0.0] * len(taxas_extras)
+    # abatimentos
+    for desc, v in [('Abatimento FGTS', fgts), ('Abatimento Fin. Banco', fin_banco)]:
+        saldo -= v
+        eventos.append({'data': ent, 'parcela': '', 'tipo': desc, 'valor': v,
+                        'juros': 0.0, 'dias_corridos': '', 'taxa_efetiva': '',
+                        'incc': 0.0, 'ipca': 0.0, 'taxas_extra': zero_extras,
+                        'Total de mudança (R$)': v, 'saldo': saldo})
+    # taxas de emissão e registro
+    for nome, val in [('Emissão CCB', TAXA_EMISSAO_CCB), ('Alienação Fiduciária', TAXA_EMISSAO_CONTRATO_ALIENACAO_FIDUCIARIA),
+                      ('Registro', TAXA_REGISTRO_IMOVEL), ('Escritura Imóvel', TAXA_ESCRITURA_IMOVEL)]:
+        saldo += val
+    # seguro prestamista
+    fee = saldo * TAXA_SEGURO_PRESTAMISTA_PCT
+    saldo += fee
+
+    # Data da entrega
+    eventos.append({
+        'data': data_entrega,
+        'parcela': '',
+        'tipo': 'Data da entrega das chaves',
+        'valor': "-",
+        'juros': "-",
+        'dias_corridos': "-",
+        'taxa_efetiva': "-",
+        'incc': "-",
+        'ipca': "-",
+        'taxas_extra': "-",
+        'Total de mudança (R$)': "-",
+        'saldo': saldo
+    })
+
+    # 3) PÓS-ENTREGA --------------------------------------------------
+    tracker_pos = PaymentTracker(dia_pagamento, taxa_pos)
+    tracker_pos.last_date = data_entrega
+    prev_date = data_entrega
+    cursor = data_entrega
+    post_count = 1
+    parcelas = 1
+    while saldo > 0:
+        d_evt = adjust_day(cursor + relativedelta(months=1), dia_pagamento)
+        # não-recorrentes pós não associados entre prev_date e d_evt
+        for ev_nr in [e for e in post_nr if not e['assoc'] and prev_date < e['data'] < d_evt]:
+            juros, dias_corr, taxa_eff = tracker_pos.calculate(ev_nr['data'], saldo)
+            ipca_nr = saldo * TAXA_IPCA
+            extras_nr = [saldo * t['pct'] if t['periodo'] in ['pós-entrega da chave', 'ambos'] else 0.0 for t in taxas_extras]
+            total_taxas_nr = sum(extras_nr) + ipca_nr
+            abat_nr = ev_nr['valor'] - juros - total_taxas_nr
+            saldo -= abat_nr
+            eventos.append({**ev_nr, 'parcela': parcelas, 'juros': juros, 'dias_corridos': dias_corr, 'taxa_efetiva': taxa_eff,
+                            'incc': 0.0, 'ipca': ipca_nr, 'taxas_extra': extras_nr,
+                            'Total de mudança (R$)': abat_nr, 'saldo': saldo})
+
+        # 1) parcela mensal pós (sem associados)
+        juros, dias_corr, txef = tracker_pos.calculate(d_evt, saldo)
+        ipca = saldo * TAXA_IPCA
+        extras = [saldo * t['pct'] for t in taxas_extras if t['periodo'] in ['pós-entrega da chave', 'ambos']]
+        abat_princ = capacidade_pos - juros - (ipca + sum(extras))
+        saldo -= abat_princ
+        eventos.append({
+            'data': d_evt,
+            'parcela': post_count,
+            'tipo': f"{post_count}ª Parcela Pós-Entrega",
+            'valor': capacidade_pos,
+            'juros': juros,
+            'dias_corridos': dias_corr,
+            'taxa_efetiva': txef,
+            'incc': 0.0,
+            'ipca': ipca,
+            'taxas_extra': extras,
+            'Total de mudança (R$)': abat_princ,
+            'saldo': saldo
+        })
+
+        # 2) cada pagamento adicional associado em linha própria
+        for ev_assoc in [e for e in post_nr if e['assoc'] and e['data'] == d_evt]:
+            juros_a, dias_a, txef_a = tracker_pos.calculate(ev_assoc['data'], saldo)
+            ipca_a = saldo * TAXA_IPCA
+            extras_a = [saldo * t['pct'] for t in taxas_extras if t['periodo'] in ['pós-entrega da chave', 'ambos']]
+            total_taxas_a = ipca_a + sum(extras_a)
+            abat_a = ev_assoc['valor'] - juros_a - total_taxas_a
+            saldo -= abat_a
+            eventos.append({
+                'data': d_evt,
+                'parcela': '',
+                'tipo': ev_assoc['tipo'],
+                'valor': ev_assoc['valor'],
+                'juros': juros_a,
+                'dias_corridos': dias_a,
+                'taxa_efetiva': txef_a,
+                'incc': 0.0,
+                'ipca': ipca_a,
+                'taxas_extra': extras_a,
+                'Total de mudança (R$)': abat_a,
+                'saldo': saldo
+            })
+
+        post_count += 1
+        parcelas += 1
+        prev_date = d_evt
+        cursor = d_evt
+
+    return {'eventos': eventos, 'saldo': saldo, 'parcelas': parcelas}
+
@@ -0,0 +1,116 @@
+import io
+import json
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+from openpyxl import load_workbook
+
+from api import APIPrecificacao, ClienteLocal
+from motor import load_taxas
+from planilha import XLSX_MIME
+
+TAXAS_PATH = str(Path(__file__).resolve().parent.parent / 'taxas.txt')
+EMPREENDIMENTO = next(iter(load_taxas(TAXAS_PATH)))
+
+
+def _dados(**campos):
+    dados = {'cliente': 'Ana', 'empreendimento': EMPREENDIMENTO, 'valor_imovel': 400000, 'dia_pagamento': 15,
+             'data_base': '2024-01-10', 'data_inicio_pre': '2024-02-01', 'data_entrega': '2026-06-01',
+             'capacidade_pre': 2000, 'capacidade_pos_antes': 9000,
+             'non_rec': [{'data': '2024-12-10', 'valor': 10000, 'tipo': 'Extra', 'assoc': True}],
+             'annual_series': [{'d0': '2025-01-10', 'v': 5000}]}
+    dados.update(campos)
+    return dados
+
+
+@pytest.fixture
+def cliente():
+    # threads no lugar do pool de processos: o teste não sobe processos
+    with ThreadPoolExecutor(2) as executor, ClienteLocal(APIPrecificacao(TAXAS_PATH, executor=executor)) as c:
+        yield c
+
+
+# --- Rotas GET ---
+def test_saude_e_empreendimentos(cliente):
+    resposta = cliente.get('/saude')
+    assert resposta.status == 200
+    assert resposta.json() == {'status': 'ok', 'em_andamento': 0, 'max_fila': 32}
+    assert cliente.get('/empreendimentos/').json() == list(load_taxas(TAXAS_PATH))
+
+
+@pytest.mark.parametrize('metodo, caminho, status', [
+    ('GET', '/nada', 404), ('POST', '/saude', 405), ('GET', '/simulacao', 405), ('DELETE', '/simulacao', 405),
+])
+def test_rotas_e_metodos(cliente, metodo, caminho, status):
+    resposta = cliente.requisicao(metodo, caminho)
+    assert resposta.status == status
+    assert resposta.headers['content-type'] == 'application/json'
+    assert 'erro' in resposta.json()
+
+
+# --- Simulação ---
+def test_simulacao_json(cliente):
+    resposta = cliente.post('/simulacao', _dados())
+    assert resposta.status == 200
+    corpo = resposta.json()
+    assert corpo['cliente'] == 'Ana'
+    assert corpo['viavel'] is True and corpo['motivo'] is None
+    assert corpo['eventos']
+    assert int(resposta.headers['content-length']) == len(resposta.corpo)
+
+
+def test_simulacao_xlsx(cliente):
+    resposta = cliente.post('/simulacao?formato=xlsx', _dados(cliente='Ana "B"\r\nX-Teste: 1 ção'))
+    assert resposta.status == 200
+    assert resposta.headers['content-type'] == XLSX_MIME
+    # aspas e CR/LF não chegam ao header; o nome completo vai no filename*
+    disposicao = resposta.headers['content-disposition']
+    assert disposicao == ('attachment; filename="Financiamento Ana _B___X-Teste_ 1 __o.xlsx"; '
+                          "filename*=UTF-8''Financiamento%20Ana%20_B___X-Teste_%201%20%C3%A7%C3%A3o.xlsx")
+    assert load_workbook(io.BytesIO(resposta.corpo)).sheetnames
+
+
+@pytest.mark.parametrize('dados, mensagem', [
+    (_dados(dia_pagamento=0), 'dia_pagamento'),
+    (_dados(dia_pagamento=True), 'dia_pagamento'),
+    (_dados(valor_imovel=-1), 'negativo'),
+    (_dados(valor_imovel='400000'), 'numérico'),
+    (_dados(data_base='10/01/2024'), 'data_base'),
+    (_dados(empreendimento='Outro'), 'desconhecido'),
+    (_dados(non_rec=[{'data': '2024-12-10', 'valor': 'x'}]), "'non_rec', item 1"),
+    ({'cliente': 'Ana'}, 'ausentes'),
+    ([], 'objeto'),
+])
+def test_validacao(cliente, dados, mensagem):
+    resposta = cliente.post('/simulacao', dados)
+    assert resposta.status == 400
+    assert mensagem in resposta.json()['erro']
+
+
+def _corpo(valor_imovel):
+    return json.dumps(_dados()).replace('"valor_imovel": 400000', f'"valor_imovel": {valor_imovel}').encode()
+
+
+@pytest.mark.parametrize('corpo', [b'', b'{"valor_imovel": ', _corpo('NaN'), _corpo('Infinity'), _corpo('1e309')])
+def test_corpo_invalido(cliente, corpo):
+    # o json do Python aceita NaN/Infinity (e 1e309 vira inf); a API não
+    assert cliente.requisicao('POST', '/simulacao', corpo).status == 400
+
+
+def test_formato_invalido(cliente):
+    resposta = cliente.post('/simulacao?formato=pdf', _dados())
+    assert resposta.status == 400
+    assert 'formato' in resposta.json()['erro']
+
+
+# --- Backpressure ---
+def test_fila_cheia_responde_503():
+    with ThreadPoolExecutor(1) as executor, \
+            ClienteLocal(APIPrecificacao(TAXAS_PATH, max_fila=1, executor=executor)) as cliente:
+        respostas = cliente.post_varios('/simulacao', [_dados()] * 3)
+        assert [r.status for r in respostas] == [200, 503, 503]
+        assert all(r.headers['retry-after'] == '1' for r in respostas[1:])
+        # a fila esvazia quando as simulações terminam
+        assert cliente.get('/saude').json()['em_andamento'] == 0
+        assert cliente.post('/simulacao', _dados()).status == 200
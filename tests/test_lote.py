@@ -0,0 +1,129 @@
+import io
+import zipfile
+from datetime import datetime as dt
+
+import pytest
+from openpyxl import load_workbook
+
+from lote import exporta_lote, le_cenarios_csv, nomes_unicos
+from motor import simulate
+
+TAXAS = {'Residencial': {'TAXA_EMISSAO_CCB': 1500.0, 'TAXA_SEGURO_PRESTAMISTA_PCT': 0.0083,
+                         'TAXA_INCC': 0.005, 'TAXA_IPCA': 0.005, 'taxa_pre': 0.005, 'taxa_pos': 0.005}}
+CABECALHO = ['cliente', 'empreendimento', 'valor_imovel', 'dia_pagamento', 'data_base', 'data_inicio_pre',
+             'data_entrega', 'capacidade_pre', 'capacidade_pos_antes']
+
+
+def _csv(linhas, separador=';'):
+    return io.StringIO('\n'.join(separador.join(linha) for linha in [CABECALHO] + linhas))
+
+
+def _linha(cliente='Ana', valor='400000', dia='15', datas=('10/01/2024', '01/02/2024', '01/06/2026'),
+           capacidade_pos='9000'):
+    return [cliente, 'Residencial', valor, dia, *datas, '2000', capacidade_pos]
+
+
+# --- Leitura do CSV ---
+@pytest.mark.parametrize('separador', [',', ';'])
+def test_separadores(separador):
+    valor = '400000.50' if separador == ';' else '"400.000,50"'
+    cenario, = le_cenarios_csv(_csv([_linha(valor=valor)], separador), TAXAS)
+    assert cenario['cliente'] == 'Ana'
+    assert cenario['valor_imovel'] == 400000.5
+    assert cenario['dia_pagamento'] == 15
+    assert cenario['taxas_sel'] is TAXAS['Residencial']
+
+
+def test_datas_br_e_iso():
+    br, iso = le_cenarios_csv(_csv([_linha(), _linha(datas=('2024-01-10', '2024-02-01', '2026-06-01'))]), TAXAS)
+    for cenario in (br, iso):
+        assert cenario['data_base'] == dt(2024, 1, 10)
+        assert cenario['data_inicio_pre'] == dt(2024, 2, 1)
+        assert cenario['data_entrega'] == dt(2026, 6, 1)
+
+
+@pytest.mark.parametrize('texto, valor', [
+    ('350.000', 350000.0), ('1.234.567', 1234567.0), ('1.234,56', 1234.56), ('350000,5', 350000.5),
+    ('350000.50', 350000.5), ('1.5', 1.5), ('', 0.0),
+])
+def test_formatos_de_numero(texto, valor):
+    cenario, = le_cenarios_csv(_csv([_linha(capacidade_pos=texto)]), TAXAS)
+    assert cenario['capacidade_pos_antes'] == valor
+
+
+@pytest.mark.parametrize('linha, mensagem', [
+    (_linha(dia='0'), 'dia_pagamento'),
+    (_linha(dia='32'), 'dia_pagamento'),
+    (_linha(dia='dez'), 'dia_pagamento'),
+    (_linha(valor='-1'), 'negativo'),
+    (_linha(valor='nan'), 'numérico'),
+    (_linha(valor='inf'), 'numérico'),
+    (_linha(datas=('31/02/2024', '01/02/2024', '01/06/2026')), 'data_base'),
+    (['Ana', 'Outro'] + _linha()[2:], 'empreendimento desconhecido'),
+])
+def test_linhas_invalidas(linha, mensagem):
+    with pytest.raises(ValueError, match=mensagem) as erro:
+        le_cenarios_csv(_csv([_linha(), linha]), TAXAS)
+    assert 'linha 3' in str(erro.value)
+
+
+def test_cabecalho_invalido():
+    with pytest.raises(ValueError, match='ausentes'):
+        le_cenarios_csv(io.StringIO('cliente;valor_imovel\nAna;1'), TAXAS)
+    # sem separador o Sniffer levanta csv.Error
+    with pytest.raises(ValueError, match='separar'):
+        le_cenarios_csv(io.StringIO('cliente\nAna'), TAXAS)
+
+
+# --- Nomes das abas e arquivos ---
+def test_nomes_unicos():
+    longo = 'Cliente com um nome bem mais longo que 31'
+    nomes = nomes_unicos(['Ana', 'ana', 'Jo[ão]?', '', longo, longo], limite=31)
+    assert nomes[:4] == ['Ana', 'ana (2)', 'Jo_ão__', 'Cliente']
+    assert nomes[4] == longo[:31]
+    assert nomes[5] == longo[:27] + ' (2)'
+    assert all(len(n) <= 31 for n in nomes)
+
+
+# --- Exportação ---
+def _cenarios():
+    clientes = ['Ana', 'Ana', 'Resumo', 'Jo[ão]?', 'Cliente com um nome bem mais longo que 31']
+    return le_cenarios_csv(_csv([_linha(cliente=c) for c in clientes] + [_linha(cliente='Bia', capacidade_pos='100')]),
+                           TAXAS)
+
+
+def _resumo(ws):
+    return [tuple(c.value for c in linha) for linha in ws.iter_rows()]
+
+
+def test_exporta_xlsx():
+    cenarios = _cenarios()
+    wb = load_workbook(exporta_lote(cenarios, 'xlsx', max_workers=1))
+    assert wb.sheetnames == ['Resumo', 'Ana', 'Ana (2)', 'Resumo (2)', 'Jo_ão__',
+                             'Cliente com um nome bem mais lo', 'Bia']
+    linhas = _resumo(wb['Resumo'])
+    assert linhas[0][0] == 'Cliente'
+    assert len(linhas) == 1 + len(cenarios) + 2
+    for linha, cenario in zip(linhas[1:], cenarios):
+        resultado = simulate(cenario)
+        assert linha[0] == cenario['cliente']
+        assert linha[1] == resultado['parcelas'] - 1
+        assert linha[2] == pytest.approx(resultado['eventos'].soma_valores())
+        assert linha[3] == pytest.approx(resultado['saldo'])
+        assert linha[4] == ('Sim' if resultado['viavel'] else 'Não')
+    assert linhas[len(cenarios)][4] == 'Não'   # Bia: capacidade não amortiza
+    assert linhas[-1][0] == 'TOTAIS'
+    assert linhas[-1][2] == pytest.approx(sum(linha[2] for linha in linhas[1:-2]))
+
+
+def test_exporta_zip():
+    cenarios = _cenarios()
+    with zipfile.ZipFile(exporta_lote(cenarios, 'zip', max_workers=1)) as zf:
+        nomes = zf.namelist()
+        assert nomes == ['Financiamento Ana.xlsx', 'Financiamento Ana (2).xlsx', 'Financiamento Resumo.xlsx',
+                         'Financiamento Jo[ão]_.xlsx',
+                         'Financiamento Cliente com um nome bem mais longo que 31.xlsx',
+                         'Financiamento Bia.xlsx', 'Resumo.xlsx']
+        # o título da aba sai do nome do cliente sem os caracteres proibidos
+        assert load_workbook(io.BytesIO(zf.read(nomes[3]))).sheetnames == ['Financ-Jo_ão__']
+        assert len(_resumo(load_workbook(io.BytesIO(zf.read('Resumo.xlsx'))).active)) == 1 + len(cenarios) + 2
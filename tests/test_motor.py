@@ -0,0 +1,216 @@
+import copy
+import random
+from datetime import datetime as dt, timedelta
+
+import numpy as np
+import pytest
+
+from incremental import SimulacaoIncremental
+from motor import HORIZONTE_PARCELAS, simulate
+from referencia_motor import simulate as simulate_referencia
+
+# Cenários sorteados com semente fixa: pagamentos avulsos associados e não
+# associados, séries semestrais/anuais, taxas extras e dias de pagamento que
+# caem no fim do mês. A capacidade pós sempre amortiza, então a referência
+# (sem limite de parcelas) termina.
+
+SEMENTES = range(60)
+VAZIOS = ('-', '', None)
+TOLERANCIA = 0.005
+
+
+def _taxas(r):
+    taxas = {'TAXA_EMISSAO_CCB': 1500.0, 'TAXA_EMISSAO_CONTRATO_ALIENACAO_FIDUCIARIA': 1000.0,
+             'TAXA_REGISTRO_IMOVEL': 1500.0, 'TAXA_ESCRITURA_IMOVEL': 1000.0,
+             'TAXA_SEGURO_PRESTAMISTA_PCT': 0.0083, 'TAXA_INCC': r.choice([0.0, 0.002, 0.005]),
+             'TAXA_IPCA': r.choice([0.0, 0.004, 0.005]), 'taxa_pre': r.choice([0.0, 0.005, 0.006]),
+             'taxa_pos': r.choice([0.0, 0.003, 0.005])}
+    if r.random() < 0.5:
+        taxas['ADM_INCC_PCT'] = 0.001
+    if r.random() < 0.5:
+        taxas['ADM_PCT'] = 0.0005
+    return taxas
+
+
+def _series(r, base, tipo):
+    return [{'d0': base + timedelta(days=r.randint(1, 900)), 'v': float(r.randint(1, 20) * 1000),
+             'assoc': r.random() < 0.5, 'tipo': tipo} for _ in range(r.randint(0, 2))]
+
+
+def cenario_aleatorio(semente):
+    r = random.Random(semente)
+    base = dt(2024, r.randint(1, 12), r.randint(1, 28))
+    inicio = base + timedelta(days=r.randint(0, 60))
+    valor = r.choice([150000.0, 250000.0, 400000.0])
+    banco = float(r.randint(0, 5) * 100)
+    non_rec = [{'data': base + timedelta(days=r.randint(1, 3000)), 'tipo': f'Extra {i}',
+                'valor': float(r.randint(1, 30) * 1000), 'assoc': r.random() < 0.5}
+               for i in range(r.randint(0, 6))]
+    return {
+        'cliente': f'Cliente {semente}', 'valor_imovel': valor, 'dia_pagamento': r.choice([1, 5, 15, 28, 29, 30, 31]),
+        'taxas_sel': _taxas(r), 'data_base': base, 'capacidade_pre': float(r.randint(5, 30) * 100),
+        'data_inicio_pre': inicio, 'data_entrega': inicio + timedelta(days=r.randint(0, 36 * 30)),
+        'fgts': float(r.randint(0, 3) * 10000), 'fin_banco': float(r.randint(0, 5) * 20000),
+        'capacidade_pos_antes': round(banco + valor * r.uniform(0.016, 0.04), 2), 'val_parcela_banco': banco,
+        'non_rec': non_rec, 'semi_series': _series(r, base, 'Pagamento Semestral'),
+        'annual_series': _series(r, base, 'Pagamento Anual'),
+    }
+
+
+def _campo(linha, chave):
+    valor = linha.get(chave)
+    if valor in VAZIOS:
+        return None
+    if chave == 'taxas_extra':
+        # a referência só lista os extras da fase nas linhas associadas; o
+        # motor grava todos, com zero nos da outra fase
+        return [v for v in valor if v]
+    return valor
+
+
+# --- Laço do motor x referência (índice de pagamentos, fila de séries) ---
+@pytest.mark.parametrize('semente', SEMENTES)
+def test_eventos_iguais_a_referencia(semente):
+    cenario = cenario_aleatorio(semente)
+    esperado = simulate_referencia(cenario)
+    resultado = simulate(cenario, vetorizado=False)
+    linhas = list(resultado['eventos'])
+    assert len(linhas) == len(esperado['eventos'])
+    for i, (linha, ref) in enumerate(zip(linhas, esperado['eventos'])):
+        for chave in ref:
+            if chave != 'assoc':
+                assert _campo(linha, chave) == _campo(ref, chave), (i, chave)
+    assert resultado['saldo'] == esperado['saldo']
+    assert resultado['parcelas'] == esperado['parcelas']
+
+
+# --- Parcelas pós vetorizadas x laço escalar ---
+@pytest.mark.parametrize('semente', SEMENTES)
+def test_vetorizado_igual_ao_escalar(semente):
+    cenario = cenario_aleatorio(semente)
+    escalar = simulate(cenario, vetorizado=False)
+    vetorizado = simulate(cenario, vetorizado=True)
+    a, b = escalar['eventos'], vetorizado['eventos']
+    assert len(a) == len(b)
+    for coluna in ('data', 'codigo', 'parcela'):
+        np.testing.assert_array_equal(a.coluna(coluna), b.coluna(coluna))
+    assert [a.tipo(i) for i in range(len(a))] == [b.tipo(i) for i in range(len(b))]
+    for coluna in ('valor', 'saldo'):
+        np.testing.assert_allclose(a.coluna(coluna), b.coluna(coluna), rtol=0, atol=TOLERANCIA)
+    assert vetorizado['saldo'] == pytest.approx(escalar['saldo'], abs=TOLERANCIA)
+    assert vetorizado['parcelas'] == escalar['parcelas']
+
+
+# --- Checagem de amortização com pagamentos pela frente ---
+def _inviavel(semente):
+    # capacidade pós que não cobre os juros, com uma série anual até o fim
+    cenario = cenario_aleatorio(semente)
+    cenario['taxas_sel'] = {**cenario['taxas_sel'], 'taxa_pos': 0.005, 'TAXA_IPCA': 0.004}
+    cenario['capacidade_pos_antes'] = cenario['val_parcela_banco'] + 1000.0
+    cenario['non_rec'], cenario['semi_series'] = [], []
+    cenario['fgts'] = cenario['fin_banco'] = 0.0
+    cenario['annual_series'] = [{'d0': cenario['data_entrega'], 'v': 5000.0, 'assoc': semente % 2 == 0,
+                                 'tipo': 'Pagamento Anual'}]
+    return cenario
+
+
+@pytest.mark.parametrize('semente', range(10))
+def test_checagem_para_cedo_com_serie(semente):
+    cenario = _inviavel(semente)
+    escalar = simulate(cenario, vetorizado=False)
+    assert not escalar['viavel']
+    assert 'não diminui' in escalar['motivo']
+    assert escalar['parcelas'] < HORIZONTE_PARCELAS
+    assert simulate(cenario, vetorizado=True)['parcelas'] == escalar['parcelas']
+
+
+@pytest.mark.parametrize('semente', SEMENTES)
+def test_checagem_nao_barra_cenario_que_quita(semente, monkeypatch):
+    # capacidades perto do limite: se a checagem barra, sem ela também não quita
+    cenario = cenario_aleatorio(semente)
+    cenario['capacidade_pos_antes'] = cenario['val_parcela_banco'] + cenario['valor_imovel'] * 0.004
+    resultado = simulate(cenario, vetorizado=False)
+    assert simulate(cenario, vetorizado=True)['parcelas'] == resultado['parcelas']
+    if resultado['viavel'] or 'não diminui' not in resultado['motivo']:
+        return
+    monkeypatch.setattr('motor.nao_amortiza', lambda *args: False)
+    assert not simulate(cenario, vetorizado=False)['viavel']
+
+
+def test_saldo_nao_finito_e_inviavel():
+    cenario = cenario_aleatorio(0)
+    cenario['valor_imovel'] = float('nan')
+    resultado = simulate(cenario)
+    assert not resultado['viavel']
+    assert 'intervalo numérico' in resultado['motivo']
+
+
+# --- Retomada incremental x simulação completa ---
+def _edita(cenario, edicao, r):
+    cenario = copy.deepcopy(cenario)
+    if edicao == 'capacidade':
+        cenario['capacidade_pos_antes'] *= r.uniform(0.8, 1.2)
+    elif edicao == 'inviavel':
+        cenario['capacidade_pos_antes'] = cenario['val_parcela_banco'] + 100.0
+    elif edicao == 'fgts':
+        cenario['fgts'] += 5000.0
+    elif edicao == 'taxa':
+        cenario['taxas_sel'] = {**cenario['taxas_sel'], 'taxa_pos': r.choice([0.0, 0.003, 0.006])}
+    elif edicao == 'entrega':
+        cenario['data_entrega'] += timedelta(days=r.randint(-200, 200))
+    elif edicao == 'pagamento':
+        cenario['non_rec'].append({'data': cenario['data_entrega'] + timedelta(days=r.randint(0, 6000)),
+                                   'tipo': 'Extra', 'valor': 3000.0, 'assoc': r.random() < 0.5})
+    elif edicao == 'pagamento_removido' and cenario['non_rec']:
+        cenario['non_rec'].pop(r.randrange(len(cenario['non_rec'])))
+    elif edicao == 'serie' and cenario['annual_series']:
+        cenario['annual_series'][-1]['v'] += 1000.0
+    elif edicao == 'serie':
+        cenario['annual_series'].append({'d0': cenario['data_entrega'] + timedelta(days=r.randint(0, 4000)),
+                                         'v': 5000.0, 'assoc': r.random() < 0.5, 'tipo': 'Pagamento Anual'})
+    elif edicao == 'serie_removida':
+        cenario['semi_series'] = []
+    return cenario
+
+
+EDICOES = ['capacidade', 'inviavel', 'fgts', 'taxa', 'entrega', 'pagamento', 'pagamento_removido',
+           'serie', 'serie_removida']
+
+
+@pytest.mark.parametrize('vetorizado', [False, True])
+@pytest.mark.parametrize('semente', range(12))
+def test_retomada_igual_a_simulacao_completa(semente, vetorizado):
+    # uma sequência de edições de um campo; cada simulação continua do ponto
+    # de controle da anterior e tem de bater com a simulação do zero
+    r = random.Random(semente)
+    cenario = cenario_aleatorio(semente)
+    sessao = SimulacaoIncremental()
+    sessao.simula(cenario, vetorizado=vetorizado)
+    retomadas = 0
+    for edicao in r.sample(EDICOES, len(EDICOES)) * 2:
+        cenario = _edita(cenario, edicao, r)
+        resultado = sessao.simula(cenario, vetorizado=vetorizado)
+        retomadas += sessao.retomada is not None
+        completo = simulate(cenario, vetorizado=vetorizado)
+        a, b = resultado['eventos'], completo['eventos']
+        assert len(a) == len(b), edicao
+        for coluna in ('data', 'codigo', 'parcela'):
+            np.testing.assert_array_equal(a.coluna(coluna), b.coluna(coluna), err_msg=edicao)
+        assert [a.tipo(i) for i in range(len(a))] == [b.tipo(i) for i in range(len(b))]
+        tolerancia = TOLERANCIA if vetorizado else 0
+        for coluna in ('valor', 'juros', 'dias', 'taxa_efetiva', 'incc', 'ipca', 'mudanca', 'saldo', 'extras'):
+            np.testing.assert_allclose(a.coluna(coluna), b.coluna(coluna), rtol=0, atol=tolerancia,
+                                       err_msg=f'{edicao}: {coluna}')
+        np.testing.assert_allclose(resultado['saldos'], completo['saldos'], rtol=0, atol=tolerancia)
+        assert resultado['saldo'] == pytest.approx(completo['saldo'], rel=0, abs=tolerancia)
+        assert (resultado['parcelas'], resultado['viavel'], resultado['motivo']) == \
+            (completo['parcelas'], completo['viavel'], completo['motivo'])
+    assert retomadas
+
+
+def test_checagem_com_saldo_coberto_pelos_pagamentos():
+    # sem juros e sem capacidade pós, só os pagamentos extras quitam
+    cenario = cenario_aleatorio(0)
+    cenario['capacidade_pos_antes'] = cenario['val_parcela_banco']
+    for vetorizado in (False, True):
+        assert simulate(cenario, vetorizado=vetorizado)['viavel']
@@ -0,0 +1,25 @@
+import io
+
+import pytest
+from openpyxl import load_workbook
+
+from motor import simulate
+from planilha import planilha_bytes
+from test_motor import cenario_aleatorio
+
+
+@pytest.mark.parametrize('semente', range(10))
+def test_aba_do_fluxo(semente):
+    cenario = cenario_aleatorio(semente)
+    eventos = simulate(cenario)['eventos']
+    ws = load_workbook(io.BytesIO(planilha_bytes(eventos, 'Ana', cenario['valor_imovel']))).active
+    linhas = [[c.value for c in linha] for linha in ws.iter_rows()]
+    assert linhas[1] == ['-', '-', cenario['valor_imovel']]
+    ordem = eventos.ordem().tolist()
+    assert [linha[1] for linha in linhas[2:2 + len(ordem)]] == [eventos.tipo(i) for i in ordem]
+    assert linhas[-1] == ['TOTAIS', None, pytest.approx(eventos.soma_valores())]
+    # larguras tiradas das colunas do Eventos: cabem o maior tipo e o maior valor
+    assert eventos.largura_tipo() == max(len(eventos.tipo(i)) for i in ordem)
+    assert ws.column_dimensions['B'].width == eventos.largura_tipo() + 2
+    maior = max(abs(v) for v in [cenario['valor_imovel']] + [linha[2] for linha in linhas[2:-2]] if v != '-')
+    assert ws.column_dimensions['C'].width >= len(f"R$ {maior:,.2f}") + 2
@@ -0,0 +1,51 @@
+import math
+
+import pytest
+
+from motor import HORIZONTE_PARCELAS, simulate
+from solver import capacidade_minima, prazo_quitacao, valor_maximo_imovel
+from test_motor import cenario_aleatorio
+
+SEMENTES = range(15)
+PRAZOS = [60, 240, HORIZONTE_PARCELAS]
+CENTAVO = 0.01
+
+
+def _quita(cenario, n_parcelas, **ajustes):
+    return simulate({**cenario, **ajustes}, max_parcelas=n_parcelas)['viavel']
+
+
+@pytest.mark.parametrize('n_parcelas', PRAZOS)
+@pytest.mark.parametrize('semente', SEMENTES)
+def test_capacidade_minima(semente, n_parcelas):
+    cenario = cenario_aleatorio(semente)
+    capacidade = capacidade_minima(cenario, n_parcelas)
+    banco = cenario['val_parcela_banco']
+    if math.isinf(capacidade):
+        assert not _quita(cenario, n_parcelas, capacidade_pos_antes=banco + 1e6)
+        return
+    assert _quita(cenario, n_parcelas, capacidade_pos_antes=capacidade)
+    # na capacidade igual à parcela do banco nada sobra para o pós-entrega
+    if capacidade > banco:
+        assert not _quita(cenario, n_parcelas, capacidade_pos_antes=round(capacidade - CENTAVO, 2))
+
+
+@pytest.mark.parametrize('n_parcelas', PRAZOS)
+@pytest.mark.parametrize('semente', SEMENTES)
+def test_valor_maximo_imovel(semente, n_parcelas):
+    cenario = cenario_aleatorio(semente)
+    valor = valor_maximo_imovel(cenario, n_parcelas)
+    if valor > 0:
+        assert _quita(cenario, n_parcelas, valor_imovel=valor)
+    assert not _quita(cenario, n_parcelas, valor_imovel=round(valor + CENTAVO, 2))
+
+
+@pytest.mark.parametrize('semente', SEMENTES)
+def test_prazo_quitacao(semente):
+    cenario = cenario_aleatorio(semente)
+    resultado = simulate(cenario)
+    assert resultado['viavel']
+    assert prazo_quitacao(cenario) == resultado['parcelas'] - 1
+    # uma parcela a menos no horizonte e não quita
+    if resultado['parcelas'] > 2:
+        assert prazo_quitacao(cenario, horizonte=resultado['parcelas'] - 2) is None